@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Blog_project.settings")
 
 application = get_asgi_application()
+
+if settings.BLOG_WARMUP:
+    from blog.warmup import warm_up
+
+    # Sync views run in a thread pool, so don't keep this thread's connections
+    warm_up(keep_connections=False)
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "blog.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -48,16 +49,28 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "blog.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "Blog_project.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates that also times renders for /metrics (blog.metrics)
+        "BACKEND": "blog.metrics.TimedDjangoTemplates",
         "DIRS": [],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Compiled templates are kept for the life of the worker (and
+            # preloaded by blog.warmup); DEBUG still reloads edited files
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                ),
+            ],
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
@@ -85,10 +98,27 @@ DATABASES = {
             "init_command": "SET sql_mode='STRICT_TRANS_TABLES'",
             "charset": "utf8mb4",
         },
+        # Keep connections open between requests, and check them before
+        # reuse so a connection dropped by MySQL is replaced transparently
+        "CONN_MAX_AGE": 60,
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/ref/settings/#caches
+# Use a backend shared by all workers in production, e.g.
+# "BACKEND": "django.core.cache.backends.redis.RedisCache",
+# "LOCATION": "redis://127.0.0.1:6379",
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "blog",
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -133,6 +163,13 @@ STATICFILES_DIRS = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Uploads are stored once per distinct content under digest names (see
+# blog/storage.py); `python manage.py dedupe_media` moves older files over
+STORAGES = {
+    "default": {"BACKEND": "blog.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -143,6 +180,123 @@ LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "blog:home"
 LOGOUT_REDIRECT_URL = "blog:home"
 
+# Blog
+# Seconds after which a worker rebuilds its in-memory post index
+# (blog.post_index) at the latest; changes made in other processes are seen
+# sooner, through the cache namespace versions
+BLOG_POST_INDEX_TTL = 300
+# Same for the tag name prefix index behind the tag autocomplete (blog.tag_index)
+BLOG_TAG_INDEX_TTL = 300
+# Sidebar facets on the post list: values shown per facet, and cache lifetime
+BLOG_FACET_LIMIT = 10
+BLOG_FACET_CACHE_TTL = 60
+# Categories, tags and authors counted per facet build: the largest ones
+# overall, plus any selected in the filter
+BLOG_FACET_SCAN_LIMIT = 500
+# Trending leaderboard (manage.py update_trending): score half-life, event
+# weights, and the score below which idle posts leave the leaderboard
+BLOG_TRENDING_HALF_LIFE_HOURS = 24
+BLOG_TRENDING_VIEW_WEIGHT = 1.0
+BLOG_TRENDING_COMMENT_WEIGHT = 5.0
+BLOG_TRENDING_MIN_SCORE = 0.01
+# Background tasks (blog.taskqueue) are run by `manage.py run_tasks`; set to
+# True to run them inline instead, e.g. when no worker is running
+BLOG_TASKS_EAGER = False
+# Done and failed tasks are deleted this many days after they finish by
+# `python manage.py purge_tasks`
+BLOG_TASKS_RETENTION_DAYS = 7
+# New-comment digests: seconds to collect comments before mailing authors,
+# and digests rendered and sent per batch over the shared connection
+BLOG_COMMENT_DIGEST_INTERVAL = 900
+BLOG_COMMENT_DIGEST_BATCH = 100
+# Absolute base URL for links in emails sent outside a request
+BLOG_SITE_URL = "http://127.0.0.1:8000"
+# Admin changelists count at most this many rows, or up to the page shown;
+# past it, unfiltered lists use the database's table-size estimate and
+# filtered ones show "more than" the count with a link to the next page
+BLOG_ADMIN_COUNT_CAP = 10000
+# Post revision history (blog.revisions): a full-text snapshot every N
+# revisions, deltas in between; only the newest BLOG_REVISION_KEEP are kept
+BLOG_REVISION_SNAPSHOT_EVERY = 10
+BLOG_REVISION_KEEP = 50
+# Python-Markdown extensions used to render post content (blog.markup);
+# run `manage.py rerender_posts` after changing them
+BLOG_MARKDOWN_EXTENSIONS = ["extra", "sane_lists", "nl2br"]
+# POST rate limits per client IP and per signed-in user (blog.ratelimit).
+# Counters live in the default cache, which must be shared between workers
+# (Redis or Memcached) for the limits to be global.
+BLOG_RATELIMIT_ENABLED = True
+BLOG_RATE_LIMITS = {
+    "comment": "10/m",
+    "register": "5/h",
+    "login": "10/5m",
+    "password_reset": "5/h",
+    "tag_create": "20/m",
+}
+# Request header holding the client address when behind a reverse proxy,
+# e.g. "HTTP_X_FORWARDED_FOR"; None uses REMOTE_ADDR
+BLOG_RATELIMIT_IP_HEADER = None
+# Two-tier cache (blog.cache): default lifetime of cached values, lifetime
+# and size of the per-process copies in front of the shared cache, how long
+# stale values may be served while one worker recomputes, the recompute lock
+# timeout, and the early-expiry aggressiveness (0 disables early refresh)
+BLOG_CACHE_TIMEOUT = 300
+BLOG_CACHE_LOCAL_TTL = 5
+BLOG_CACHE_LOCAL_SIZE = 1000
+BLOG_CACHE_STALE_GRACE = 60
+BLOG_CACHE_LOCK_TIMEOUT = 10
+BLOG_CACHE_EARLY_EXPIRY_BETA = 1.0
+# Request profiling (blog.profiling): fraction of requests profiled at
+# random (staff can add ?_profile=1, anyone can send a token from
+# `manage.py profile_token` in X-Blog-Profile), where the .prof files go,
+# how many are kept, and the validity of header tokens in seconds
+BLOG_PROFILE_SAMPLE_RATE = 0
+BLOG_PROFILE_DIR = BASE_DIR / "profiles"
+BLOG_PROFILE_KEEP = 200
+BLOG_PROFILE_TOKEN_MAX_AGE = 86400
+# /metrics (blog.metrics): where worker processes share their counters, how
+# often each process writes them, and who may scrape. With a token set,
+# scrapers must send "Authorization: Bearer <token>". Without one, only the
+# listed addresses are allowed, checked against BLOG_RATELIMIT_IP_HEADER
+# behind a proxy (forwarded requests are refused when it is not set); with
+# neither, /metrics is closed.
+BLOG_METRICS_DIR = BASE_DIR / "metrics"
+BLOG_METRICS_FLUSH_INTERVAL = 5
+BLOG_METRICS_TOKEN = None
+BLOG_METRICS_ALLOWED_IPS = []
+# Queries slower than this many milliseconds are logged with their EXPLAIN
+# plan (blog.slowlog) for `manage.py index_advisor`; None turns it off
+BLOG_SLOW_QUERY_MS = 200
+BLOG_SLOW_QUERY_LOG = BASE_DIR / "logs" / "slow_queries.jsonl"
+# Preload URLs, templates, model metadata, the database connection and the
+# in-memory indexes when a worker starts (blog.warmup, run from wsgi/asgi);
+# measure the effect with `manage.py measure_warmup`
+BLOG_WARMUP = True
+# Uploaded media is served by blog.media.serve_media. Set BLOG_MEDIA_ACCEL
+# to "nginx" (X-Accel-Redirect to an internal location at
+# BLOG_MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or "sendfile" (X-Sendfile,
+# Apache/lighttpd) to let the front proxy send the bytes after the view's
+# access check. BLOG_MEDIA_MAX_AGE is the browser cache lifetime of public files.
+BLOG_MEDIA_ACCEL = None
+BLOG_MEDIA_ACCEL_PREFIX = "/protected-media/"
+BLOG_MEDIA_MAX_AGE = 3600
+# Post views and comments are buffered per process (blog/analytics.py) and
+# flushed by a background thread every BLOG_ANALYTICS_FLUSH_INTERVAL seconds,
+# or sooner after BLOG_ANALYTICS_BATCH_SIZE events: view counters are updated
+# then, and the events bulk-inserted as PostEvent rows unless
+# BLOG_ANALYTICS_ENABLED is off. `python manage.py rollup_analytics
+# --interval 300` rolls them into per-day stats for the My Posts charts and
+# deletes raw events older than BLOG_ANALYTICS_RETENTION_DAYS.
+BLOG_ANALYTICS_ENABLED = True
+BLOG_ANALYTICS_BATCH_SIZE = 200
+BLOG_ANALYTICS_FLUSH_INTERVAL = 10
+BLOG_ANALYTICS_RETENTION_DAYS = 30
+# Comments are threaded (blog/threads.py): this many top-level threads per
+# page of a post, and replies nest at most BLOG_COMMENT_MAX_DEPTH levels deep
+# (deeper replies join the last level)
+BLOG_COMMENT_THREADS_PER_PAGE = 10
+BLOG_COMMENT_MAX_DEPTH = 5
+
 # Email Configuration (for password reset)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development
 # For production, configure SMTP settings:
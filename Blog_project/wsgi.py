@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Blog_project.settings")
 
 application = get_wsgi_application()
+
+if settings.BLOG_WARMUP:
+    from blog.warmup import warm_up
+
+    # Under `gunicorn --preload` this runs in the master: a connection kept
+    # open here would be shared by every forked worker
+    warm_up(keep_connections=False)
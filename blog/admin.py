@@ -1,5 +1,20 @@
+from django import forms
 from django.contrib import admin
-from .models import Post, Category, Tag, Comment, UserProfile
+from django.contrib.admin.views.main import PAGE_VAR
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.db import transaction
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+from .cache import bump
+from .post_index import bump_applied, month_of, update_index
+from .paginators import EstimatedCountPaginator
+from .profiling import profile_dir
+from .models import (
+    Post, Category, Tag, Comment, UserProfile, AuthorStats, MonthlyPostCount, Task, RequestProfile, MediaBlob,
+)
 
 
 @admin.register(Category)
@@ -16,23 +31,149 @@ class TagAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 
+class AutocompleteFilter(admin.SimpleListFilter):
+    """Sidebar filter rendered as an autocomplete box
+
+    Unlike the stock related-field filters it never loads the related table;
+    options come from the admin autocomplete endpoint as the user types.
+    """
+    template = 'admin/blog/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = f'{self.field_name}__id__exact'
+        super().__init__(request, params, model, model_admin)
+        field = model._meta.get_field(self.field_name)
+        self.widget_id = f'autocomplete_filter_{self.field_name}'
+        widget = AutocompleteSelect(field, model_admin.admin_site, attrs={'id': self.widget_id})
+        # Only the selected object, if any, is read to label the box
+        form_field = forms.ModelChoiceField(
+            queryset=field.related_model.objects.all(), widget=widget, required=False
+        )
+        self.rendered_widget = form_field.widget.render(
+            self.parameter_name, self.value(), attrs={'id': self.widget_id, 'style': 'width: 100%'}
+        )
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        return []
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+
+class CategoryFilter(AutocompleteFilter):
+    title = 'category'
+    field_name = 'category'
+
+
+class TagFilter(AutocompleteFilter):
+    title = 'tag'
+    field_name = 'tags'
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables with millions of rows"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        # Count far enough to tell whether the requested page has a next one
+        try:
+            page = int(request.GET.get(PAGE_VAR, 1))
+        except ValueError:
+            page = 1
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, page=page)
+
+
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = ['title', 'author', 'category', 'status', 'created_at', 'views']
-    list_filter = ['status', 'created_at', 'category', 'tags']
+    list_filter = ['status', 'created_at', CategoryFilter, TagFilter]
+    list_select_related = ['author', 'category']
     search_fields = ['title', 'content']
     prepopulated_fields = {'slug': ('title',)}
     raw_id_fields = ['author']
-    date_hierarchy = 'created_at'
-    filter_horizontal = ['tags']
+    autocomplete_fields = ['category', 'tags']
+    actions = ['publish_posts', 'unpublish_posts']
+
+    @property
+    def media(self):
+        # Scripts for the autocomplete sidebar filters
+        widget = AutocompleteSelect(Post._meta.get_field('category'), self.admin_site)
+        return super().media + widget.media
+
+    def _update_index_on_commit(self, rows, status):
+        """Apply the status change to the post index, then bump ``post``"""
+        def apply():
+            for pk, category_id, author_id, created_at in rows:
+                update_index('post_saved', pk, status, category_id, author_id, month_of(created_at))
+            bump_applied('post')
+        transaction.on_commit(apply)
+
+    @admin.action(description='Publish selected posts')
+    def publish_posts(self, request, queryset):
+        drafts = queryset.filter(status='draft')
+        rows = list(drafts.values_list('pk', 'category_id', 'author_id', 'created_at'))
+        author_ids = {author_id for _pk, _category_id, author_id, _created_at in rows}
+        months = set(drafts.dates('created_at', 'month'))
+        count = drafts.update(status='published', published_at=Coalesce('published_at', Now()))
+        # A queryset UPDATE skips the model signals that keep AuthorStats, the
+        # archive counts and the post index current
+        AuthorStats.recompute_many(author_ids)
+        MonthlyPostCount.rebuild(months)
+        self._update_index_on_commit(rows, 'published')
+        self.message_user(request, f'{count} post(s) published.')
+
+    @admin.action(description='Unpublish selected posts')
+    def unpublish_posts(self, request, queryset):
+        published = queryset.filter(status='published')
+        rows = list(published.values_list('pk', 'category_id', 'author_id', 'created_at'))
+        author_ids = {author_id for _pk, _category_id, author_id, _created_at in rows}
+        months = set(published.dates('created_at', 'month'))
+        count = published.update(status='draft')
+        AuthorStats.recompute_many(author_ids)
+        MonthlyPostCount.rebuild(months)
+        self._update_index_on_commit(rows, 'draft')
+        self.message_user(request, f'{count} post(s) moved to drafts.')
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = ['post', 'author', 'created_at', 'active']
     list_filter = ['active', 'created_at']
+    list_select_related = ['post', 'author']
     search_fields = ['content', 'author__username', 'post__title']
     raw_id_fields = ['post', 'author']
+    # Moving a comment would leave its replies' paths behind
+    readonly_fields = ['parent']
+    actions = ['approve_comments', 'hide_comments']
+
+    def _moderate(self, request, queryset, active):
+        changed = queryset.exclude(active=active)
+        author_ids = set(changed.values_list('post__author_id', flat=True).distinct())
+        count = changed.update(active=active)
+        AuthorStats.recompute_many(author_ids)
+        bump('comment')
+        return count
+
+    @admin.action(description='Approve selected comments')
+    def approve_comments(self, request, queryset):
+        count = self._moderate(request, queryset, True)
+        self.message_user(request, f'{count} comment(s) approved.')
+
+    @admin.action(description='Hide selected comments')
+    def hide_comments(self, request, queryset):
+        count = self._moderate(request, queryset, False)
+        self.message_user(request, f'{count} comment(s) hidden.')
 
 
 @admin.register(UserProfile)
@@ -42,3 +183,81 @@ class UserProfileAdmin(admin.ModelAdmin):
     raw_id_fields = ['user']
 
 
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'published_posts', 'total_views', 'total_comments', 'updated_at']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
+    readonly_fields = ['published_posts', 'total_views', 'total_comments', 'updated_at']
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'size', 'refcount', 'created_at', 'updated_at']
+    search_fields = ['name']
+    readonly_fields = ['name', 'size', 'refcount', 'created_at', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['attempts', 'locked_until', 'last_error', 'created_at', 'finished_at']
+    actions = ['retry_tasks']
+
+    @admin.action(description='Retry selected tasks now')
+    def retry_tasks(self, request, queryset):
+        count = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), locked_until=None
+        )
+        self.message_user(request, f'{count} task(s) queued again.')
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = [
+        'created_at', 'method', 'path', 'status_code', 'total_ms', 'view_ms',
+        'sql_ms', 'sql_count', 'template_ms', 'trigger', 'download_link',
+    ]
+    list_filter = ['trigger', 'method', 'view_name']
+    search_fields = ['path', 'view_name']
+    readonly_fields = [
+        'method', 'path', 'view_name', 'status_code', 'user', 'trigger', 'total_ms', 'view_ms',
+        'sql_ms', 'sql_count', 'template_ms', 'created_at', 'download_link', 'summary_text',
+    ]
+    exclude = ['summary', 'filename']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view),
+                 name='blog_requestprofile_download'),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, pk):
+        profile = self.get_object(request, pk)
+        if profile is None or not self.has_view_permission(request, profile):
+            raise Http404('Profile not found.')
+        try:
+            handle = open(profile_dir() / profile.filename, 'rb')
+        except FileNotFoundError:
+            raise Http404('Profile file is missing.')
+        return FileResponse(handle, as_attachment=True, filename=profile.filename)
+
+    @admin.display(description='Profile')
+    def download_link(self, obj):
+        url = reverse('admin:blog_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">Download .prof</a>', url)
+
+    @admin.display(description='Top functions')
+    def summary_text(self, obj):
+        return format_html('<pre style="font-size: 12px; white-space: pre;">{}</pre>', obj.summary)
@@ -0,0 +1,119 @@
+"""
+Per-day post analytics and buffered view counting.
+
+record_event() appends a view or comment to a per-process buffer without
+touching the database. A background thread flushes the buffer every
+BLOG_ANALYTICS_FLUSH_INTERVAL seconds, sooner once it holds
+BLOG_ANALYTICS_BATCH_SIZE events, and once more when the process exits. A
+flush writes the events to PostEvent with one bulk INSERT (unless
+BLOG_ANALYTICS_ENABLED is off) and adds the buffered views to Post.views,
+AuthorStats and TrendingScore in a handful of grouped UPDATEs, instead of
+three writes on every page view. ``manage.py rollup_analytics``
+periodically recounts the recent days into PostDailyStats, which the chart
+endpoints read, and deletes raw events past their retention.
+
+View counters therefore trail by up to the flush interval. A flush that
+fails puts its events back in the buffer for the next one; events still
+buffered when a process is killed outright are lost.
+"""
+
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AuthorStats, Post, PostEvent, TrendingScore
+
+logger = logging.getLogger(__name__)
+
+# Events kept for retries while the database is unavailable, in batches
+MAX_BUFFERED_BATCHES = 50
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_buffer = []
+_worker = None
+
+
+def _flush_loop():
+    while True:
+        _wake.wait(getattr(settings, 'BLOG_ANALYTICS_FLUSH_INTERVAL', 10))
+        _wake.clear()
+        try:
+            flush()
+        finally:
+            close_old_connections()
+
+
+def record_event(post_id, kind):
+    """Buffer a view or comment of ``post_id``; never queries the database"""
+    global _worker
+    batch_size = getattr(settings, 'BLOG_ANALYTICS_BATCH_SIZE', 200)
+    with _lock:
+        _buffer.append(PostEvent(post_id=post_id, kind=kind, created_at=timezone.now()))
+        full = len(_buffer) >= batch_size
+        # Threads do not survive a fork, so each worker starts its own
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_flush_loop, name='blog-analytics-flush', daemon=True)
+            _worker.start()
+    if full:
+        _wake.set()
+
+
+def _requeue(events):
+    """Put the events of a failed flush back, oldest first, within the cap"""
+    limit = getattr(settings, 'BLOG_ANALYTICS_BATCH_SIZE', 200) * MAX_BUFFERED_BATCHES
+    with _lock:
+        _buffer[:0] = events
+        dropped = len(_buffer) - limit
+        if dropped > 0:
+            del _buffer[:dropped]
+    if dropped > 0:
+        logger.error('Dropped %d analytics events over the buffer limit', dropped)
+
+
+def _count_views(views, authors):
+    """Add ``views`` ({post id: count}) to the posts, their authors and trending"""
+    by_count = defaultdict(list)
+    for post_id, count in views.items():
+        by_count[count].append(post_id)
+    for count, post_ids in by_count.items():
+        Post.objects.filter(pk__in=post_ids).update(views=F('views') + count)
+    author_views = Counter()
+    for post_id, count in views.items():
+        author_views[authors[post_id]] += count
+        TrendingScore.record(post_id, views=count)
+    for author_id, count in author_views.items():
+        AuthorStats.apply_delta(author_id, total_views=count)
+
+
+def flush():
+    """Write the buffered events and view counts; returns how many events"""
+    with _lock:
+        events = _buffer[:]
+        _buffer.clear()
+    if not events:
+        return 0
+    try:
+        # Posts deleted since their events were buffered would fail the whole batch
+        authors = dict(
+            Post.objects.filter(pk__in={event.post_id for event in events}).values_list('pk', 'author_id')
+        )
+        events = [event for event in events if event.post_id in authors]
+        with transaction.atomic():
+            if getattr(settings, 'BLOG_ANALYTICS_ENABLED', True):
+                PostEvent.objects.bulk_create(events, batch_size=1000)
+            _count_views(Counter(event.post_id for event in events if event.kind == PostEvent.VIEW), authors)
+    except DatabaseError:
+        logger.exception('Analytics flush failed, keeping %d events for the next one', len(events))
+        _requeue(events)
+        return 0
+    return len(events)
+
+
+atexit.register(flush)
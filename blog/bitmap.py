@@ -0,0 +1,245 @@
+"""
+Compressed bitmap of non-negative integer ids.
+
+Ids are split into 65536-wide containers keyed by their high bits, in the
+style of Roaring bitmaps. A sparse container is a sorted ``array('H')`` of
+low bits (2 bytes per id); once it holds more than ARRAY_MAX ids it becomes a
+Python int used as a 65536-bit bitset (8 KB flat). Set operations work
+container by container, so memory and time follow the number of ids rather
+than the largest id.
+"""
+
+from array import array
+from bisect import bisect_left
+
+CONTAINER_BITS = 16
+CONTAINER_SIZE = 1 << CONTAINER_BITS
+LOW_MASK = CONTAINER_SIZE - 1
+ARRAY_MAX = 4096
+
+
+def _array_to_bits(values):
+    buffer = bytearray(CONTAINER_SIZE // 8)
+    for value in values:
+        buffer[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _bits_to_array(bits):
+    return array('H', _iter_bits(bits))
+
+
+def _iter_bits(bits):
+    """Set bit positions of ``bits`` in ascending order"""
+    raw = bits.to_bytes(CONTAINER_SIZE // 8, 'little')
+    for index, byte in enumerate(raw):
+        while byte:
+            lowest = byte & -byte
+            yield (index << 3) + lowest.bit_length() - 1
+            byte ^= lowest
+
+
+def _iter_bits_desc(bits):
+    """Set bit positions of ``bits`` in descending order"""
+    raw = bits.to_bytes(CONTAINER_SIZE // 8, 'little')
+    for index in range(len(raw) - 1, -1, -1):
+        byte = raw[index]
+        while byte:
+            top = byte.bit_length() - 1
+            yield (index << 3) + top
+            byte ^= 1 << top
+
+
+def _cardinality(container):
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def _normalize(container):
+    """Pick the cheaper representation, or None when the container is empty"""
+    if isinstance(container, int):
+        count = container.bit_count()
+        if not count:
+            return None
+        return _bits_to_array(container) if count <= ARRAY_MAX else container
+    if not container:
+        return None
+    return container if len(container) <= ARRAY_MAX else _array_to_bits(container)
+
+
+def _and(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        return _normalize(left & right)
+    if isinstance(left, int):
+        left, right = right, left
+    if isinstance(right, int):
+        return _normalize(array('H', (value for value in left if right >> value & 1)))
+    return _normalize(array('H', sorted(set(left).intersection(right))))
+
+
+def _or(left, right):
+    if isinstance(left, int) or isinstance(right, int):
+        if not isinstance(left, int):
+            left = _array_to_bits(left)
+        if not isinstance(right, int):
+            right = _array_to_bits(right)
+        return _normalize(left | right)
+    return _normalize(array('H', sorted(set(left).union(right))))
+
+
+def _andnot(left, right):
+    if isinstance(left, int):
+        if not isinstance(right, int):
+            right = _array_to_bits(right)
+        return _normalize(left & ~right)
+    if isinstance(right, int):
+        return _normalize(array('H', (value for value in left if not right >> value & 1)))
+    removed = set(right)
+    return _normalize(array('H', (value for value in left if value not in removed)))
+
+
+class Bitmap:
+    """A set of ids backed by array and bitset containers"""
+
+    __slots__ = ['_containers']
+
+    def __init__(self, ids=()):
+        self._containers = {}
+        groups = {}
+        for value in ids:
+            groups.setdefault(value >> CONTAINER_BITS, []).append(value & LOW_MASK)
+        for high, lows in groups.items():
+            container = array('H', sorted(set(lows)))
+            self._containers[high] = _normalize(container)
+
+    @classmethod
+    def _from_containers(cls, containers):
+        bitmap = cls()
+        bitmap._containers = {high: c for high, c in containers.items() if c is not None}
+        return bitmap
+
+    def copy(self):
+        return self._from_containers({
+            high: c if isinstance(c, int) else array('H', c)
+            for high, c in self._containers.items()
+        })
+
+    # Single-id updates
+    def add(self, value):
+        high, low = value >> CONTAINER_BITS, value & LOW_MASK
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = array('H', [low])
+        elif isinstance(container, int):
+            self._containers[high] = container | (1 << low)
+        else:
+            position = bisect_left(container, low)
+            if position == len(container) or container[position] != low:
+                # Copy on write: results of earlier set operations may share
+                # this container.
+                container = array('H', container)
+                container.insert(position, low)
+                self._containers[high] = _normalize(container)
+
+    def discard(self, value):
+        high, low = value >> CONTAINER_BITS, value & LOW_MASK
+        container = self._containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = _normalize(container & ~(1 << low))
+        else:
+            position = bisect_left(container, low)
+            if position < len(container) and container[position] == low:
+                container = array('H', container)
+                del container[position]
+            container = _normalize(container)
+        if container is None:
+            del self._containers[high]
+        else:
+            self._containers[high] = container
+
+    def __contains__(self, value):
+        container = self._containers.get(value >> CONTAINER_BITS)
+        if container is None:
+            return False
+        low = value & LOW_MASK
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        position = bisect_left(container, low)
+        return position < len(container) and container[position] == low
+
+    # Set algebra
+    def __and__(self, other):
+        return self._from_containers({
+            high: _and(container, other._containers[high])
+            for high, container in self._containers.items()
+            if high in other._containers
+        })
+
+    def __or__(self, other):
+        containers = dict(self._containers)
+        for high, container in other._containers.items():
+            containers[high] = _or(containers[high], container) if high in containers else container
+        return self._from_containers(containers)
+
+    def __sub__(self, other):
+        return self._from_containers({
+            high: _andnot(container, other._containers[high]) if high in other._containers else container
+            for high, container in self._containers.items()
+        })
+
+    @classmethod
+    def intersection(cls, bitmaps):
+        bitmaps = sorted(bitmaps, key=len)
+        if not bitmaps:
+            return cls()
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            if not result:
+                break
+            result = result & bitmap
+        return result
+
+    @classmethod
+    def union(cls, bitmaps):
+        result = cls()
+        for bitmap in bitmaps:
+            result = result | bitmap
+        return result
+
+    # Reading
+    def __len__(self):
+        return sum(_cardinality(c) for c in self._containers.values())
+
+    def __bool__(self):
+        return bool(self._containers)
+
+    def __iter__(self):
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            base = high << CONTAINER_BITS
+            lows = _iter_bits(container) if isinstance(container, int) else container
+            for low in lows:
+                yield base | low
+
+    def iter_desc(self, offset=0):
+        """Ids from largest to smallest, skipping the first ``offset``"""
+        for high in sorted(self._containers, reverse=True):
+            container = self._containers[high]
+            size = _cardinality(container)
+            if offset >= size:
+                offset -= size
+                continue
+            base = high << CONTAINER_BITS
+            if isinstance(container, int):
+                lows = _iter_bits_desc(container)
+                for _ in range(offset):
+                    next(lows)
+            else:
+                lows = reversed(container[:size - offset])
+            offset = 0
+            for low in lows:
+                yield base | low
+
+    def __repr__(self):
+        return f'<Bitmap of {len(self)} ids>'
@@ -0,0 +1,244 @@
+"""
+Two-tier cache for blog data.
+
+Values are looked up in a small per-process LRU first, then in the shared
+Django cache, and only computed when both miss:
+
+- Keys are built from versioned namespaces (``post``, ``category``, ``tag``,
+  ``comment``). blog.signals bumps a namespace when one of its rows
+  changes, which orphans every key built on the old version at once.
+  Other processes notice a bump within BLOG_CACHE_LOCAL_TTL seconds, the
+  lifetime of their local copies.
+- Entries carry their logical expiry and the time they took to compute.
+  Each read may recompute a little early, with a probability that grows as
+  expiry approaches and with the compute time, so hot keys are refreshed
+  before they expire instead of all at once after.
+- Recomputation is single-flight: the worker that takes a short lock in the
+  shared cache rebuilds the value while the others keep serving the stale
+  copy, which is kept past its logical expiry for that purpose, or wait
+  briefly for the new one when there is none.
+
+``metrics`` counts hits per tier, misses, recomputes and time spent.
+"""
+
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe, size-bounded in-process store with per-entry expiry"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class Metrics:
+    """Per-process counters for the two-tier cache"""
+
+    FIELDS = (
+        'lookups', 'local_hits', 'shared_hits', 'misses', 'recomputes', 'early_recomputes',
+        'stale_served', 'lock_waits', 'compute_seconds', 'lookup_seconds',
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._values = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, field, amount=1):
+        with self._lock:
+            self._values[field] += amount
+
+    def snapshot(self):
+        with self._lock:
+            values = dict(self._values)
+        lookups = values['lookups']
+        values['hit_ratio'] = (values['local_hits'] + values['shared_hits']) / lookups if lookups else 0.0
+        values['mean_lookup_seconds'] = values['lookup_seconds'] / lookups if lookups else 0.0
+        return values
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+local = LocalLRU(_setting('BLOG_CACHE_LOCAL_SIZE', 1000))
+metrics = Metrics()
+
+
+# Namespaces
+def _version_key(namespace):
+    return f'blog:ns:{namespace}'
+
+
+def namespace_version(namespace):
+    """Current version of ``namespace``, read through the local tier"""
+    now = time.monotonic()
+    key = _version_key(namespace)
+    version = local.get(key, now)
+    if version is _MISSING:
+        version = cache.get(key)
+        if version is None:
+            # Start from a random version so a flushed shared cache can't
+            # bring keys from before the flush back to life.
+            cache.add(key, random.randrange(1, 1 << 30), timeout=None)
+            version = cache.get(key, 1)
+        local.set(key, version, now + _setting('BLOG_CACHE_LOCAL_TTL', 5))
+    return version
+
+
+def bump(*namespaces):
+    """Invalidate every key built on ``namespaces``; returns their new versions"""
+    versions = {}
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            version = cache.incr(key)
+        except ValueError:
+            cache.add(key, random.randrange(1, 1 << 30), timeout=None)
+            version = cache.get(key, 1)
+        local.set(key, version, time.monotonic() + _setting('BLOG_CACHE_LOCAL_TTL', 5))
+        versions[namespace] = version
+    return versions
+
+
+def make_key(key, namespaces=()):
+    versions = ':'.join(f'{namespace}.{namespace_version(namespace)}' for namespace in sorted(namespaces))
+    return f'blog:c:{versions}:{key}'
+
+
+# Reads
+def _should_refresh(expires_at, delta, now):
+    """Probabilistic early expiry (XFetch): True once the entry is due"""
+    beta = _setting('BLOG_CACHE_EARLY_EXPIRY_BETA', 1.0)
+    return now - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+def _compute(full_key, compute, timeout):
+    started = time.perf_counter()
+    value = compute()
+    delta = time.perf_counter() - started
+    metrics.add('recomputes')
+    metrics.add('compute_seconds', delta)
+    expires_at = time.time() + timeout
+    # Kept past its logical expiry so other workers can serve it while one
+    # of them recomputes.
+    grace = _setting('BLOG_CACHE_STALE_GRACE', 60)
+    cache.set(full_key, (value, expires_at, delta), timeout + grace)
+    local.set(full_key, value, time.monotonic() + min(timeout, _setting('BLOG_CACHE_LOCAL_TTL', 5)))
+    return value
+
+
+def get_or_compute(key, compute, timeout=None, namespaces=()):
+    """Cached value of ``compute()`` under ``key``
+
+    ``namespaces`` lists the models the value is built from; bumping any of
+    them makes the next read recompute.
+    """
+    started = time.perf_counter()
+    try:
+        return _get_or_compute(key, compute, timeout, namespaces)
+    finally:
+        metrics.add('lookups')
+        metrics.add('lookup_seconds', time.perf_counter() - started)
+
+
+def _locked_compute(full_key, compute, timeout, lock_timeout):
+    """_compute() under the key's single-flight lock, or _MISSING if it is held
+
+    The lock holds a token of its own, so a worker that overran
+    BLOG_CACHE_LOCK_TIMEOUT does not release the lock another worker took
+    since.
+    """
+    lock_key = f'{full_key}:lock'
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token, lock_timeout):
+        return _MISSING
+    try:
+        return _compute(full_key, compute, timeout)
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def _get_or_compute(key, compute, timeout, namespaces):
+    timeout = _setting('BLOG_CACHE_TIMEOUT', 300) if timeout is None else timeout
+    local_ttl = _setting('BLOG_CACHE_LOCAL_TTL', 5)
+    full_key = make_key(key, namespaces)
+
+    value = local.get(full_key, time.monotonic())
+    if value is not _MISSING:
+        metrics.add('local_hits')
+        return value
+
+    entry = cache.get(full_key)
+    now = time.time()
+    if entry is not None:
+        value, expires_at, delta = entry
+        if not _should_refresh(expires_at, delta, now):
+            metrics.add('shared_hits')
+            local.set(full_key, value, time.monotonic() + min(expires_at - now, local_ttl))
+            return value
+        metrics.add('early_recomputes' if expires_at > now else 'misses')
+    else:
+        metrics.add('misses')
+
+    lock_timeout = _setting('BLOG_CACHE_LOCK_TIMEOUT', 10)
+    value = _locked_compute(full_key, compute, timeout, lock_timeout)
+    if value is not _MISSING:
+        return value
+
+    if entry is not None:
+        # Another worker is refreshing it
+        metrics.add('stale_served')
+        return entry[0]
+
+    # Nothing to serve yet: wait for the worker holding the lock
+    metrics.add('lock_waits')
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(full_key)
+        if entry is not None:
+            return entry[0]
+        value = _locked_compute(full_key, compute, timeout, lock_timeout)
+        if value is not _MISSING:
+            return value
+    return _compute(full_key, compute, timeout)
@@ -0,0 +1,67 @@
+"""
+Assembly of the post detail page.
+
+PostDetailView loads the post once with detail_queryset() and builds the
+page with detail_context(), for a GET as well as for a comment POST that is
+shown again with its errors. The page takes at most DETAIL_QUERY_BUDGET
+queries, not counting the session and user lookups of the request:
+
+1. the post with its author, the author's profile and category, and the
+   number of active comments and of threads as subqueries;
+2. its tags (prefetch);
+3. the page of top-level comments;
+4. the replies of those threads (blog.threads);
+5. related posts, only when they are not cached.
+
+The view itself is buffered by blog.analytics rather than written here.
+"""
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .cache import get_or_compute
+from .forms import CommentForm
+from .models import Comment, Post
+from .threads import comment_threads
+
+DETAIL_QUERY_BUDGET = 5
+
+
+def _comment_count(**filters):
+    counts = (
+        Comment.objects.filter(post=OuterRef('pk'), active=True, **filters)
+        .order_by().values('post').annotate(total=Count('id')).values('total')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def detail_queryset():
+    return (
+        Post.objects.select_related('author__profile', 'category').prefetch_related('tags')
+        .annotate(active_comment_count=_comment_count(), thread_count=_comment_count(depth=0))
+    )
+
+
+def related_posts(post):
+    """Up to three other published posts of the post's category, cached"""
+    return get_or_compute(
+        f'related_posts:{post.id}:{post.category_id}',
+        lambda: list(
+            Post.published.filter(category_id=post.category_id).exclude(id=post.id).only('id', 'title', 'slug')[:3]
+        ),
+        namespaces=('post',),
+    )
+
+
+def detail_context(post, comment_page=None, comment_form=None):
+    """Template context for ``post``, loaded from detail_queryset()"""
+    page, threads = comment_threads(post, comment_page, thread_count=post.thread_count)
+    return {
+        'post': post,
+        'object': post,
+        'comments': threads,
+        'comment_page': page,
+        'comment_count': post.active_comment_count,
+        'comment_form': comment_form or CommentForm(post=post),
+        'related_posts': related_posts(post),
+    }
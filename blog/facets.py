@@ -0,0 +1,116 @@
+"""
+Sidebar facet counts for the current PostListView result set.
+
+Counts come from the in-memory post index (blog.post_index), so all four
+facets are computed without a GROUP BY. Categories, tags and authors are
+counted for their BLOG_FACET_SCAN_LIMIT largest values only, plus the
+selected ones, so a build costs the same with ten thousand tags as with
+five hundred. Only the labels of the facet values that are shown are read
+from the database, and the finished facets are cached per filter
+combination (see blog.cache) for BLOG_FACET_CACHE_TTL seconds or until a
+post, category or tag changes.
+"""
+
+import hashlib
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from .cache import get_or_compute
+from .models import Category, Tag
+from .post_index import get_post_index
+
+
+def parse_month(value):
+    """Date of the first of the month for a ``YYYY-MM`` string, else None"""
+    try:
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+def _toggle_query(params, name, value):
+    """Query string with ``value`` added to or removed from ``name``"""
+    params = params.copy()
+    params.pop('page', None)
+    values = params.getlist(name)
+    if value in values:
+        values.remove(value)
+    else:
+        values.append(value)
+    params.setlist(name, values)
+    return params.urlencode()
+
+
+def _facet(params, name, value, label, count):
+    return {
+        'value': value,
+        'label': label,
+        'count': count,
+        'selected': value in params.getlist(name),
+        'query': _toggle_query(params, name, value),
+    }
+
+
+def _top(counts, limit):
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def build_facets(params, post_ids):
+    limit = getattr(settings, 'BLOG_FACET_LIMIT', 10)
+    index = get_post_index()
+    # Selected values are always counted, however small
+    include = {
+        'categories': [index.category_slugs.get(slug) for slug in params.getlist('category')],
+        'tags': [index.tag_slugs.get(slug) for slug in params.getlist('tag')],
+    }
+    if params.getlist('author'):
+        include['authors'] = list(
+            User.objects.filter(username__in=params.getlist('author')).values_list('id', flat=True)
+        )
+    counts = index.counts(post_ids, getattr(settings, 'BLOG_FACET_SCAN_LIMIT', 500), include)
+    facets = {}
+
+    top = dict(_top(counts['categories'], limit))
+    categories = Category.objects.filter(id__in=top).values_list('id', 'slug', 'name')
+    facets['categories'] = sorted(
+        (_facet(params, 'category', slug, name, top[pk]) for pk, slug, name in categories),
+        key=lambda facet: (-facet['count'], facet['label']),
+    )
+
+    top = dict(_top(counts['tags'], limit))
+    tags = Tag.objects.filter(id__in=top).values_list('id', 'slug', 'name')
+    facets['tags'] = sorted(
+        (_facet(params, 'tag', slug, name, top[pk]) for pk, slug, name in tags),
+        key=lambda facet: (-facet['count'], facet['label']),
+    )
+
+    top = dict(_top(counts['authors'], limit))
+    authors = User.objects.filter(id__in=top).values_list('id', 'username')
+    facets['authors'] = sorted(
+        (_facet(params, 'author', username, username, top[pk]) for pk, username in authors),
+        key=lambda facet: (-facet['count'], facet['label']),
+    )
+
+    # Newest months first
+    months = sorted(counts['months'].items(), reverse=True)[:limit]
+    facets['months'] = [
+        _facet(params, 'month', month.strftime('%Y-%m'), month, count)
+        for month, count in months
+    ]
+    return facets
+
+
+def get_facets(params, post_ids):
+    """Facets for a filter combination, served from the cache when possible"""
+    params = params.copy()
+    params.pop('page', None)
+    canonical = '&'.join(sorted(f'{key}={value}' for key, values in params.lists() for value in values))
+    return get_or_compute(
+        'facets:' + hashlib.md5(canonical.encode()).hexdigest(),
+        lambda: build_facets(params, post_ids),
+        timeout=getattr(settings, 'BLOG_FACET_CACHE_TTL', 60),
+        namespaces=('post', 'category', 'tag'),
+    )
@@ -1,7 +1,10 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, PasswordResetForm
 from django.contrib.auth.models import User
+from django.urls import reverse_lazy
 from .models import Post, Comment, Category, Tag, UserProfile
+from .tasks import RESET_SECRET_KEYS, send_password_reset
+from .threads import reply_target
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -29,16 +32,37 @@ class UserRegistrationForm(UserCreationForm):
         return user
 
 
+class TagAutocompleteWidget(forms.SelectMultiple):
+    """Hidden multi-select that renders only the selected tags
+
+    The post form's script fills it from the tag autocomplete endpoint, so
+    the page never lists the whole Tag table.
+    """
+
+    def __init__(self, attrs=None):
+        attrs = {'class': 'd-none', 'data-autocomplete-url': reverse_lazy('blog:tag_autocomplete'), **(attrs or {})}
+        super().__init__(attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [pk for pk in value if str(pk).isdigit()]
+        tags = Tag.objects.filter(pk__in=selected) if selected else []
+        return [
+            (None, [self.create_option(name, tag.pk, tag.name, True, index, attrs=attrs)], index)
+            for index, tag in enumerate(tags)
+        ]
+
+
 class PostForm(forms.ModelForm):
     category = forms.ModelChoiceField(
         queryset=Category.objects.all(),
         required=False,
         empty_label="Select a category"
     )
+    # Validation only looks up the submitted ids
     tags = forms.ModelMultipleChoiceField(
         queryset=Tag.objects.all(),
         required=False,
-        widget=forms.CheckboxSelectMultiple
+        widget=TagAutocompleteWidget
     )
 
     class Meta:
@@ -79,15 +103,25 @@ class PostForm(forms.ModelForm):
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
-        fields = ['content']
+        fields = ['content', 'parent']
         widgets = {
             'content': forms.Textarea(attrs={
                 'class': 'form-control',
                 'rows': 4,
                 'placeholder': 'Write your comment here...'
-            })
+            }),
+            'parent': forms.HiddenInput(),
         }
 
+    def __init__(self, *args, post=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Replies only to visible comments of the same post
+        parents = Comment.objects.filter(active=True)
+        self.fields['parent'].queryset = parents.filter(post=post) if post is not None else parents.none()
+
+    def clean_parent(self):
+        return reply_target(self.cleaned_data.get('parent'))
+
     def clean_content(self):
         content = self.cleaned_data.get('content')
         if len(content.strip()) < 5:
@@ -143,3 +177,20 @@ class UserProfileForm(forms.ModelForm):
         return profile
 
 
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Sends the reset email from a worker
+
+    Only the user's pk and the non-secret parts of the context are queued;
+    the worker makes the token and renders the email, so no reset link is
+    ever stored in a Task row.
+    """
+
+    def send_mail(self, subject_template_name, email_template_name, context,
+                  from_email, to_email, html_email_template_name=None):
+        public_context = {key: value for key, value in context.items() if key not in RESET_SECRET_KEYS}
+        send_password_reset.enqueue(
+            context['user'].pk, public_context, subject_template_name, email_template_name,
+            from_email, html_email_template_name=html_email_template_name,
+        )
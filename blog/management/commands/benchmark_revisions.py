@@ -0,0 +1,86 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from blog.revisions import make_delta, apply_delta, encode, decode
+
+
+WORDS = (
+    'the blog post django python query index cache page author comment tag '
+    'category server request response template model view latency storage'
+).split()
+
+
+def _paragraph(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))) + '\n'
+
+
+def _edit(text, rng):
+    """Change, add or remove a few paragraphs, like a typical post edit"""
+    lines = text.splitlines(keepends=True)
+    for _ in range(rng.randint(1, 3)):
+        action = rng.random()
+        position = rng.randrange(len(lines))
+        if action < 0.6:
+            words = lines[position].split()
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            lines[position] = ' '.join(words) + '\n'
+        elif action < 0.85 or len(lines) < 3:
+            lines.insert(position, _paragraph(rng))
+        else:
+            del lines[position]
+    return ''.join(lines)
+
+
+class Command(BaseCommand):
+    help = 'Measures revision storage per edit and restore latency on synthetic edits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--revisions', type=int, default=200)
+        parser.add_argument('--paragraphs', type=int, default=60)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        snapshot_every = getattr(settings, 'BLOG_REVISION_SNAPSHOT_EVERY', 10)
+        text = ''.join(_paragraph(rng) for _ in range(options['paragraphs']))
+
+        # Encode exactly as blog.revisions.record_revision does
+        versions, stored = [], []
+        for number in range(1, options['revisions'] + 1):
+            if number > 1:
+                text = _edit(text, rng)
+            if (number - 1) % snapshot_every == 0:
+                stored.append((True, encode(text)))
+            else:
+                stored.append((False, encode(make_delta(versions[-1], text))))
+            versions.append(text)
+
+        raw_bytes = sum(len(version.encode()) for version in versions)
+        full_bytes = sum(len(encode(version)) for version in versions)
+        stored_bytes = sum(len(data) for _, data in stored)
+
+        timings = []
+        for number in range(len(versions)):
+            start_index = number - number % snapshot_every
+            started = time.perf_counter()
+            restored = None
+            for is_snapshot, data in stored[start_index:number + 1]:
+                payload = decode(data)
+                restored = payload if is_snapshot else apply_delta(restored, payload)
+            timings.append(time.perf_counter() - started)
+            if restored != versions[number]:
+                raise AssertionError(f'Revision {number + 1} did not round-trip')
+
+        count = len(versions)
+        self.stdout.write(f'Revisions: {count}, average post size: {raw_bytes // count} bytes')
+        self.stdout.write(f'Uncompressed full copies: {raw_bytes // count} bytes/revision')
+        self.stdout.write(f'Compressed full copies:   {full_bytes // count} bytes/revision')
+        self.stdout.write(f'Delta + snapshot every {snapshot_every}: {stored_bytes // count} bytes/revision')
+        self.stdout.write(
+            f'Restore latency: mean {statistics.mean(timings) * 1000:.3f} ms, '
+            f'max {max(timings) * 1000:.3f} ms (decode + apply, excluding the DB read)'
+        )
+        self.stdout.write(self.style.SUCCESS('✅ All revisions round-tripped'))
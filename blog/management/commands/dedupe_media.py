@@ -0,0 +1,118 @@
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from blog.cache import bump
+from blog.models import MediaBlob
+from blog.storage import BLOB_PREFIX, INCOMING_DIR, ContentAddressedStorage, blob_name
+
+
+def file_digest(storage, name):
+    digest = hashlib.sha256()
+    with storage.open(name) as handle:
+        for chunk in handle.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = 'Moves uploads into the content-addressed store, storing identical files once, and recounts references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report the savings without changing anything')
+        parser.add_argument('--keep-originals', action='store_true',
+                            help='Leave the old files in place once nothing refers to them')
+        parser.add_argument('--prune', action='store_true', help='Delete blobs nothing has referred to for a while')
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='How long an unreferenced blob is kept before --prune deletes it')
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError('The default storage is not blog.storage.ContentAddressedStorage; check STORAGES.')
+        dry_run = options['dry_run']
+
+        moved, sizes, missing = {}, {}, []
+        for model, field in MediaBlob.REFERENCES:
+            names = (
+                model.objects.exclude(**{f'{field}__startswith': BLOB_PREFIX})
+                .exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .order_by().values_list(field, flat=True).distinct()
+            )
+            for name in names:
+                if name in moved:
+                    continue
+                if not storage.exists(name):
+                    missing.append(name)
+                    continue
+                sizes[name] = storage.size(name)
+                if dry_run:
+                    moved[name] = blob_name(file_digest(storage, name), os.path.splitext(name)[1].lower())
+                else:
+                    with storage.open(name) as handle:
+                        moved[name] = storage.save(name, handle)
+
+        blobs = {blob: sizes[name] for name, blob in moved.items()}
+        self.stdout.write(
+            f'{len(moved)} referenced files ({sum(sizes.values())} bytes) -> '
+            f'{len(blobs)} blobs ({sum(blobs.values())} bytes)'
+        )
+        for name in missing:
+            self.stdout.write(self.style.WARNING(f'Missing file, references left as they are: {name}'))
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS('✅ Dry run, nothing changed!'))
+            return
+
+        with transaction.atomic():
+            for model, field in MediaBlob.REFERENCES:
+                for name, blob in moved.items():
+                    model.objects.filter(**{field: name}).update(**{field: blob})
+        counted = MediaBlob.recount()
+        if moved:
+            bump('post')
+        if not options['keep_originals']:
+            for name in moved:
+                storage.delete(name)
+
+        pruned = self.prune(storage, options['grace_hours']) if options['prune'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Moved {len(moved)} files, counted references to {counted} blobs, pruned {pruned}!'
+        ))
+
+    def prune(self, storage, grace_hours):
+        """Delete unreferenced blobs and abandoned uploads older than the grace period"""
+        cutoff = timezone.now() - timedelta(hours=grace_hours)
+        cutoff_ts = time.time() - grace_hours * 3600
+
+        def old_enough(name):
+            try:
+                return os.path.getmtime(storage.path(name)) < cutoff_ts
+            except FileNotFoundError:
+                return True
+
+        pruned = 0
+        for blob in MediaBlob.objects.filter(refcount=0, updated_at__lt=cutoff).iterator():
+            if not old_enough(blob.name):
+                continue
+            # Conditional, so a reference added meanwhile keeps the blob
+            if MediaBlob.objects.filter(pk=blob.pk, refcount=0).delete()[0]:
+                storage.delete(blob.name)
+                pruned += 1
+
+        # Files stored for uploads whose model was never saved have no row
+        known = set(MediaBlob.objects.values_list('name', flat=True))
+        root = storage.path(BLOB_PREFIX)
+        for directory, _dirs, files in os.walk(root):
+            for filename in files:
+                name = os.path.relpath(os.path.join(directory, filename), storage.location).replace(os.sep, '/')
+                if name.startswith(INCOMING_DIR + '/') or name not in known:
+                    if old_enough(name):
+                        storage.delete(name)
+                        pruned += 1
+        return pruned
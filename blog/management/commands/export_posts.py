@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from blog.transfer import export_lines, export_queryset
+
+
+class Command(BaseCommand):
+    help = 'Streams published posts with their author, category and tags as JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='File to write (default: stdout)')
+        parser.add_argument('--include-drafts', action='store_true', help='Export drafts too')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Posts fetched per query')
+
+    def handle(self, *args, **options):
+        queryset = export_queryset(include_drafts=options['include_drafts'])
+        to_stdout = options['output'] == '-'
+        output = self.stdout if to_stdout else open(options['output'], 'w', encoding='utf-8')
+        count = 0
+        try:
+            for line in export_lines(queryset, chunk_size=options['chunk_size']):
+                if to_stdout:
+                    output.write(line, ending='')
+                else:
+                    output.write(line)
+                count += 1
+        finally:
+            if not to_stdout:
+                output.close()
+        # Keep stdout clean for the JSON lines
+        self.stderr.write(self.style.SUCCESS(f'✅ Exported {count} posts!'))
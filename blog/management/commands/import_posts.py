@@ -0,0 +1,48 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from blog.transfer import import_lines
+
+
+class Command(BaseCommand):
+    help = 'Imports posts from JSON lines written by export_posts, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL file to read, or - for stdin')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--update', action='store_true', help='Overwrite posts whose slug already exists')
+        parser.add_argument('--default-author', help='Username to use for posts whose author does not exist')
+
+    def handle(self, *args, **options):
+        default_author = None
+        if options['default_author']:
+            default_author = User.objects.filter(username=options['default_author']).first()
+            if default_author is None:
+                raise CommandError(f'No user named {options["default_author"]!r}.')
+
+        started = time.perf_counter()
+        source = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        try:
+            stats, errors = import_lines(
+                source, batch_size=options['batch_size'], update=options['update'], default_author=default_author,
+            )
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        elapsed = time.perf_counter() - started
+
+        for message in errors[:20]:
+            self.stdout.write(self.style.WARNING(message))
+        if len(errors) > 20:
+            self.stdout.write(self.style.WARNING(f'... and {len(errors) - 20} more errors'))
+        rows = stats['created'] + stats['updated']
+        self.stdout.write(
+            f'{rows} posts and {stats["tag_links"]} tag links in {elapsed:.1f}s '
+            f'({rows / elapsed if elapsed else 0:.0f} posts/s)'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Imported posts: {stats["created"]} created, {stats["updated"]} updated, '
+            f'{stats["skipped"]} skipped, {len(errors)} failed!'
+        ))
@@ -0,0 +1,185 @@
+import json
+import re
+from collections import defaultdict
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, migrations, models
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from blog.slowlog import log_path
+
+QUOTED = r'["`]?(\w+)["`]?'
+CONDITION_RE = re.compile(
+    QUOTED + r'\.' + QUOTED + r'\s*(=|<=|>=|<|>|\bIN\b|\bIS\b|\bLIKE\b|\bBETWEEN\b)', re.IGNORECASE
+)
+# Boolean columns are tested bare on some backends: WHERE ... AND "t"."active"
+BARE_RE = re.compile(QUOTED + r'\.' + QUOTED + r'\s*(?=\)|\bAND\b|\bOR\b|$)', re.IGNORECASE)
+ORDER_RE = re.compile(QUOTED + r'\.' + QUOTED + r'(?:\s+(ASC|DESC))?', re.IGNORECASE)
+FROM_RE = re.compile(r'\bFROM\s+' + QUOTED, re.IGNORECASE)
+EQUALITY = {'=', 'IN', 'IS'}
+MAX_COLUMNS = 4
+
+
+def _clause(sql, start, ends):
+    match = re.compile(start, re.IGNORECASE).search(sql)
+    if not match:
+        return ''
+    rest = sql[match.end():]
+    end = re.search('|'.join(ends), rest, re.IGNORECASE)
+    return rest[:end.start()] if end else rest
+
+
+def candidate_columns(sql):
+    """Index columns for the main table of a SELECT: equality, then sort, then range
+
+    Returns ``(table, [(column, descending), ...])`` or None.
+    """
+    match = FROM_RE.search(sql)
+    if not match:
+        return None
+    table = match.group(1)
+    # Skip the select list, which may hold aggregate FILTER (WHERE ...) clauses
+    body = sql[match.end():]
+    where = _clause(body, r'\bWHERE\b', [r'\bGROUP BY\b', r'\bORDER BY\b', r'\bLIMIT\b', r'\bHAVING\b'])
+    order_by = _clause(body, r'\bORDER BY\b', [r'\bLIMIT\b', r'\bOFFSET\b', r'\bFOR UPDATE\b'])
+
+    conditions = [(match.start(), *match.groups()) for match in CONDITION_RE.finditer(where)]
+    # Bare booleans go last: they split the rows least
+    conditions += [(len(where) + match.start(), *match.groups(), '=') for match in BARE_RE.finditer(where)]
+    equality, ranges = [], []
+    for _position, qualifier, column, operator in sorted(conditions):
+        if qualifier != table:
+            continue
+        target = equality if operator.upper() in EQUALITY else ranges
+        if column not in target:
+            target.append(column)
+    ordering = [
+        (column, direction.upper() == 'DESC')
+        for qualifier, column, direction in ORDER_RE.findall(order_by)
+    ]
+    # An index only helps the sort when every ORDER BY column is on this table
+    if any(qualifier != table for qualifier, _column, _direction in ORDER_RE.findall(order_by)):
+        ordering = []
+
+    columns = [(column, False) for column in equality]
+    for column, descending in ordering:
+        if column not in equality:
+            columns.append((column, descending))
+    if not ordering:
+        columns += [(column, False) for column in ranges[:1] if column not in equality]
+    return (table, columns[:MAX_COLUMNS]) if columns else None
+
+
+def existing_indexes(model):
+    """Column lists of the indexes the model already has"""
+    opts = model._meta
+    column = {field.name: field.column for field in opts.concrete_fields}
+    indexes = []
+    for field in opts.concrete_fields:
+        if field.primary_key or field.unique or field.db_index:
+            indexes.append([field.column])
+    for index in opts.indexes:
+        indexes.append([column[name.lstrip('-')] for name in index.fields])
+    for constraint in opts.constraints:
+        if isinstance(constraint, models.UniqueConstraint) and constraint.fields:
+            indexes.append([column[name] for name in constraint.fields])
+    for fields in opts.unique_together:
+        indexes.append([column[name] for name in fields])
+    return indexes
+
+
+def is_covered(columns, indexes):
+    names = [name for name, _descending in columns]
+    return any(index[:len(names)] == names for index in indexes)
+
+
+class Command(BaseCommand):
+    help = 'Proposes composite indexes for the blog models from the slow-query log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', help='Slow-query log to read (default: BLOG_SLOW_QUERY_LOG)')
+        parser.add_argument('--min-total-ms', type=float, default=0,
+                            help='Ignore proposals whose queries took less than this in total')
+        parser.add_argument('--dry-run', action='store_true', help='Print the migration instead of writing it')
+
+    def handle(self, *args, **options):
+        path = options['log'] or log_path()
+        try:
+            with open(path, encoding='utf-8') as handle:
+                entries = [json.loads(line) for line in handle if line.strip()]
+        except FileNotFoundError:
+            raise CommandError(f'No slow-query log at {path}; set BLOG_SLOW_QUERY_MS and let it collect.')
+
+        models_by_table = {model._meta.db_table: model for model in apps.get_app_config('blog').get_models()}
+        proposals = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'fingerprints': set()})
+        for entry in entries:
+            if not entry['sql'].upper().startswith('SELECT'):
+                continue
+            candidate = candidate_columns(entry['sql'])
+            if candidate is None or candidate[0] not in models_by_table:
+                continue
+            proposal = proposals[(candidate[0], tuple(candidate[1]))]
+            proposal['count'] += 1
+            proposal['total_ms'] += entry['duration_ms']
+            proposal['fingerprints'].add(entry['fingerprint'])
+
+        # A proposal that is a prefix of a longer one is served by it
+        for key in sorted(proposals, key=lambda key: len(key[1])):
+            table, columns = key
+            names = [name for name, _descending in columns]
+            for other_table, other_columns in proposals:
+                longer = [name for name, _descending in other_columns]
+                if other_table == table and len(longer) > len(names) and longer[:len(names)] == names:
+                    stats, target = proposals.pop(key), proposals[(other_table, other_columns)]
+                    target['count'] += stats['count']
+                    target['total_ms'] += stats['total_ms']
+                    target['fingerprints'] |= stats['fingerprints']
+                    break
+
+        operations, meta_lines = [], []
+        ranked = sorted(proposals.items(), key=lambda item: -item[1]['total_ms'])
+        for (table, columns), stats in ranked:
+            model = models_by_table[table]
+            indexes = existing_indexes(model)
+            if stats['total_ms'] < options['min_total_ms'] or is_covered(columns, indexes):
+                continue
+            fields_by_column = {field.column: field for field in model._meta.concrete_fields}
+            if all(isinstance(fields_by_column[name], models.BooleanField) for name, _descending in columns):
+                # Two distinct values: the planner would rather scan
+                continue
+            field_names = {column: field.name for column, field in fields_by_column.items()}
+            fields = [('-' if descending else '') + field_names[name] for name, descending in columns]
+            index = models.Index(fields=fields)
+            index.set_name_with_model(model)
+            # Later, longer proposals on the same prefix make this one redundant
+            indexes.append([name for name, _descending in columns])
+            operations.append(migrations.AddIndex(model_name=model._meta.model_name, index=index))
+            meta_lines.append(f'{model.__name__}: models.Index(fields={fields!r}, name={index.name!r})')
+            self.stdout.write(
+                f'{model.__name__}{fields}: {stats["count"]} slow queries, {stats["total_ms"]:.0f} ms total '
+                f'({", ".join(sorted(stats["fingerprints"]))})'
+            )
+
+        if not operations:
+            self.stdout.write(self.style.SUCCESS('✅ No missing indexes found in the slow-query log!'))
+            return
+
+        loader = MigrationLoader(connection, ignore_no_migrations=True)
+        leaf = sorted(loader.graph.leaf_nodes('blog'))[-1][1]
+        name = f'{int(leaf[:4]) + 1:04d}_index_advisor'
+        migration = migrations.Migration(name, 'blog')
+        migration.dependencies = [('blog', leaf)]
+        migration.operations = operations
+        writer = MigrationWriter(migration)
+
+        if options['dry_run']:
+            self.stdout.write(writer.as_string())
+        else:
+            with open(writer.path, 'w', encoding='utf-8') as handle:
+                handle.write(writer.as_string())
+            self.stdout.write(f'Wrote {writer.path}')
+        self.stdout.write('Review it, then add the same indexes to the models\' Meta.indexes so makemigrations stays clean:')
+        for line in meta_lines:
+            self.stdout.write(f'    {line}')
+        self.stdout.write(self.style.SUCCESS(f'✅ Proposed {len(operations)} indexes!'))
@@ -0,0 +1,68 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from blog.warmup import warm_up
+
+DEFAULT_URLS = ['/', '/posts/', '/login/']
+
+
+class Command(BaseCommand):
+    help = 'Compares first-request latency of fresh processes with and without the worker warm-up'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', dest='urls', help='URL to request (repeatable)')
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes per mode')
+        parser.add_argument('--child', choices=['cold', 'warm'], help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or DEFAULT_URLS
+        if options['child']:
+            self.run_child(options['child'], urls)
+            return
+
+        results = {}
+        for mode in ('cold', 'warm'):
+            runs = [self.spawn(mode, urls) for _ in range(options['runs'])]
+            results[mode] = runs
+
+        self.stdout.write(f'{"URL":<30} {"cold ms":>10} {"warm ms":>10}')
+        for url in urls:
+            cold = statistics.median(run['requests'][url] for run in results['cold']) * 1000
+            warm = statistics.median(run['requests'][url] for run in results['warm']) * 1000
+            self.stdout.write(f'{url:<30} {cold:>10.1f} {warm:>10.1f}')
+        warmup = statistics.median(run['warmup'] for run in results['warm']) * 1000
+        self.stdout.write(f'Warm-up itself: {warmup:.1f} ms (median of {options["runs"]})')
+        self.stdout.write(self.style.SUCCESS('✅ Measured cold and warm first requests!'))
+
+    def spawn(self, mode, urls):
+        # DJANGO_SETTINGS_MODULE is inherited from this process
+        command = [sys.executable, '-m', 'django', 'measure_warmup', '--child', mode]
+        for url in urls:
+            command += ['--url', url]
+        output = subprocess.run(command, capture_output=True, text=True, check=False)
+        if output.returncode:
+            raise CommandError(output.stderr.strip() or f'{mode} run failed')
+        return json.loads(output.stdout.strip().splitlines()[-1])
+
+    def run_child(self, mode, urls):
+        warmup = 0.0
+        if mode == 'warm':
+            started = time.perf_counter()
+            warm_up()
+            warmup = time.perf_counter() - started
+
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+        client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+        timings = {}
+        for url in urls:
+            started = time.perf_counter()
+            client.get(url)
+            timings[url] = time.perf_counter() - started
+        self.stdout.write(json.dumps({'warmup': warmup, 'requests': timings}))
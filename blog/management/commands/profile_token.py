@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from blog.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'Prints a signed token; requests sending it in X-Blog-Profile are profiled'
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from blog.taskqueue import purge_tasks
+
+
+class Command(BaseCommand):
+    help = 'Deletes done and failed background tasks older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Keep tasks that finished within this many days (default: BLOG_TASKS_RETENTION_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_tasks(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Deleted {deleted} finished tasks'))
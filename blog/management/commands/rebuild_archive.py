@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from blog.models import MonthlyPostCount
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the MonthlyPostCount archive rollup from Post'
+
+    def handle(self, *args, **options):
+        count = MonthlyPostCount.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt archive counts for {count} months!'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from blog.models import AuthorStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds AuthorStats for every author from Post and Comment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = AuthorStats.recompute_many(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Recomputed stats for {count} authors!'))
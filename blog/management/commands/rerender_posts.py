@@ -0,0 +1,63 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blog.cache import bump
+from blog.markup import markdown_extensions, render_batch, render_hash
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Re-renders stored post HTML in a process pool after the Markdown config changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--force', action='store_true', help='Re-render posts whose hash is current too')
+
+    def handle(self, *args, **options):
+        extensions = markdown_extensions()
+        batch_size = options['batch_size']
+        workers = options['workers'] or 1
+        self.rendered = 0
+        # Batches sent to the pool but not written back yet; bounded so
+        # memory stays flat however many posts are stale
+        in_flight = deque()
+        batch, hashes = [], {}
+        posts = Post.objects.order_by('id').values_list('id', 'content', 'content_hash')
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for post_id, content, content_hash in posts.iterator(chunk_size=batch_size):
+                digest = render_hash(content, extensions)
+                if digest == content_hash and not options['force']:
+                    continue
+                hashes[post_id] = (content_hash, digest)
+                batch.append((post_id, content))
+                if len(batch) == batch_size:
+                    in_flight.append((pool.submit(render_batch, batch, extensions), hashes))
+                    batch, hashes = [], {}
+                    if len(in_flight) >= workers * 2:
+                        self.save(*in_flight.popleft())
+            if batch:
+                in_flight.append((pool.submit(render_batch, batch, extensions), hashes))
+            while in_flight:
+                self.save(*in_flight.popleft())
+        if self.rendered:
+            bump('post')
+        self.stdout.write(self.style.SUCCESS(f'✅ Re-rendered {self.rendered} posts!'))
+
+    def save(self, future, hashes):
+        """Write a rendered batch, skipping posts edited since they were read"""
+        results = future.result()
+        with transaction.atomic():
+            current = dict(
+                Post.objects.select_for_update().filter(id__in=hashes).values_list('id', 'content_hash')
+            )
+            posts = [
+                Post(id=post_id, content_html=html, content_hash=hashes[post_id][1])
+                for post_id, html in results
+                if current.get(post_id) == hashes[post_id][0]
+            ]
+            Post.objects.bulk_update(posts, ['content_html', 'content_hash'])
+        self.rendered += len(posts)
@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from blog.models import PostDailyStats, PostEvent
+
+
+class Command(BaseCommand):
+    help = 'Rolls raw view and comment events into per-day post stats and deletes expired events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help='Recount this many recent days, today included')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running, rolling up every INTERVAL seconds',
+        )
+
+    def handle(self, *args, **options):
+        retention = getattr(settings, 'BLOG_ANALYTICS_RETENTION_DAYS', 30)
+        if not 1 <= options['days'] <= retention:
+            # Days past the retention have lost their raw events
+            raise CommandError(f'--days must be between 1 and BLOG_ANALYTICS_RETENTION_DAYS ({retention}).')
+        while True:
+            rolled = PostDailyStats.rollup(days=options['days'])
+            compacted = PostEvent.compact(retention)
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Rolled up {rolled} post-days, deleted {compacted} expired events'
+            ))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,52 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from blog.taskqueue import autodiscover, claim_tasks, run_task
+
+
+def _run_in_thread(task_row):
+    try:
+        return run_task(task_row)
+    finally:
+        # Each pool thread has its own connection
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Tasks run concurrently')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when no task is due')
+
+    def handle(self, *args, **options):
+        autodiscover()
+        threads = options['threads']
+        running = set()
+        processed = 0
+        self.stdout.write(f'Worker started with {threads} threads')
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            try:
+                while True:
+                    free = threads - len(running)
+                    claimed = claim_tasks(free) if free else []
+                    for task_row in claimed:
+                        running.add(pool.submit(_run_in_thread, task_row))
+                    if running:
+                        done, running = wait(
+                            running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED
+                        )
+                        for future in done:
+                            processed += 1
+                            self.stdout.write(f'Task finished: {future.result()}')
+                    elif options['once']:
+                        break
+                    elif not claimed:
+                        time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping; waiting for running tasks...')
+        self.stdout.write(self.style.SUCCESS(f'✅ Processed {processed} tasks'))
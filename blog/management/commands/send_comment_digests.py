@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from blog.notifications import send_comment_digests
+
+
+class Command(BaseCommand):
+    help = 'Sends pending new-comment digests to post authors now'
+
+    def handle(self, *args, **options):
+        metrics = send_comment_digests()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Sent {metrics['messages']} digests over {metrics['connections']} connection(s) "
+            f"in {metrics['send_seconds']:.3f}s ({metrics['messages_per_connection']:.1f} per connection)"
+        ))
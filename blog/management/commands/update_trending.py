@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from blog.models import TrendingScore
+
+
+class Command(BaseCommand):
+    help = 'Decays trending scores and folds in recent views and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running, folding every INTERVAL seconds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            folded = TrendingScore.fold()
+            pruned = TrendingScore.prune()
+            self.stdout.write(self.style.SUCCESS(f'✅ Folded {folded} trending scores, pruned {pruned}'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
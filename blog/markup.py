@@ -0,0 +1,43 @@
+"""
+Markdown rendering for post content.
+
+Post.save renders ``content`` to sanitized HTML once and stores it in
+``content_html``, together with a hash of the source text and the renderer
+configuration, so re-saves with unchanged content skip rendering. Bump
+RENDERER_VERSION (or change BLOG_MARKDOWN_EXTENSIONS) and run
+``manage.py rerender_posts`` to refresh stored HTML.
+"""
+
+import hashlib
+
+import markdown
+import nh3
+from django.conf import settings
+
+# Part of every content hash; bump when the rendering rules change
+RENDERER_VERSION = 1
+
+DEFAULT_EXTENSIONS = ['extra', 'sane_lists', 'nl2br']
+
+
+def markdown_extensions():
+    return list(getattr(settings, 'BLOG_MARKDOWN_EXTENSIONS', DEFAULT_EXTENSIONS))
+
+
+def render_hash(text, extensions=None):
+    """Hash of the source text and everything that affects its HTML"""
+    extensions = markdown_extensions() if extensions is None else extensions
+    key = f'{RENDERER_VERSION}:{",".join(extensions)}:{text}'
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def render_markdown(text, extensions=None):
+    """Markdown to HTML with scripts, styles and unsafe attributes removed"""
+    extensions = markdown_extensions() if extensions is None else extensions
+    html = markdown.markdown(text, extensions=extensions, output_format='html')
+    return nh3.clean(html, link_rel='noopener noreferrer nofollow')
+
+
+def render_batch(items, extensions):
+    """Render ``(post_id, text)`` pairs; runs in rerender_posts' worker processes"""
+    return [(post_id, render_markdown(text, extensions)) for post_id, text in items]
@@ -0,0 +1,192 @@
+"""
+Production serving of uploaded media (MEDIA_ROOT).
+
+serve_media answers /media/<path> in every environment:
+
+- Images of draft posts are only shown to their author and staff; every
+  other file is public. Public content-addressed blobs (blog.storage) are
+  cacheable forever.
+- Responses carry a strong ETag (a content hash, cached per file version)
+  and Last-Modified, and conditional requests get 304/412.
+- Single byte ranges (``Range: bytes=...``, honouring If-Range) get 206.
+- With BLOG_MEDIA_ACCEL set, the file itself is handed to the front proxy
+  via X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd) once the
+  access check has passed. Otherwise full files go out as a FileResponse,
+  which servers send with sendfile through wsgi.file_wrapper.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .models import Post, UserProfile
+from .storage import is_blob
+
+CHUNK_SIZE = 64 * 1024
+# Content-addressed names never change contents
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(path, file_stat):
+    """Strong ETag: SHA-256 of the contents, cached for this size and mtime"""
+    key = f'blog:media:etag:{hashlib.md5(path.encode()).hexdigest()}:{file_stat.st_size}:{file_stat.st_mtime_ns}'
+    etag = cache.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()[:32]}"'
+        cache.set(key, etag, None)
+    return etag
+
+
+def media_access(request, name):
+    """'public', 'private' (only this requester may see it) or None (hidden)"""
+    # Both lookups use the indexes on Post.image and UserProfile.profile_picture
+    posts = list(Post.objects.filter(image=name).values_list('status', 'author_id'))
+    if not posts or any(status == 'published' for status, _author_id in posts):
+        return 'public'
+    # A blob shared with a profile picture is public through it anyway
+    if UserProfile.objects.filter(profile_picture=name).exists():
+        return 'public'
+    user = request.user
+    if user.is_authenticated and (user.is_staff or any(author_id == user.pk for _status, author_id in posts)):
+        return 'private'
+    return None
+
+
+def parse_range(header, size):
+    """``(start, end)`` inclusive for a single byte range, None to send the
+    whole file, or False if the range can't be satisfied"""
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if not length or not size:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _offload(name, path, content_type):
+    mode = getattr(settings, 'BLOG_MEDIA_ACCEL', None)
+    response = HttpResponse(content_type=content_type)
+    if mode == 'nginx':
+        prefix = getattr(settings, 'BLOG_MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + quote(name)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = default_storage.path(path)
+    except NotImplementedError:
+        # Remote storage: it serves its own files
+        return redirect(default_storage.url(path))
+    except SuspiciousFileOperation:
+        raise Http404('File not found.')
+    name = os.path.relpath(full_path, default_storage.location).replace(os.sep, '/')
+    try:
+        file_stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('File not found.')
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404('File not found.')
+
+    access = media_access(request, name)
+    if access is None:
+        raise Http404('File not found.')
+    if access == 'public' and is_blob(name):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    elif access == 'public':
+        cache_control = f'public, max-age={getattr(settings, "BLOG_MEDIA_MAX_AGE", 3600)}'
+    else:
+        cache_control = 'private, no-cache'
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    if getattr(settings, 'BLOG_MEDIA_ACCEL', None):
+        response = _offload(name, full_path, content_type)
+        response['Cache-Control'] = cache_control
+        return response
+
+    etag = file_etag(full_path, file_stat)
+    last_modified = int(file_stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, full_path, file_stat.st_size, etag, last_modified, content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+def _file_response(request, path, size, etag, last_modified, content_type):
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(path, start, end - start + 1), status=206, content_type=content_type
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _if_range_matches(request, etag, last_modified):
+    """Ranges apply unless If-Range names another version of the file"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
@@ -0,0 +1,401 @@
+"""
+Prometheus-style runtime metrics, served at /metrics.
+
+MetricsMiddleware records, per resolved URL name, request counts and a
+latency histogram, the number and duration of SQL queries and the time spent
+rendering templates (through TimedDjangoTemplates, the template backend set
+in settings). Values are kept in a thread-safe per-process registry.
+
+Each worker process writes its registry to ``<pid>.json`` in
+BLOG_METRICS_DIR at most every BLOG_METRICS_FLUSH_INTERVAL seconds, and the
+/metrics view sums the files of every process on the host. The two-tier
+cache counters (blog.cache) and the comment digest totals
+(blog.notifications) travel the same way. The file of an exited
+process is folded into ``archive.json`` by the next scrape, or by a new
+process given the same pid if that comes first, so totals never go down.
+Backlogs of buffered work (pending trending counts, queued tasks, unsent
+comment notifications) are read from the database at scrape time.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single development process
+    fcntl = None
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Sum
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates
+from django.utils.crypto import constant_time_compare
+
+from . import cache as blog_cache
+from .models import TrendingScore, Task, CommentNotification
+from .ratelimit import client_ip
+
+ARCHIVE_NAME = 'archive.json'
+# Fields of the cache metrics snapshot that add up across processes
+CACHE_COUNTERS = ('lookups', 'local_hits', 'shared_hits', 'misses', 'recomputes', 'stale_served')
+# Set by proxies; REMOTE_ADDR is then the proxy's, not the scraper's
+FORWARDED_HEADERS = ('HTTP_FORWARDED', 'HTTP_X_FORWARDED_FOR', 'HTTP_X_REAL_IP')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'blog_http_requests_total': ('counter', 'Requests by URL name, method and status code'),
+    'blog_http_request_duration_seconds': ('histogram', 'Request latency by URL name'),
+    'blog_db_queries_total': ('counter', 'SQL queries run by requests, by URL name'),
+    'blog_db_query_seconds_total': ('counter', 'Time spent in SQL queries, by URL name'),
+    'blog_template_render_seconds_total': ('counter', 'Time spent rendering templates, by URL name'),
+    'blog_cache_lookups_total': ('counter', 'Two-tier cache lookups'),
+    'blog_cache_hits_total': ('counter', 'Two-tier cache hits by tier'),
+    'blog_cache_misses_total': ('counter', 'Two-tier cache misses'),
+    'blog_cache_recomputes_total': ('counter', 'Two-tier cache values computed, early or not'),
+    'blog_cache_stale_served_total': ('counter', 'Stale values served while another worker recomputed'),
+    'blog_cache_hit_ratio': ('gauge', 'Two-tier cache hits per lookup, all processes'),
+    'blog_trending_pending_views': ('gauge', 'Views waiting to be folded into trending scores'),
+    'blog_trending_pending_comments': ('gauge', 'Comments waiting to be folded into trending scores'),
+    'blog_tasks': ('gauge', 'Background tasks by status'),
+    'blog_comment_notifications_pending': ('gauge', 'Comment notifications not yet mailed'),
+    'blog_comment_digest_runs_total': ('counter', 'Comment digest runs'),
+    'blog_comment_digests_sent_total': ('counter', 'Comment digest emails sent'),
+    'blog_comment_digest_connections_total': ('counter', 'Mail connections opened for comment digests'),
+    'blog_comment_digest_send_seconds_total': ('counter', 'Time spent sending comment digests'),
+}
+
+_request = threading.local()
+
+
+class Registry:
+    """Counters and histograms of this process, safe to update from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.flushed_at = 0.0
+        self.new_identity()
+
+    def new_identity(self):
+        # Tells this process's file from one left by an exited process that
+        # had the same pid; renewed in forked workers
+        self.identity = uuid.uuid4().hex
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def dump(self):
+        with self._lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, dict(labels), dict(histogram, buckets=list(histogram['buckets']))]
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+                'cache': blog_cache.metrics.snapshot(),
+                'identity': self.identity,
+            }
+
+
+registry = Registry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.new_identity)
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'BLOG_METRICS_DIR', settings.BASE_DIR / 'metrics'))
+
+
+@contextmanager
+def _store_lock(directory):
+    """Exclusive lock on the store, held while files are written or folded"""
+    if fcntl is None:
+        yield
+        return
+    with open(directory / '.lock', 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _write(path, data):
+    temporary = path.with_suffix(f'.{threading.get_ident()}.tmp')
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _fold(directory, path):
+    """Add the file of an exited process to the archive and remove it"""
+    data = _read(path)
+    if data is not None:
+        archive_path = directory / ARCHIVE_NAME
+        archive = _read(archive_path) or {'counters': [], 'histograms': [], 'cache': {}}
+        counters, histograms, cache_stats = _sum([archive, data])
+        _write(archive_path, {
+            'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, dict(labels), histogram] for (name, labels), histogram in histograms.items()],
+            'cache': cache_stats,
+        })
+    path.unlink(missing_ok=True)
+
+
+def flush(force=False):
+    """Write this process's registry to the shared store if it is due"""
+    now = time.monotonic()
+    if not force and now - registry.flushed_at < getattr(settings, 'BLOG_METRICS_FLUSH_INTERVAL', 5):
+        return
+    registry.flushed_at = now
+    directory = metrics_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{os.getpid()}.json'
+    data = registry.dump()
+    with _store_lock(directory):
+        previous = _read(path)
+        if previous is not None and previous.get('identity') != registry.identity:
+            # Left by an exited process with our pid, not folded yet
+            _fold(directory, path)
+        _write(path, data)
+
+
+class QueryCounter:
+    """Execute wrapper adding SQL counts and time to the current request"""
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            _request.queries += 1
+            _request.query_seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.query_counter = QueryCounter()
+
+    def __call__(self, request):
+        _request.active = True
+        _request.queries = 0
+        _request.query_seconds = 0.0
+        _request.template_seconds = 0.0
+        started = time.perf_counter()
+        status = 500
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self.query_counter))
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            _request.active = False
+            self.record(request, status, time.perf_counter() - started)
+
+    def record(self, request, status, seconds):
+        match = request.resolver_match
+        labels = {'view': match.view_name if match else 'unresolved'}
+        registry.inc('blog_http_requests_total', dict(labels, method=request.method, status=str(status)))
+        registry.observe('blog_http_request_duration_seconds', labels, seconds)
+        registry.inc('blog_db_queries_total', labels, _request.queries)
+        registry.inc('blog_db_query_seconds_total', labels, _request.query_seconds)
+        registry.inc('blog_template_render_seconds_total', labels, _request.template_seconds)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+class TimedTemplate:
+    """Backend template that adds its render time to the current request"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        if not getattr(_request, 'active', False):
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            _request.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose templates report their render time"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+# Exposition
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _sum(registries):
+    """Counters, histograms and cache stats of ``registries``, added up"""
+    counters, histograms, cache_stats = {}, {}, {}
+    for data in registries:
+        for name, labels, value in data['counters']:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, histogram in data['histograms']:
+            key = (name, tuple(sorted(labels.items())))
+            total = histograms.setdefault(key, {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0})
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], histogram['buckets'])]
+            total['sum'] += histogram['sum']
+            total['count'] += histogram['count']
+        for field in CACHE_COUNTERS:
+            cache_stats[field] = cache_stats.get(field, 0) + data['cache'].get(field, 0)
+    return counters, histograms, cache_stats
+
+
+def collect():
+    """Registries of every process, summed
+
+    Files of exited processes are folded into the archive, which still
+    counts towards counters and histograms, which must never go down, but
+    not towards the cache hit ratio gauge.
+    """
+    flush(force=True)
+    directory = metrics_dir()
+    with _store_lock(directory):
+        for path in directory.glob('*.json'):
+            if path.stem.isdigit() and not _is_alive(int(path.stem)):
+                _fold(directory, path)
+        registries = {path.stem: _read(path) for path in directory.glob('*.json')}
+    registries = {stem: data for stem, data in registries.items() if data is not None}
+
+    counters, histograms, cache_stats = _sum(registries.values())
+    for name, field in (
+        ('blog_cache_lookups_total', 'lookups'),
+        ('blog_cache_misses_total', 'misses'),
+        ('blog_cache_recomputes_total', 'recomputes'),
+        ('blog_cache_stale_served_total', 'stale_served'),
+    ):
+        counters[(name, ())] = cache_stats.get(field, 0)
+    for tier in ('local', 'shared'):
+        counters[('blog_cache_hits_total', (('tier', tier),))] = cache_stats.get(f'{tier}_hits', 0)
+
+    live = [data['cache'] for stem, data in registries.items() if stem.isdigit()]
+    cache_hits = sum(stats['local_hits'] + stats['shared_hits'] for stats in live)
+    cache_lookups = sum(stats['lookups'] for stats in live)
+    gauges = {('blog_cache_hit_ratio', ()): cache_hits / cache_lookups if cache_lookups else 0.0}
+    gauges.update(backlog())
+    return counters, histograms, gauges
+
+
+def backlog():
+    """Buffered work waiting in the database"""
+    pending = TrendingScore.objects.aggregate(views=Sum('pending_views'), comments=Sum('pending_comments'))
+    gauges = {
+        ('blog_trending_pending_views', ()): pending['views'] or 0,
+        ('blog_trending_pending_comments', ()): pending['comments'] or 0,
+        ('blog_comment_notifications_pending', ()): CommentNotification.objects.filter(sent_at__isnull=True).count(),
+    }
+    counts = dict(Task.objects.order_by().values('status').annotate(total=Count('id')).values_list('status', 'total'))
+    for status, _label in Task.STATUS_CHOICES:
+        gauges[('blog_tasks', (('status', status),))] = counts.get(status, 0)
+    return gauges
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render():
+    counters, histograms, gauges = collect()
+    series = {}
+    for (name, labels), value in sorted(counters.items()):
+        series.setdefault(name, []).append(f'{name}{_labels(labels)} {value}')
+    for (name, labels), value in sorted(gauges.items()):
+        series.setdefault(name, []).append(f'{name}{_labels(labels)} {value}')
+    for (name, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+        lines = series.setdefault(name, [])
+        for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+            lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {count}')
+        lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {histogram["count"]}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram["sum"]}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram["count"]}')
+    output = []
+    for name in sorted(series):
+        kind, help_text = HELP.get(name, ('untyped', ''))
+        output.append(f'# HELP {name} {help_text}')
+        output.append(f'# TYPE {name} {kind}')
+        output.extend(series[name])
+    return '\n'.join(output) + '\n'
+
+
+def _allowed(request):
+    token = getattr(settings, 'BLOG_METRICS_TOKEN', None)
+    if token:
+        return constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    allowed_ips = getattr(settings, 'BLOG_METRICS_ALLOWED_IPS', ())
+    if not allowed_ips:
+        return False
+    # A forwarded request's REMOTE_ADDR is the proxy's: only the configured
+    # client address header can be checked
+    if not getattr(settings, 'BLOG_RATELIMIT_IP_HEADER', None) and any(
+        header in request.META for header in FORWARDED_HEADERS
+    ):
+        return False
+    return client_ip(request) in allowed_ips
+
+
+def metrics_view(request):
+    """Prometheus text exposition of every worker's metrics"""
+    if not _allowed(request):
+        return HttpResponseForbidden('Forbidden\n')
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0008_monthly_post_count"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RequestProfile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("method", models.CharField(max_length=10)),
+                ("path", models.CharField(max_length=500)),
+                ("view_name", models.CharField(blank=True, max_length=200)),
+                ("status_code", models.PositiveSmallIntegerField(null=True)),
+                (
+                    "trigger",
+                    models.CharField(
+                        choices=[
+                            ("sample", "Sampled"),
+                            ("staff", "Staff flag"),
+                            ("header", "Signed header"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("total_ms", models.FloatField()),
+                ("view_ms", models.FloatField(default=0)),
+                ("sql_ms", models.FloatField(default=0)),
+                ("sql_count", models.PositiveIntegerField(default=0)),
+                ("template_ms", models.FloatField(default=0)),
+                ("summary", models.TextField(blank=True)),
+                ("filename", models.CharField(max_length=100)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:13
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0010_media_blob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("views", models.PositiveIntegerField(default=0)),
+                ("comments", models.PositiveIntegerField(default=0)),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="blog.post",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Post daily stats",
+                "indexes": [
+                    models.Index(fields=["day"], name="blog_postda_day_b727d2_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("post", "day"), name="unique_post_day"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="PostEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.PositiveSmallIntegerField(
+                        choices=[(1, "View"), (2, "Comment")]
+                    ),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="blog.post",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["created_at"], name="blog_postev_created_89252d_idx"
+                    )
+                ],
+            },
+        ),
+    ]
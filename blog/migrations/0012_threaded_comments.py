@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, LPad
+
+
+def set_comment_paths(apps, schema_editor):
+    # Every existing comment is top-level: its path is its own id
+    Comment = apps.get_model("blog", "Comment")
+    Comment.objects.update(path=LPad(Cast("pk", CharField()), 10, Value("0")), depth=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0011_post_analytics"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="depth",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="blog.comment",
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(set_comment_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "path"], name="blog_commen_post_id_34d25d_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "depth", "-created_at"],
+                name="blog_commen_post_id_bc5d2c_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0012_threaded_comments"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="post",
+            name="image",
+            field=models.ImageField(
+                blank=True, db_index=True, null=True, upload_to="posts/%Y/%m/%d/"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="userprofile",
+            name="profile_picture",
+            field=models.ImageField(
+                blank=True, db_index=True, null=True, upload_to="profiles/%Y/%m/%d/"
+            ),
+        ),
+    ]
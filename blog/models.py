@@ -1,8 +1,18 @@
-from django.db import models
+import math
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
-from django.db.models import Count, Q, Avg
+from django.db.models import Count, Q, Avg, Sum, F
+from django.db.models.functions import TruncDate, TruncMonth
+
+from .markup import render_hash, render_markdown
+from .storage import BLOB_PREFIX, is_blob
 
 
 class PublishedManager(models.Manager):
@@ -29,7 +39,8 @@ class PostQuerySet(models.QuerySet):
         return self.annotate(comment_count=Count('comments'))
     
     def popular(self):
-        return self.annotate(comment_count=Count('comments')).order_by('-comment_count', '-created_at')
+        # Reads the precomputed TrendingScore leaderboard (see update_trending)
+        return self.filter(trending__isnull=False).order_by('-trending__score', '-created_at')
     
     def recent(self):
         return self.order_by('-created_at')
@@ -86,12 +97,15 @@ class Post(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='posts')
     tags = models.ManyToManyField(Tag, related_name='posts', blank=True)
     content = models.TextField()
-    image = models.ImageField(upload_to='posts/%Y/%m/%d/', blank=True, null=True)
+    image = models.ImageField(upload_to='posts/%Y/%m/%d/', blank=True, null=True, db_index=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(null=True, blank=True)
     views = models.PositiveIntegerField(default=0)
+    # Sanitized HTML rendered from content by save(), see blog.markup
+    content_html = models.TextField(blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     # Default manager
     objects = models.Manager()
@@ -116,16 +130,41 @@ class Post(models.Model):
     def save(self, *args, **kwargs):
         if self.status == 'published' and not self.published_at:
             self.published_at = timezone.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.render_content()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'content_html', 'content_hash'}
         super().save(*args, **kwargs)
 
-    def increment_views(self):
-        self.views += 1
-        self.save(update_fields=['views'])
+    def render_content(self):
+        """Refresh content_html unless content is unchanged since the last render"""
+        digest = render_hash(self.content)
+        if digest != self.content_hash:
+            self.content_html = render_markdown(self.content)
+            self.content_hash = digest
 
 
 class Comment(models.Model):
+    """A comment or a reply, stored as a materialized path
+
+    ``path`` is the ancestors' ids and this comment's own, each zero-padded
+    to PATH_STEP digits, so ordering by it lists a thread depth-first with
+    replies in the order they were written, and a subtree is one range of
+    the (post, path) index. See blog.threads.
+
+    As the path ends with the id the INSERT assigns, a new comment is
+    written twice: the INSERT, then an UPDATE of ``path`` once save() has
+    run. post_save receivers therefore see an empty ``path`` when
+    ``created`` is true, and should go by ``parent`` and ``depth`` instead.
+    """
+    PATH_STEP = 10
+
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blog_comments')
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -133,15 +172,31 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['post', 'path']),
+            models.Index(fields=['post', 'depth', '-created_at']),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author.username} on {self.post.title}'
 
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            super().save(*args, **kwargs)
+            return
+        self.depth = self.parent.depth + 1 if self.parent_id else 0
+        # The path ends with our own id, which the INSERT assigns
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            prefix = self.parent.path if self.parent_id else ''
+            self.path = f'{prefix}{self.pk:0{self.PATH_STEP}d}'
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(max_length=500, blank=True)
-    profile_picture = models.ImageField(upload_to='profiles/%Y/%m/%d/', blank=True, null=True)
+    profile_picture = models.ImageField(upload_to='profiles/%Y/%m/%d/', blank=True, null=True, db_index=True)
     website = models.URLField(blank=True)
     location = models.CharField(max_length=100, blank=True)
     birth_date = models.DateField(null=True, blank=True)
@@ -155,3 +210,515 @@ class UserProfile(models.Model):
         return reverse('blog:profile', kwargs={'username': self.user.username})
 
 
+
+
+class AuthorStats(models.Model):
+    """Denormalized per-author totals, kept up to date by blog.signals"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='author_stats')
+    published_posts = models.PositiveIntegerField(default=0)
+    total_views = models.PositiveBigIntegerField(default=0)
+    total_comments = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Author stats"
+
+    def __str__(self):
+        return f'Stats for {self.user.username}'
+
+    @classmethod
+    def for_user(cls, user):
+        """Return the stats row for a user, building it on first access"""
+        stats = cls.objects.filter(user=user).first()
+        return stats if stats is not None else cls.recompute(user.pk)
+
+    @classmethod
+    def compute_totals(cls, user_id):
+        posts = Post.objects.filter(author_id=user_id).aggregate(
+            published_posts=Count('id', filter=Q(status='published')),
+            total_views=Sum('views'),
+        )
+        return {
+            'published_posts': posts['published_posts'],
+            'total_views': posts['total_views'] or 0,
+            'total_comments': Comment.objects.filter(post__author_id=user_id, active=True).count(),
+        }
+
+    @classmethod
+    def recompute(cls, user_id):
+        """Rebuild one author's row from Post and Comment"""
+        stats, created = cls.objects.update_or_create(
+            user_id=user_id, defaults=cls.compute_totals(user_id)
+        )
+        return stats
+
+    @classmethod
+    def recompute_many(cls, user_ids=None, batch_size=1000):
+        """Rebuild the rows of ``user_ids`` (every author if None) in two grouped queries"""
+        posts = Post.objects.order_by()
+        comments = Comment.objects.filter(active=True).order_by()
+        existing = cls.objects.all()
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            posts = posts.filter(author_id__in=user_ids)
+            comments = comments.filter(post__author_id__in=user_ids)
+            existing = existing.filter(user_id__in=user_ids)
+
+        totals = {}
+
+        def row(user_id):
+            return totals.setdefault(user_id, {
+                'published_posts': 0, 'total_views': 0, 'total_comments': 0,
+            })
+
+        post_totals = posts.values('author_id').annotate(
+            published=Count('id', filter=Q(status='published')),
+            views=Sum('views'),
+        )
+        for entry in post_totals:
+            stats = row(entry['author_id'])
+            stats['published_posts'] = entry['published']
+            stats['total_views'] = entry['views'] or 0
+        for entry in comments.values('post__author_id').annotate(total=Count('id')):
+            row(entry['post__author_id'])['total_comments'] = entry['total']
+        # Authors whose posts are all gone still need their row zeroed
+        for user_id in existing.values_list('user_id', flat=True):
+            row(user_id)
+
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, **values) for user_id, values in totals.items()],
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['published_posts', 'total_views', 'total_comments', 'updated_at'],
+        )
+        return len(totals)
+
+    @classmethod
+    def apply_delta(cls, user_id, **deltas):
+        """Shift an author's totals with a single UPDATE"""
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas or user_id is None:
+            return
+        updated = cls.objects.filter(user_id=user_id).update(
+            updated_at=timezone.now(),
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+        if not updated:
+            # No row yet: the change is already in the source tables, so
+            # building the row from scratch picks it up.
+            cls.recompute(user_id)
+
+
+class MonthlyPostCount(models.Model):
+    """Published posts per month of created_at, kept up to date by blog.signals"""
+    month = models.DateField(unique=True, help_text='First day of the month')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-month']
+
+    def __str__(self):
+        return f'{self.month:%B %Y}: {self.count}'
+
+    @classmethod
+    def recent(cls, limit=12):
+        """Newest months that have published posts, for the archive widget"""
+        return cls.objects.filter(count__gt=0)[:limit]
+
+    @classmethod
+    def apply_delta(cls, month, delta):
+        """Shift one month's count with a single UPDATE"""
+        if not delta or month is None:
+            return
+        if cls.objects.filter(month=month).update(count=F('count') + delta):
+            return
+        if delta < 0:
+            # Nothing to subtract from: rebuild the month from Post instead
+            cls.rebuild([month])
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(month=month, count=delta)
+        except IntegrityError:
+            # Another request created the row first
+            cls.objects.filter(month=month).update(count=F('count') + delta)
+
+    @classmethod
+    def rebuild(cls, months=None):
+        """Recount ``months`` (every month if None) in one grouped query"""
+        posts = Post.published.order_by()
+        existing = cls.objects.all()
+        if months is not None:
+            months = set(months)
+            if not months:
+                return 0
+            ranges = Q()
+            for month in months:
+                start, end = month_range(month)
+                ranges |= Q(created_at__gte=start, created_at__lt=end)
+            posts = posts.filter(ranges)
+            existing = existing.filter(month__in=months)
+
+        totals = {
+            entry['month']: entry['total']
+            for entry in posts.annotate(month=TruncMonth('created_at', output_field=models.DateField()))
+            .values('month').annotate(total=Count('id'))
+        }
+        existing.exclude(month__in=totals).delete()
+        cls.objects.bulk_create(
+            [cls(month=month, count=count) for month, count in totals.items()],
+            update_conflicts=True,
+            unique_fields=['month'],
+            update_fields=['count'],
+        )
+        return len(totals)
+
+
+def month_range(month):
+    """Aware datetimes bounding the month that starts on the date ``month``"""
+    start = timezone.make_aware(datetime.combine(month.replace(day=1), time.min))
+    next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start, timezone.make_aware(datetime.combine(next_month, time.min))
+
+
+class TrendingScore(models.Model):
+    """Time-decayed trending leaderboard row for a post
+
+    Views and comments are added to the pending counters as they happen;
+    the update_trending command periodically decays ``score`` and folds the
+    pending counts into it.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name='trending')
+    score = models.FloatField(default=0)
+    pending_views = models.PositiveIntegerField(default=0)
+    pending_comments = models.PositiveIntegerField(default=0)
+    decayed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score']),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id}: {self.score:.2f}'
+
+    @classmethod
+    def record(cls, post_id, views=0, comments=0):
+        """Queue view and comment events for the next fold"""
+        changes = {'pending_views': F('pending_views') + views, 'pending_comments': F('pending_comments') + comments}
+        if cls.objects.filter(post_id=post_id).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(post_id=post_id, pending_views=views, pending_comments=comments)
+        except IntegrityError:
+            # Another request created the row first
+            cls.objects.filter(post_id=post_id).update(**changes)
+
+    @classmethod
+    def fold(cls, now=None):
+        """Decay every score to ``now`` and add the pending events
+
+        Rows folded in the same run share ``decayed_at``, so this is one
+        UPDATE per distinct ``decayed_at`` (normally one or two). Returns the
+        number of rows updated.
+        """
+        now = now or timezone.now()
+        half_life = getattr(settings, 'BLOG_TRENDING_HALF_LIFE_HOURS', 24) * 3600
+        view_weight = getattr(settings, 'BLOG_TRENDING_VIEW_WEIGHT', 1.0)
+        comment_weight = getattr(settings, 'BLOG_TRENDING_COMMENT_WEIGHT', 5.0)
+        updated = 0
+        batches = list(cls.objects.order_by().values_list('decayed_at', flat=True).distinct())
+        for decayed_at in batches:
+            elapsed = (now - decayed_at).total_seconds() if decayed_at else 0
+            factor = math.exp(-math.log(2) * max(elapsed, 0) / half_life)
+            updated += cls.objects.filter(decayed_at=decayed_at).update(
+                score=F('score') * factor
+                + F('pending_views') * view_weight
+                + F('pending_comments') * comment_weight,
+                pending_views=0,
+                pending_comments=0,
+                decayed_at=now,
+            )
+        return updated
+
+    @classmethod
+    def prune(cls):
+        """Drop rows whose score has decayed to nothing"""
+        min_score = getattr(settings, 'BLOG_TRENDING_MIN_SCORE', 0.01)
+        return cls.objects.filter(score__lt=min_score, pending_views=0, pending_comments=0).delete()[0]
+
+
+class PostEvent(models.Model):
+    """Raw view or comment event, appended in batches by blog.analytics
+
+    Rolled up into PostDailyStats by the rollup_analytics command and
+    deleted after BLOG_ANALYTICS_RETENTION_DAYS.
+    """
+    VIEW = 1
+    COMMENT = 2
+    KIND_CHOICES = [
+        (VIEW, 'View'),
+        (COMMENT, 'Comment'),
+    ]
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} of {self.post_id} at {self.created_at}'
+
+    @classmethod
+    def compact(cls, retention_days, batch_size=10000):
+        """Delete events older than ``retention_days`` in batches; returns how many"""
+        cutoff = timezone.now() - timedelta(days=retention_days)
+        deleted = 0
+        while True:
+            ids = list(cls.objects.filter(created_at__lt=cutoff).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += cls.objects.filter(id__in=ids).delete()[0]
+
+
+class PostDailyStats(models.Model):
+    """Views and comments of a post on one day, rolled up from PostEvent"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Post daily stats"
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'day'], name='unique_post_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} on {self.day}: {self.views} views, {self.comments} comments'
+
+    @classmethod
+    def rollup(cls, days=2, now=None):
+        """Recount the last ``days`` days (today included) from PostEvent
+
+        Each day is recomputed from its raw events as a whole, so reruns and
+        overlapping runs are harmless. Returns the number of rows written.
+        """
+        today = timezone.localdate(now or timezone.now())
+        first_day = today - timedelta(days=days - 1)
+        start = timezone.make_aware(datetime.combine(first_day, time.min))
+        totals = (
+            PostEvent.objects.filter(created_at__gte=start).order_by()
+            .annotate(day=TruncDate('created_at'))
+            .values('post_id', 'day')
+            .annotate(
+                views=Count('id', filter=Q(kind=PostEvent.VIEW)),
+                comments=Count('id', filter=Q(kind=PostEvent.COMMENT)),
+            )
+        )
+        rows = [
+            cls(post_id=entry['post_id'], day=entry['day'], views=entry['views'], comments=entry['comments'])
+            for entry in totals
+        ]
+        cls.objects.bulk_create(
+            rows,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['post', 'day'],
+            update_fields=['views', 'comments'],
+        )
+        return len(rows)
+
+    @classmethod
+    def series(cls, queryset, days=30):
+        """``(day, views, comments)`` for each of the last ``days`` days,
+        summed over ``queryset`` and zero-filled"""
+        today = timezone.localdate()
+        first_day = today - timedelta(days=days - 1)
+        totals = {
+            entry['day']: (entry['total_views'], entry['total_comments'])
+            for entry in queryset.filter(day__gte=first_day).order_by().values('day').annotate(
+                total_views=Sum('views'), total_comments=Sum('comments'),
+            )
+        }
+        return [
+            (day, *totals.get(day, (0, 0)))
+            for day in (first_day + timedelta(days=offset) for offset in range(days))
+        ]
+
+
+class Task(models.Model):
+    """Background task queued by blog.taskqueue and run by run_tasks"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class CommentNotification(models.Model):
+    """A new comment waiting to go out in the post author's next digest"""
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='notifications')
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comment_notifications')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['sent_at', 'recipient']),
+        ]
+
+    def __str__(self):
+        return f'Notification to {self.recipient_id} for comment {self.comment_id}'
+
+
+class PostRevision(models.Model):
+    """One saved version of a post's content, see blog.revisions
+
+    ``data`` is zlib-compressed JSON: the full text for snapshots, otherwise
+    a line delta against the previous revision.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField()
+    is_snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    content_hash = models.CharField(max_length=64)
+    content_length = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-number']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'number'], name='unique_post_revision_number'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} r{self.number}'
+
+
+class RequestProfile(models.Model):
+    """A sampled request's CPU profile, recorded by blog.profiling"""
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    trigger = models.CharField(max_length=10, choices=[
+        ('sample', 'Sampled'),
+        ('staff', 'Staff flag'),
+        ('header', 'Signed header'),
+    ])
+    total_ms = models.FloatField()
+    view_ms = models.FloatField(default=0)
+    sql_ms = models.FloatField(default=0)
+    sql_count = models.PositiveIntegerField(default=0)
+    template_ms = models.FloatField(default=0)
+    # Top functions by cumulative time, as printed by pstats
+    summary = models.TextField(blank=True)
+    filename = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.total_ms:.0f} ms)'
+
+
+class MediaBlob(models.Model):
+    """A file in the content-addressed upload store (blog.storage) and the
+    number of REFERENCES to it, kept up to date by blog.signals"""
+    REFERENCES = [(Post, 'image'), (UserProfile, 'profile_picture')]
+
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last time refcount changed; unreferenced blobs are pruned after a grace period
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount} refs)'
+
+    @staticmethod
+    def stored_size(name):
+        try:
+            return default_storage.size(name)
+        except OSError:
+            return 0
+
+    @classmethod
+    def apply_delta(cls, name, delta):
+        """Shift a blob's reference count with a single UPDATE"""
+        if not delta or not is_blob(name):
+            return
+        if cls.objects.filter(name=name).update(refcount=F('refcount') + delta, updated_at=timezone.now()):
+            return
+        if delta < 0:
+            cls.recount([name])
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, size=cls.stored_size(name), refcount=delta)
+        except IntegrityError:
+            cls.objects.filter(name=name).update(refcount=F('refcount') + delta, updated_at=timezone.now())
+
+    @classmethod
+    def recount(cls, names=None):
+        """Recount references to ``names`` (every blob if None) in one grouped query per field"""
+        totals = Counter()
+        for model, field in cls.REFERENCES:
+            references = model.objects.filter(**{f'{field}__startswith': BLOB_PREFIX}).order_by()
+            if names is not None:
+                references = references.filter(**{f'{field}__in': names})
+            for entry in references.values(field).annotate(total=Count('pk')):
+                totals[entry[field]] += entry['total']
+
+        existing = cls.objects.all()
+        if names is not None:
+            existing = existing.filter(name__in=names)
+        existing.exclude(name__in=totals).filter(refcount__gt=0).update(refcount=0, updated_at=timezone.now())
+        known = set(cls.objects.filter(name__in=totals).values_list('name', flat=True))
+        cls.objects.bulk_create(
+            [
+                cls(name=name, refcount=count, size=0 if name in known else cls.stored_size(name))
+                for name, count in totals.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['name'],
+            update_fields=['refcount', 'updated_at'],
+        )
+        return len(totals)
@@ -0,0 +1,115 @@
+"""
+Comment notification digests.
+
+Each new comment queues a CommentNotification for the post's author. Every
+BLOG_COMMENT_DIGEST_INTERVAL seconds a task renders one digest email per
+author and sends them all over a single mail connection, committing each
+batch as it goes out.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template import loader
+from django.utils import timezone
+
+from . import metrics as blog_metrics
+from .models import CommentNotification
+
+logger = logging.getLogger(__name__)
+
+
+def _render_digest(recipient, notifications):
+    context = {
+        'recipient': recipient,
+        'notifications': notifications,
+        'comment_count': len(notifications),
+        'site_url': getattr(settings, 'BLOG_SITE_URL', ''),
+    }
+    subject = loader.render_to_string('blog/comment_digest_subject.txt', context)
+    subject = ''.join(subject.splitlines())
+    body = loader.render_to_string('blog/comment_digest_email.html', context)
+    return EmailMessage(subject, body, None, [recipient.email])
+
+
+def _claim_batch(recipient_ids):
+    """Lock and return the pending notifications of ``recipient_ids``
+
+    Rows another run is sending right now are skipped rather than waited
+    for, so two runs never mail the same notification.
+    """
+    return list(
+        CommentNotification.objects.select_for_update(skip_locked=True, of=('self',))
+        .filter(sent_at__isnull=True, recipient_id__in=recipient_ids)
+        .select_related('recipient', 'comment__author', 'comment__post')
+        .order_by('recipient_id', 'created_at')
+    )
+
+
+def _export(metrics):
+    """Add a run's totals to the process's /metrics counters"""
+    registry = blog_metrics.registry
+    registry.inc('blog_comment_digest_runs_total', {})
+    registry.inc('blog_comment_digests_sent_total', {}, metrics['messages'])
+    registry.inc('blog_comment_digest_connections_total', {}, metrics['connections'])
+    registry.inc('blog_comment_digest_send_seconds_total', {}, metrics['send_seconds'])
+    try:
+        # The task worker serves no requests, which is when registries flush
+        blog_metrics.flush(force=True)
+    except OSError:
+        logger.warning('Could not write the digest metrics', exc_info=True)
+
+
+def send_comment_digests(batch_size=None):
+    """Send every pending digest and return the run's metrics
+
+    Digests go out ``batch_size`` recipients at a time, each batch claimed,
+    sent and marked sent in its own transaction: a failure later in the run
+    only leaves the unsent batches pending. Run outside any transaction.
+    """
+    batch_size = batch_size or getattr(settings, 'BLOG_COMMENT_DIGEST_BATCH', 100)
+    metrics = {'messages': 0, 'connections': 0, 'send_seconds': 0.0}
+    connection = None
+    last_recipient_id = 0
+    try:
+        while True:
+            recipient_ids = list(
+                CommentNotification.objects.filter(sent_at__isnull=True, recipient_id__gt=last_recipient_id)
+                .order_by('recipient_id').values_list('recipient_id', flat=True).distinct()[:batch_size]
+            )
+            if not recipient_ids:
+                break
+            last_recipient_id = recipient_ids[-1]
+            with transaction.atomic():
+                by_recipient = {}
+                for notification in _claim_batch(recipient_ids):
+                    by_recipient.setdefault(notification.recipient_id, []).append(notification)
+                if not by_recipient:
+                    continue
+                if connection is None:
+                    connection = get_connection()
+                    connection.open()
+                    metrics['connections'] = 1
+                messages = [_render_digest(group[0].recipient, group) for group in by_recipient.values()]
+                started = time.perf_counter()
+                metrics['messages'] += connection.send_messages(messages) or 0
+                metrics['send_seconds'] += time.perf_counter() - started
+                CommentNotification.objects.filter(
+                    pk__in=[notification.pk for group in by_recipient.values() for notification in group]
+                ).update(sent_at=timezone.now())
+    finally:
+        if connection is not None:
+            connection.close()
+
+    metrics['messages_per_connection'] = (
+        metrics['messages'] / metrics['connections'] if metrics['connections'] else 0
+    )
+    _export(metrics)
+    logger.info(
+        'Sent %(messages)s comment digests over %(connections)s connection(s) in %(send_seconds).3fs',
+        metrics,
+    )
+    return metrics
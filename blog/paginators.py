@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def estimate_row_count(model, using='default'):
+    """Table row estimate from the database statistics, or None if unavailable"""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'mysql':
+        sql = (
+            'SELECT TABLE_ROWS FROM information_schema.TABLES '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+        )
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never runs an unbounded COUNT(*) on a large table
+
+    Unfiltered querysets use the table statistics once they pass
+    BLOG_ADMIN_COUNT_CAP rows. Filtered querysets are counted up to that
+    cap, or to the end of the requested ``page`` if that is further. When
+    more rows match, ``truncated`` is set and the count is stretched by one
+    page, so the last page counted always links to the next.
+    """
+
+    def __init__(self, *args, page=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested_page = max(page, 1)
+        self.truncated = False
+        self.counted = None
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        cap = getattr(settings, 'BLOG_ADMIN_COUNT_CAP', 10000)
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > cap:
+                return estimate
+        limit = max(cap, self.requested_page * self.per_page)
+        self.counted = queryset.order_by()[:limit + 1].count()
+        if self.counted > limit:
+            self.truncated = True
+            self.counted = limit
+            return limit + self.per_page
+        return self.counted
+
+
+class KeysetPage:
+    """One page of a newest-first (created_at, id) keyset walk
+
+    Each page continues from the last row of the previous one via an opaque
+    cursor, so deep pages cost the same single index range scan as the
+    first and no COUNT(*) is run.
+    """
+
+    def __init__(self, queryset, cursor=None, per_page=10):
+        self.cursor = cursor
+        position = self.decode_cursor(cursor)
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        rows = list(queryset.order_by('-created_at', '-pk')[:per_page + 1])
+        self.object_list = rows[:per_page]
+        self.has_next = len(rows) > per_page
+        self.next_cursor = self.encode_cursor(self.object_list[-1]) if self.has_next else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @staticmethod
+    def encode_cursor(obj):
+        delta = obj.created_at - EPOCH
+        microseconds = (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+        return f'{microseconds}-{obj.pk}'
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """``(created_at, pk)`` for a cursor, or None if it is missing or malformed"""
+        try:
+            microseconds, pk = cursor.rsplit('-', 1)
+            return EPOCH + timedelta(microseconds=int(microseconds)), int(pk)
+        except (AttributeError, ValueError, OverflowError):
+            return None
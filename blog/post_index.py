@@ -0,0 +1,280 @@
+"""
+In-process bitmap index of posts by status, category, tag, author and month.
+
+PostListView intersects these bitmaps in memory and only fetches the rows of
+the requested page from the database; facet counts for the sidebar come from
+the same bitmaps (see blog.facets). The index is built lazily on first use
+in each worker and kept current from model signals (see blog.signals). It
+is rebuilt when another process has bumped the ``post``, ``tag`` or
+``category`` cache namespace (blog.cache) since the build, which every
+worker sees within BLOG_CACHE_LOCAL_TTL seconds, and at the latest every
+BLOG_POST_INDEX_TTL seconds. The worker's own bumps go through
+bump_applied(), which moves the index's versions along with them.
+
+Results are ordered newest first by id, which follows created_at because
+created_at is set on insert.
+"""
+
+import threading
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.utils import timezone
+
+from .bitmap import Bitmap
+from .cache import bump, namespace_version
+from .models import Post, Category, Tag
+
+EMPTY = Bitmap()
+# Cache namespaces whose bumps mean another process changed indexed rows
+NAMESPACES = ('post', 'tag', 'category')
+
+_index = None
+_build_lock = threading.Lock()
+
+
+def month_of(value):
+    """First day of the month of a datetime, in the current time zone"""
+    return timezone.localtime(value).date().replace(day=1)
+
+
+class PostIndex:
+    def __init__(self):
+        self.status = {}
+        self.categories = {}
+        self.tags = {}
+        self.authors = {}
+        self.months = {}
+        self.category_slugs = {}
+        self.tag_slugs = {}
+        self.built_at = None
+        self.versions = None
+        self.rankings = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        # Read before the rows, so a change committed during the build
+        # still makes this index stale
+        index.versions = _namespace_versions()
+        status, categories, tags, authors, months = {}, {}, {}, {}, {}
+        posts = Post.objects.order_by().values_list('id', 'status', 'category_id', 'author_id', 'created_at')
+        for post_id, post_status, category_id, author_id, created_at in posts.iterator(chunk_size=10000):
+            status.setdefault(post_status, []).append(post_id)
+            if category_id is not None:
+                categories.setdefault(category_id, []).append(post_id)
+            authors.setdefault(author_id, []).append(post_id)
+            months.setdefault(month_of(created_at), []).append(post_id)
+        links = Post.tags.through.objects.order_by().values_list('tag_id', 'post_id')
+        for tag_id, post_id in links.iterator(chunk_size=10000):
+            tags.setdefault(tag_id, []).append(post_id)
+
+        index.status = {key: Bitmap(ids) for key, ids in status.items()}
+        index.categories = {key: Bitmap(ids) for key, ids in categories.items()}
+        index.tags = {key: Bitmap(ids) for key, ids in tags.items()}
+        index.authors = {key: Bitmap(ids) for key, ids in authors.items()}
+        index.months = {key: Bitmap(ids) for key, ids in months.items()}
+        # Largest first, for the capped facet scan in counts()
+        index.rankings = {
+            name: sorted(groups, key=lambda key, groups=groups: -len(groups[key]))
+            for name, groups in (('categories', index.categories), ('tags', index.tags), ('authors', index.authors))
+        }
+        index.category_slugs = dict(Category.objects.values_list('slug', 'id'))
+        index.tag_slugs = dict(Tag.objects.values_list('slug', 'id'))
+        index.built_at = time.monotonic()
+        return index
+
+    def is_stale(self):
+        ttl = getattr(settings, 'BLOG_POST_INDEX_TTL', 300)
+        return time.monotonic() - self.built_at > ttl or self.versions != _namespace_versions()
+
+    # Queries
+    def filter(self, status='published', categories=(), tags=(), match_all_tags=False,
+               authors=(), months=()):
+        """Bitmap of post ids matching every given criterion
+
+        ``categories`` and ``tags`` are slugs, ``authors`` user ids and
+        ``months`` first-of-month dates. Values of one criterion are ORed,
+        except tags, which are ANDed when ``match_all_tags`` is set. The
+        result is the caller's own: signals keep changing the index's
+        bitmaps while it is read.
+        """
+        with self._lock:
+            parts = [self.status.get(status, EMPTY)]
+            if categories:
+                parts.append(Bitmap.union(
+                    self.categories.get(self.category_slugs.get(slug), EMPTY) for slug in categories
+                ))
+            if tags:
+                tag_bitmaps = [self.tags.get(self.tag_slugs.get(slug), EMPTY) for slug in tags]
+                parts.append(Bitmap.intersection(tag_bitmaps) if match_all_tags else Bitmap.union(tag_bitmaps))
+            if authors:
+                parts.append(Bitmap.union(self.authors.get(author_id, EMPTY) for author_id in authors))
+            if months:
+                parts.append(Bitmap.union(self.months.get(month, EMPTY) for month in months))
+            result = Bitmap.intersection(parts)
+            # A single criterion, or an empty one, comes back as the index's own bitmap
+            return result.copy() if any(result is part for part in parts) else result
+
+    def counts(self, post_ids, scan_limit=None, include=None):
+        """Per-category, tag, author and month counts within ``post_ids``
+
+        Each group maps a key (category id, tag id, user id or month) to the
+        number of ``post_ids`` carrying it; keys with no matches are left out.
+        With ``scan_limit``, categories, tags and authors are only counted
+        for their ``scan_limit`` largest keys overall plus the keys listed
+        in ``include[group]``, so the cost stops growing with the number of
+        tags; a small key can then be missing from the counts.
+        """
+        include = include or {}
+        with self._lock:
+            groups = {
+                'categories': self.categories,
+                'tags': self.tags,
+                'authors': self.authors,
+                'months': self.months,
+            }
+            counts = {}
+            for name, bitmaps in groups.items():
+                counts[name] = {}
+                if not post_ids:
+                    continue
+                keys = bitmaps.keys()
+                if scan_limit is not None and name in self.rankings and len(bitmaps) > scan_limit:
+                    keys = set(self.rankings[name][:scan_limit]).union(include.get(name, ()))
+                for key in keys:
+                    bitmap = bitmaps.get(key)
+                    count = len(post_ids & bitmap) if bitmap else 0
+                    if count:
+                        counts[name][key] = count
+            return counts
+
+    # Incremental updates
+    def _move(self, groups, post_id, key):
+        for group_key, bitmap in groups.items():
+            if group_key != key:
+                bitmap.discard(post_id)
+        if key is not None:
+            groups.setdefault(key, Bitmap()).add(post_id)
+
+    def post_saved(self, post_id, status, category_id, author_id, month):
+        with self._lock:
+            self._move(self.status, post_id, status)
+            self._move(self.categories, post_id, category_id)
+            self._move(self.authors, post_id, author_id)
+            self._move(self.months, post_id, month)
+
+    def post_deleted(self, post_id):
+        with self._lock:
+            for groups in (self.status, self.categories, self.tags, self.authors, self.months):
+                for bitmap in groups.values():
+                    bitmap.discard(post_id)
+
+    def tags_added(self, post_ids, tag_ids):
+        with self._lock:
+            for tag_id in tag_ids:
+                bitmap = self.tags.setdefault(tag_id, Bitmap())
+                for post_id in post_ids:
+                    bitmap.add(post_id)
+
+    def tags_removed(self, post_ids, tag_ids=None):
+        """Unlink posts from ``tag_ids``, or from every tag when None"""
+        with self._lock:
+            bitmaps = self.tags.values() if tag_ids is None else [
+                self.tags[tag_id] for tag_id in tag_ids if tag_id in self.tags
+            ]
+            for bitmap in bitmaps:
+                for post_id in post_ids:
+                    bitmap.discard(post_id)
+
+    def tag_cleared(self, tag_id):
+        with self._lock:
+            self.tags.pop(tag_id, None)
+
+    def slug_saved(self, model, obj_id, slug):
+        slugs = self.tag_slugs if model is Tag else self.category_slugs
+        with self._lock:
+            for old_slug, old_id in list(slugs.items()):
+                if old_id == obj_id:
+                    del slugs[old_slug]
+            slugs[slug] = obj_id
+
+    def restamp(self, versions):
+        """Take the versions of bumps made by this worker after applying them
+
+        A namespace moved on by anyone else as well keeps its old version, so
+        the index still goes stale.
+        """
+        with self._lock:
+            self.versions = tuple(
+                versions[namespace] if versions.get(namespace) == version + 1 else version
+                for namespace, version in zip(NAMESPACES, self.versions)
+            )
+
+    def slug_deleted(self, model, obj_id):
+        slugs, groups = (self.tag_slugs, self.tags) if model is Tag else (self.category_slugs, self.categories)
+        with self._lock:
+            for old_slug, old_id in list(slugs.items()):
+                if old_id == obj_id:
+                    del slugs[old_slug]
+            groups.pop(obj_id, None)
+
+
+def _namespace_versions():
+    return tuple(namespace_version(namespace) for namespace in NAMESPACES)
+
+
+def get_post_index():
+    """The worker's index, built on first use and rebuilt once stale"""
+    global _index
+    index = _index
+    if index is None or index.is_stale():
+        with _build_lock:
+            if _index is None or _index.is_stale():
+                _index = PostIndex.build()
+            index = _index
+    return index
+
+
+def update_index(method, *args):
+    """Apply an incremental update if this worker has built its index"""
+    if _index is not None:
+        getattr(_index, method)(*args)
+
+
+def bump_applied(*namespaces):
+    """bump() for a change this worker has already applied to its index"""
+    update_index('restamp', bump(*namespaces))
+
+
+class IndexedPostList:
+    """Sequence of posts over a Bitmap of ids, newest first
+
+    Paginator only asks for the count and one slice, so only the rows of the
+    current page are read from the database.
+    """
+    ordered = True
+
+    def __init__(self, ids, queryset):
+        self.ids = ids
+        self.queryset = queryset
+        self.model = queryset.model
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        page_ids = list(islice(self.ids.iter_desc(start), max(stop - start, 0)))
+        if not page_ids:
+            return []
+        rows = {post.id: post for post in self.queryset.filter(id__in=page_ids)}
+        return [rows[post_id] for post_id in page_ids if post_id in rows]
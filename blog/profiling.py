@@ -0,0 +1,193 @@
+"""
+Opt-in CPU profiling of live requests.
+
+ProfilingMiddleware runs a request under cProfile when
+
+- it is sampled, with probability BLOG_PROFILE_SAMPLE_RATE (0 disables),
+- a staff user adds ``_profile=1`` to the query string, or
+- it carries an ``X-Blog-Profile`` header holding a token from
+  ``manage.py profile_token``.
+
+Every other request pays for one dictionary lookup and a random number.
+Only one request per process is profiled at a time; a triggered request that
+finds another one being profiled is served unprofiled.
+Besides the cProfile output, each profile records how much of the request
+went to the view, to SQL (timed with a connection execute wrapper) and to
+template rendering. Profiles are written to BLOG_PROFILE_DIR, listed as
+RequestProfile rows in the admin, and only the newest BLOG_PROFILE_KEEP are
+kept.
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.template.base import Template
+
+from .models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_BLOG_PROFILE'
+TOKEN_SALT = 'blog.profiling'
+
+_profiling = threading.Lock()
+
+
+def _code_key(func):
+    code = func.__code__
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+TEMPLATE_RENDER = _code_key(Template.render)
+
+
+def make_token():
+    """Signed token for the X-Blog-Profile header"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def _valid_token(token):
+    max_age = getattr(settings, 'BLOG_PROFILE_TOKEN_MAX_AGE', 86400)
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def profile_dir():
+    return Path(getattr(settings, 'BLOG_PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+class QueryTimer:
+    """Execute wrapper adding up the number and duration of SQL queries"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = self.trigger(request)
+        # One profile at a time per process: from Python 3.12 cProfile hooks
+        # sys.monitoring, and a second enable() while one runs raises.
+        if trigger is None or not _profiling.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request, trigger)
+        finally:
+            _profiling.release()
+
+    def profile(self, request, trigger):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except Exception:
+            # Another tool (debugger, coverage) holds the profiling hook
+            logger.warning('Could not profile %s', request.path, exc_info=True)
+            return self.get_response(request)
+
+        request._profile_view = None
+        timer = QueryTimer()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            started = time.perf_counter()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+                total = time.perf_counter() - started
+
+        try:
+            save_profile(request, response, trigger, profiler, total, timer)
+        except Exception:
+            # Profiling must never break the request it observed
+            logger.exception('Could not save the profile of %s', request.path)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_profile_view'):
+            request._profile_view = view_func
+
+    def trigger(self, request):
+        token = request.META.get(PROFILE_HEADER)
+        if token and _valid_token(token):
+            return 'header'
+        if '_profile' in request.GET and getattr(request, 'user', None) and request.user.is_staff:
+            return 'staff'
+        rate = getattr(settings, 'BLOG_PROFILE_SAMPLE_RATE', 0)
+        if rate and random.random() < rate:
+            return 'sample'
+        return None
+
+
+def _cumulative(stats, key):
+    entry = stats.stats.get(key)
+    return entry[3] if entry else 0.0
+
+
+def save_profile(request, response, trigger, profiler, total, timer):
+    stats = pstats.Stats(profiler)
+    view = request._profile_view
+    view_seconds = _cumulative(stats, _code_key(view)) if hasattr(view, '__code__') else 0.0
+
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    filename = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}.prof'
+    stats.dump_stats(directory / filename)
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).strip_dirs().sort_stats('cumulative').print_stats(
+        getattr(settings, 'BLOG_PROFILE_SUMMARY_LINES', 40)
+    )
+
+    user = getattr(request, 'user', None)
+    match = request.resolver_match
+    RequestProfile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:500],
+        view_name=(match.view_name if match else '')[:200],
+        status_code=response.status_code,
+        user=user if user is not None and user.is_authenticated else None,
+        trigger=trigger,
+        total_ms=total * 1000,
+        view_ms=view_seconds * 1000,
+        sql_ms=timer.seconds * 1000,
+        sql_count=timer.count,
+        template_ms=_cumulative(stats, TEMPLATE_RENDER) * 1000,
+        summary=summary.getvalue(),
+        filename=filename,
+    )
+    prune_profiles()
+
+
+def prune_profiles(keep=None):
+    """Delete all but the newest ``keep`` profiles (BLOG_PROFILE_KEEP)"""
+    keep = getattr(settings, 'BLOG_PROFILE_KEEP', 200) if keep is None else keep
+    stale_ids = list(RequestProfile.objects.order_by('-created_at', '-id').values_list('id', flat=True)[keep:])
+    # Their files are removed by the post_delete receiver in blog.signals
+    return RequestProfile.objects.filter(id__in=stale_ids).delete()[0] if stale_ids else 0
@@ -0,0 +1,88 @@
+"""
+Cache-backed rate limiting for form endpoints.
+
+Each scope in BLOG_RATE_LIMITS ("10/m", "5/h", "20/15m" ...) is enforced per
+client IP and, for signed-in users, per user, with a sliding-window counter:
+one cache counter per fixed window, the previous window weighted by how much
+of it still overlaps the sliding window. Counters are bumped with atomic
+cache increments, so this is two cache round trips per key and the limit
+holds across worker processes whenever the cache backend is shared (Redis,
+Memcached); with the default local-memory cache it is per process.
+
+Limited requests get a plain 429 before the view runs, i.e. before any form
+validation, password hashing or database work.
+"""
+
+import math
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RATE_RE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+
+def parse_rate(rate):
+    """``(limit, period_seconds)`` for a rate such as ``"10/m"`` or ``"20/15m"``"""
+    match = RATE_RE.match(rate.replace(' ', ''))
+    if not match:
+        raise ValueError(f'Invalid rate {rate!r}')
+    limit, multiplier, unit = match.groups()
+    return int(limit), int(multiplier or 1) * UNITS[unit]
+
+
+def client_ip(request):
+    """Client address, from BLOG_RATELIMIT_IP_HEADER when behind a proxy"""
+    header = getattr(settings, 'BLOG_RATELIMIT_IP_HEADER', None)
+    if header and request.META.get(header):
+        # The proxy appends the address it saw, so the last entry is the one
+        # that cannot be forged by the client.
+        return request.META[header].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def hit(key, limit, period, now=None):
+    """Count one request for ``key``; seconds to wait if over the limit, else 0"""
+    now = time.time() if now is None else now
+    window = int(now // period)
+    current_key = f'blog:rl:{key}:{window}'
+    cache.add(current_key, 0, timeout=period * 2)
+    try:
+        current = cache.incr(current_key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(current_key, 1, timeout=period * 2)
+        current = 1
+    previous = cache.get(f'blog:rl:{key}:{window - 1}', 0)
+    elapsed = now - window * period
+    if previous * (period - elapsed) / period + current <= limit:
+        return 0
+    return max(1, math.ceil(period - elapsed))
+
+
+def ratelimit(scope, methods=('POST',)):
+    """Limit ``methods`` requests to a view by the BLOG_RATE_LIMITS[scope] rate"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            rate = getattr(settings, 'BLOG_RATE_LIMITS', {}).get(scope)
+            if rate and request.method in methods and getattr(settings, 'BLOG_RATELIMIT_ENABLED', True):
+                limit, period = parse_rate(rate)
+                keys = [f'{scope}:ip:{client_ip(request)}']
+                if request.user.is_authenticated:
+                    keys.append(f'{scope}:user:{request.user.pk}')
+                retry_after = max(hit(key, limit, period) for key in keys)
+                if retry_after:
+                    response = HttpResponse(
+                        'Too many requests. Please try again later.\n',
+                        status=429, content_type='text/plain; charset=utf-8',
+                    )
+                    response['Retry-After'] = str(retry_after)
+                    return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,145 @@
+"""
+Delta-compressed revision history for post content.
+
+Every content change stores a PostRevision. Most revisions hold a line-level
+delta against the previous revision; every BLOG_REVISION_SNAPSHOT_EVERY-th
+revision holds the full text, so rebuilding any version reads one short run
+of rows (one snapshot plus fewer than that many deltas) in a single query.
+Revisions older than the newest BLOG_REVISION_KEEP are pruned; the oldest
+survivor is rewritten as a snapshot so the history stays self-contained.
+"""
+
+import hashlib
+import json
+import zlib
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Post, PostRevision
+
+
+def _snapshot_every():
+    return getattr(settings, 'BLOG_REVISION_SNAPSHOT_EVERY', 10)
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+# Encoding
+def make_delta(old, new):
+    """Operations that turn ``old`` into ``new``
+
+    Each operation is either ``[start, end]``, a run of lines copied from
+    ``old``, or a string of new text.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(''.join(new_lines[j1:j2]))
+    return ops
+
+
+def apply_delta(old, ops):
+    old_lines = old.splitlines(keepends=True)
+    return ''.join(
+        ''.join(old_lines[op[0]:op[1]]) if isinstance(op, list) else op
+        for op in ops
+    )
+
+
+def encode(payload):
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), 9)
+
+
+def decode(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+# Reading
+def rebuild(revisions):
+    """Content of the last revision in an ascending run starting at a snapshot"""
+    text = None
+    for revision in revisions:
+        payload = decode(revision.data)
+        text = payload if revision.is_snapshot else apply_delta(text, payload)
+    return text
+
+
+def get_revision_content(post, number):
+    """Content of revision ``number`` of ``post``, or None if it is gone"""
+    # A snapshot is never more than _snapshot_every() revisions back
+    window = list(
+        PostRevision.objects.filter(
+            post=post, number__lte=number, number__gt=number - _snapshot_every()
+        ).order_by('number')
+    )
+    if not window or window[-1].number != number:
+        return None
+    starts = [index for index, revision in enumerate(window) if revision.is_snapshot]
+    if starts:
+        return rebuild(window[starts[-1]:])
+    # Written under a larger BLOG_REVISION_SNAPSHOT_EVERY: look further back
+    snapshot = (
+        PostRevision.objects.filter(post=post, number__lte=number, is_snapshot=True)
+        .order_by('-number').values_list('number', flat=True).first()
+    )
+    if snapshot is None:
+        return None
+    return rebuild(
+        PostRevision.objects.filter(post=post, number__gte=snapshot, number__lte=number).order_by('number')
+    )
+
+
+# Writing
+@transaction.atomic
+def record_revision(post, content=None):
+    """Store ``content`` (default: the post's) if it differs from the last revision"""
+    content = post.content if content is None else content
+    digest = content_hash(content)
+    # Concurrent saves of a post take their revision numbers one at a time
+    Post.objects.select_for_update().filter(pk=post.pk).values_list('pk', flat=True).first()
+    latest = PostRevision.objects.filter(post=post).order_by('-number').first()
+    if latest is not None and latest.content_hash == digest:
+        return None
+    number = latest.number + 1 if latest else 1
+    previous = None
+    if latest is not None and (number - 1) % _snapshot_every():
+        previous = get_revision_content(post, latest.number)
+    if previous is None:
+        # First revision, a snapshot's turn, or a base that can't be rebuilt
+        is_snapshot, payload = True, content
+    else:
+        is_snapshot, payload = False, make_delta(previous, content)
+    revision = PostRevision.objects.create(
+        post=post, number=number, is_snapshot=is_snapshot, data=encode(payload),
+        content_hash=digest, content_length=len(content),
+    )
+    if is_snapshot:
+        prune_revisions(post)
+    return revision
+
+
+@transaction.atomic
+def prune_revisions(post, keep=None):
+    """Drop all but the newest ``keep`` revisions; returns how many were deleted"""
+    keep = keep or getattr(settings, 'BLOG_REVISION_KEEP', 50)
+    latest = PostRevision.objects.filter(post=post).order_by('-number').values_list('number', flat=True).first()
+    if latest is None or latest <= keep:
+        return 0
+    cutoff = latest - keep + 1
+    oldest_kept = PostRevision.objects.filter(post=post, number__gte=cutoff).order_by('number').first()
+    if oldest_kept is None:
+        return 0
+    if not oldest_kept.is_snapshot:
+        text = get_revision_content(post, oldest_kept.number)
+        PostRevision.objects.filter(pk=oldest_kept.pk).update(is_snapshot=True, data=encode(text))
+    deleted, _ = PostRevision.objects.filter(post=post, number__lt=oldest_kept.number).delete()
+    return deleted
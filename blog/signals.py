@@ -0,0 +1,351 @@
+import threading
+from functools import partial
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import (
+    Post, Comment, Category, Tag, AuthorStats, TrendingScore, CommentNotification, PostRevision, MonthlyPostCount,
+    RequestProfile, UserProfile, MediaBlob, PostEvent,
+)
+from .analytics import record_event
+from .post_index import NAMESPACES as INDEX_NAMESPACES, bump_applied, update_index, month_of
+from .tag_index import update_tag_index
+from .revisions import record_revision
+from .cache import bump
+from .profiling import profile_dir
+from .slowlog import slow_query_logger
+from .tasks import schedule_comment_digest
+
+
+# Posts whose deletion already settled their comments in AuthorStats, so the
+# cascaded Comment deletes must not subtract them a second time.
+_deleting = threading.local()
+
+
+def _deleting_post_ids():
+    if not hasattr(_deleting, 'post_ids'):
+        _deleting.post_ids = set()
+    return _deleting.post_ids
+
+
+def _snapshot(instance, fields):
+    """Loaded values of ``fields``, or None if any of them is deferred"""
+    values = instance.__dict__
+    if any(field not in values for field in fields):
+        return None
+    return tuple(values[field] for field in fields)
+
+
+def _post_contribution(status, views):
+    return {
+        'published_posts': 1 if status == 'published' else 0,
+        'total_views': views,
+    }
+
+
+# Post -> AuthorStats
+@receiver(post_init, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    instance._stats_snapshot = _snapshot(instance, ('author_id', 'status', 'views'))
+
+
+@receiver(post_save, sender=Post)
+def update_stats_on_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new = _post_contribution(instance.status, instance.views)
+    if created:
+        AuthorStats.apply_delta(instance.author_id, **new)
+    elif instance._stats_snapshot is None:
+        AuthorStats.recompute(instance.author_id)
+    else:
+        old_author_id, old_status, old_views = instance._stats_snapshot
+        old = _post_contribution(old_status, old_views)
+        if old_author_id == instance.author_id:
+            AuthorStats.apply_delta(instance.author_id, **{
+                field: new[field] - old[field] for field in new
+            })
+        else:
+            comments = instance.comments.filter(active=True).count()
+            AuthorStats.apply_delta(
+                old_author_id, total_comments=-comments,
+                **{field: -value for field, value in old.items()}
+            )
+            AuthorStats.apply_delta(instance.author_id, total_comments=comments, **new)
+    remember_post_state(sender, instance)
+
+
+@receiver(pre_delete, sender=Post)
+def update_stats_on_post_delete(sender, instance, **kwargs):
+    # Runs inside the delete transaction, before the comments cascade.
+    comments = instance.comments.filter(active=True).count()
+    old = _post_contribution(instance.status, instance.views)
+    AuthorStats.apply_delta(
+        instance.author_id, total_comments=-comments,
+        **{field: -value for field, value in old.items()}
+    )
+    _deleting_post_ids().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def forget_deleted_post(sender, instance, **kwargs):
+    _deleting_post_ids().discard(instance.pk)
+
+
+# Comment -> AuthorStats
+@receiver(post_init, sender=Comment)
+def remember_comment_state(sender, instance, **kwargs):
+    instance._stats_snapshot = _snapshot(instance, ('post_id', 'active'))
+
+
+@receiver(post_save, sender=Comment)
+def update_stats_on_comment_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        if instance.active:
+            AuthorStats.apply_delta(instance.post.author_id, total_comments=1)
+    elif instance._stats_snapshot is None:
+        AuthorStats.recompute(instance.post.author_id)
+    else:
+        old_post_id, old_active = instance._stats_snapshot
+        if old_post_id != instance.post_id:
+            if old_active:
+                old_author_id = Post.objects.filter(pk=old_post_id).values_list('author_id', flat=True).first()
+                AuthorStats.apply_delta(old_author_id, total_comments=-1)
+            if instance.active:
+                AuthorStats.apply_delta(instance.post.author_id, total_comments=1)
+        elif old_active != instance.active:
+            AuthorStats.apply_delta(instance.post.author_id, total_comments=1 if instance.active else -1)
+    remember_comment_state(sender, instance)
+
+
+@receiver(post_delete, sender=Comment)
+def update_stats_on_comment_delete(sender, instance, **kwargs):
+    if instance.active and instance.post_id not in _deleting_post_ids():
+        AuthorStats.apply_delta(instance.post.author_id, total_comments=-1)
+
+
+# Post, Tag and Category -> in-memory post index, once the change commits
+def _update_index_on_commit(method, *args):
+    transaction.on_commit(partial(update_index, method, *args))
+
+
+@receiver(post_save, sender=Post)
+def index_post_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _update_index_on_commit(
+            'post_saved', instance.pk, instance.status, instance.category_id,
+            instance.author_id, month_of(instance.created_at),
+        )
+
+
+@receiver(post_delete, sender=Post)
+def index_post_delete(sender, instance, **kwargs):
+    _update_index_on_commit('post_deleted', instance.pk)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def index_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_clear':
+        if reverse:
+            _update_index_on_commit('tag_cleared', instance.pk)
+        else:
+            _update_index_on_commit('tags_removed', [instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        post_ids, tag_ids = (pk_set, [instance.pk]) if reverse else ([instance.pk], pk_set)
+        method = 'tags_added' if action == 'post_add' else 'tags_removed'
+        _update_index_on_commit(method, list(post_ids), list(tag_ids))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Category)
+def index_slug_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _update_index_on_commit('slug_saved', sender, instance.pk, instance.slug)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Category)
+def index_slug_delete(sender, instance, **kwargs):
+    _update_index_on_commit('slug_deleted', sender, instance.pk)
+
+
+# Post -> monthly archive counts
+def _archive_month(status, created_at):
+    return month_of(created_at) if status == 'published' and created_at else None
+
+
+@receiver(post_init, sender=Post)
+def remember_post_archive_month(sender, instance, **kwargs):
+    snapshot = _snapshot(instance, ('status', 'created_at'))
+    instance._archive_known = snapshot is not None
+    instance._archive_month = _archive_month(*snapshot) if snapshot else None
+
+
+@receiver(post_save, sender=Post)
+def update_archive_on_post_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not {'status', 'created_at'} & set(update_fields)):
+        return
+    new_month = _archive_month(instance.status, instance.created_at)
+    if created:
+        MonthlyPostCount.apply_delta(new_month, 1)
+    elif not instance._archive_known:
+        MonthlyPostCount.rebuild()
+    elif instance._archive_month != new_month:
+        MonthlyPostCount.apply_delta(instance._archive_month, -1)
+        MonthlyPostCount.apply_delta(new_month, 1)
+    remember_post_archive_month(sender, instance)
+
+
+@receiver(post_delete, sender=Post)
+def update_archive_on_post_delete(sender, instance, **kwargs):
+    MonthlyPostCount.apply_delta(_archive_month(instance.status, instance.created_at), -1)
+
+
+# Comment -> trending leaderboard
+@receiver(post_save, sender=Comment)
+def record_trending_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.active:
+        TrendingScore.record(instance.post_id, comments=1)
+
+
+# Comment -> analytics event stream
+@receiver(post_save, sender=Comment)
+def record_comment_event(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.active:
+        transaction.on_commit(partial(record_event, instance.post_id, PostEvent.COMMENT))
+
+
+# Comment -> post author's next notification digest
+@receiver(post_save, sender=Comment)
+def queue_comment_notification(sender, instance, created, raw=False, **kwargs):
+    if not created or raw or not instance.active:
+        return
+    author = instance.post.author
+    if author.pk == instance.author_id or not author.email:
+        return
+    CommentNotification.objects.create(comment=instance, recipient=author)
+    transaction.on_commit(schedule_comment_digest)
+
+
+# Tag -> tag name prefix index
+@receiver(post_save, sender=Tag)
+def index_tag_name_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(partial(update_tag_index, 'tag_saved', instance.pk, instance.name, instance.slug))
+
+
+@receiver(post_delete, sender=Tag)
+def index_tag_name_delete(sender, instance, **kwargs):
+    transaction.on_commit(partial(update_tag_index, 'tag_deleted', instance.pk))
+
+
+# Post content -> revision history
+def _saves_content(update_fields):
+    return update_fields is None or 'content' in update_fields
+
+
+@receiver(pre_save, sender=Post)
+def record_baseline_revision(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Posts written before revisions existed: keep the text being replaced
+    if raw or instance.pk is None or not _saves_content(update_fields):
+        return
+    if PostRevision.objects.filter(post_id=instance.pk).exists():
+        return
+    old_content = Post.objects.filter(pk=instance.pk).values_list('content', flat=True).first()
+    if old_content is not None and old_content != instance.content:
+        record_revision(instance, content=old_content)
+
+
+@receiver(post_save, sender=Post)
+def record_content_revision(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and _saves_content(update_fields):
+        record_revision(instance)
+
+
+# Model changes -> cache namespaces (blog.cache)
+CACHE_NAMESPACES = {Post: 'post', Category: 'category', Tag: 'tag', Comment: 'comment'}
+# Counter-only saves that no cached value depends on
+UNCACHED_FIELDS = {'views'}
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Comment)
+def bump_cache_namespace(sender, update_fields=None, raw=False, **kwargs):
+    if update_fields is not None and set(update_fields) <= UNCACHED_FIELDS:
+        return
+    namespace = CACHE_NAMESPACES[sender]
+    # The index receivers above queued their update of this change first, so
+    # the worker's own post index need not be rebuilt for it
+    applied = namespace in INDEX_NAMESPACES and not raw
+    transaction.on_commit(partial(bump_applied if applied else bump, namespace))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def bump_cache_on_post_tags(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(partial(bump_applied, 'post', 'tag'))
+
+
+# RequestProfile -> its file in the profile store
+@receiver(post_delete, sender=RequestProfile)
+def delete_profile_file(sender, instance, **kwargs):
+    (profile_dir() / instance.filename).unlink(missing_ok=True)
+
+
+# Post.image, UserProfile.profile_picture -> MediaBlob reference counts
+MEDIA_FIELDS = dict(MediaBlob.REFERENCES)
+
+
+def _media_name(instance, field):
+    value = instance.__dict__.get(field)
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_init, sender=Post)
+@receiver(post_init, sender=UserProfile)
+def remember_media_name(sender, instance, **kwargs):
+    field = MEDIA_FIELDS[sender]
+    instance._media_name = _media_name(instance, field) if field in instance.__dict__ else None
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=UserProfile)
+def count_media_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    field = MEDIA_FIELDS[sender]
+    if raw or (update_fields is not None and field not in update_fields):
+        return
+    new = _media_name(instance, field)
+    old = '' if created else instance._media_name
+    if old is None:
+        # Deferred when loaded: the previous blob is settled by dedupe_media
+        MediaBlob.recount([new])
+    elif old != new:
+        MediaBlob.apply_delta(new, 1)
+        MediaBlob.apply_delta(old, -1)
+    instance._media_name = new
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=UserProfile)
+def count_media_on_delete(sender, instance, **kwargs):
+    field = MEDIA_FIELDS[sender]
+    if field in instance.__dict__:
+        MediaBlob.apply_delta(_media_name(instance, field), -1)
+
+
+# Every database connection -> slow-query log
+@receiver(connection_created)
+def install_slow_query_log(sender, connection, **kwargs):
+    if slow_query_logger not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_logger)
@@ -0,0 +1,106 @@
+"""
+Slow-query log.
+
+slow_query_logger is installed as an execute wrapper on every database
+connection (see blog.signals). Queries slower than BLOG_SLOW_QUERY_MS are
+appended as JSON lines to BLOG_SLOW_QUERY_LOG with a fingerprint of the
+normalized statement and, for SELECTs, the database's EXPLAIN plan (once per
+fingerprint and process). ``manage.py index_advisor`` reads the log back.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+_write_lock = threading.Lock()
+_explained = set()
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """Statement with literals and parameter lists collapsed, for grouping"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.md5(normalized_sql.encode()).hexdigest()[:16]
+
+
+def log_path():
+    return Path(getattr(settings, 'BLOG_SLOW_QUERY_LOG', settings.BASE_DIR / 'logs' / 'slow_queries.jsonl'))
+
+
+def _explain(connection, sql, params):
+    prefix = connection.ops.explain_query_prefix()
+    # In a savepoint, so a failing EXPLAIN can't abort the caller's transaction
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        return [' | '.join(str(value) for value in row) for row in cursor.fetchall()]
+
+
+def _write(entry):
+    path = log_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps(entry, default=str) + '\n'
+    with _write_lock, open(path, 'a', encoding='utf-8') as handle:
+        handle.write(line)
+
+
+def slow_query_logger(execute, sql, params, many, context):
+    threshold = getattr(settings, 'BLOG_SLOW_QUERY_MS', None)
+    if threshold is None or getattr(_state, 'busy', False):
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms < threshold:
+        return result
+
+    _state.busy = True
+    try:
+        normalized = normalize(sql)
+        digest = fingerprint(normalized)
+        connection = context['connection']
+        plan = None
+        explainable = not many and not connection.needs_rollback and normalized.upper().startswith('SELECT')
+        if explainable and digest not in _explained:
+            _explained.add(digest)
+            try:
+                plan = _explain(connection, sql, params)
+            except Exception as exc:
+                plan = [f'EXPLAIN failed: {exc}']
+        _write({
+            'at': timezone.now().isoformat(),
+            'duration_ms': round(elapsed_ms, 3),
+            'fingerprint': digest,
+            'sql': normalized,
+            'vendor': connection.vendor,
+            'many': many,
+            'explain': plan,
+        })
+    except Exception:
+        # Logging must never fail the query it observed
+        logger.exception('Could not log a slow query')
+    finally:
+        _state.busy = False
+    return result
@@ -0,0 +1,71 @@
+"""
+Content-addressed storage for uploads.
+
+ContentAddressedStorage (the default storage, see STORAGES) ignores the
+upload_to path and stores every file as ``blobs/<aa>/<bb>/<sha256>.<ext>``,
+hashing it in the same pass that copies it to disk. Uploading bytes that are
+already stored writes nothing and returns the existing name, so a stock photo
+or avatar used by many posts and profiles is kept once, and since a name can
+never point at other contents its URL is cached forever (see blog.media).
+
+References from Post.image and UserProfile.profile_picture are counted in
+MediaBlob by blog.signals; ``manage.py dedupe_media`` moves files uploaded
+before this storage into it, recounts, and with ``--prune`` deletes blobs
+nothing refers to any more.
+"""
+
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+
+BLOB_PREFIX = 'blobs/'
+INCOMING_DIR = BLOB_PREFIX + '.incoming'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+def blob_name(digest, extension):
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage naming each file after the SHA-256 of its contents"""
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is chosen by _save from the contents; an existing
+        # file under it holds the same bytes
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        incoming = self.path(INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        temp_path = os.path.join(incoming, f'{uuid.uuid4().hex}.part')
+
+        digest = hashlib.sha256()
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    handle.write(chunk)
+            name = blob_name(digest.hexdigest(), extension)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                # Fresh mtime: dedupe_media --prune spares recently stored blobs
+                os.utime(full_path)
+                return name
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            # Atomic: concurrent uploads of the same bytes all end up with
+            # one complete file
+            os.replace(temp_path, full_path)
+            return name
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
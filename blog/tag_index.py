@@ -0,0 +1,83 @@
+"""
+In-memory prefix index of tag names for the tag autocomplete endpoint.
+
+Tags are kept in a list sorted by lowercased name, so a prefix lookup is a
+binary search plus a short scan. Like blog.post_index, each worker builds it
+on first use, applies Tag changes from signals and rebuilds it every
+BLOG_TAG_INDEX_TTL seconds.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from .models import Tag
+
+_index = None
+_build_lock = threading.Lock()
+
+
+class TagPrefixIndex:
+    def __init__(self, rows):
+        # Entries are (lowercased name, id, name, slug)
+        self.entries = sorted((name.lower(), pk, name, slug) for pk, name, slug in rows)
+        self.by_id = {entry[1]: entry for entry in self.entries}
+        self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls):
+        return cls(Tag.objects.order_by().values_list('id', 'name', 'slug').iterator(chunk_size=10000))
+
+    def is_stale(self):
+        return time.monotonic() - self.built_at > getattr(settings, 'BLOG_TAG_INDEX_TTL', 300)
+
+    def search(self, prefix, limit=10):
+        """Tags whose name starts with ``prefix`` (case-insensitive), by name"""
+        key = prefix.strip().lower()
+        results = []
+        with self._lock:
+            position = bisect_left(self.entries, (key,))
+            for lowered, pk, name, slug in self.entries[position:position + limit]:
+                if not lowered.startswith(key):
+                    break
+                results.append({'id': pk, 'name': name, 'slug': slug})
+        return results
+
+    def _remove(self, pk):
+        entry = self.by_id.pop(pk, None)
+        if entry is not None:
+            position = bisect_left(self.entries, entry)
+            if position < len(self.entries) and self.entries[position] == entry:
+                del self.entries[position]
+
+    def tag_saved(self, pk, name, slug):
+        with self._lock:
+            self._remove(pk)
+            entry = (name.lower(), pk, name, slug)
+            insort(self.entries, entry)
+            self.by_id[pk] = entry
+
+    def tag_deleted(self, pk):
+        with self._lock:
+            self._remove(pk)
+
+
+def get_tag_index():
+    """The worker's index, built on first use and rebuilt once stale"""
+    global _index
+    index = _index
+    if index is None or index.is_stale():
+        with _build_lock:
+            if _index is None or _index.is_stale():
+                _index = TagPrefixIndex.build()
+            index = _index
+    return index
+
+
+def update_tag_index(method, *args):
+    """Apply an incremental update if this worker has built its index"""
+    if _index is not None:
+        getattr(_index, method)(*args)
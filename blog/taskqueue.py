@@ -0,0 +1,143 @@
+"""
+Database-backed background task queue.
+
+Functions decorated with ``@task`` (see blog.tasks) are queued as Task rows
+with ``func.enqueue(...)`` and executed by ``manage.py run_tasks``. A worker
+claims a row with a conditional UPDATE, which also sets a visibility timeout
+(``locked_until``); if the worker dies, the row becomes claimable again once
+the timeout passes. Failed runs are retried with exponential backoff until
+``max_attempts`` is reached. Finished tasks are deleted by
+``manage.py purge_tasks`` after BLOG_TASKS_RETENTION_DAYS.
+
+Arguments are stored as JSON, so pass ids and plain values, not model
+instances.
+"""
+
+import logging
+import traceback
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class TaskFunction:
+    def __init__(self, func, name, max_attempts, retry_delay, timeout, atomic):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.atomic = atomic
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, run_at=None, delay=None, **kwargs):
+        """Queue a call; ``run_at`` or ``delay`` (seconds) schedule it later"""
+        if getattr(settings, 'BLOG_TASKS_EAGER', False):
+            self.func(*args, **kwargs)
+            return None
+        if run_at is None:
+            run_at = timezone.now() + timedelta(seconds=delay or 0)
+        return Task.objects.create(
+            name=self.name, args=list(args), kwargs=kwargs,
+            max_attempts=self.max_attempts, run_at=run_at,
+        )
+
+
+def task(func=None, *, name=None, max_attempts=3, retry_delay=30, timeout=300, atomic=True):
+    """Register a function as a background task
+
+    ``retry_delay`` is the backoff in seconds after the first failure,
+    doubled on each further attempt. ``timeout`` is the visibility timeout:
+    how long a claimed task may run before another worker may take it over.
+    A task runs in one transaction, rolled back if it fails, unless
+    ``atomic`` is off for tasks that commit their progress themselves.
+    """
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        task_function = TaskFunction(func, task_name, max_attempts, retry_delay, timeout, atomic)
+        _registry[task_name] = task_function
+        return task_function
+    return decorator(func) if func is not None else decorator
+
+
+def claim_tasks(limit):
+    """Claim up to ``limit`` due tasks for this worker
+
+    A task whose worker overran the visibility timeout on its last attempt
+    is marked failed instead of being run again.
+    """
+    now = timezone.now()
+    due = Task.objects.filter(
+        Q(status='queued', run_at__lte=now) | Q(status='running', locked_until__lt=now)
+    ).order_by('run_at').values_list('id', 'name', 'status', 'attempts', 'max_attempts')[:limit * 2]
+    claimed = []
+    for pk, name, status, attempts, max_attempts in due:
+        if status == 'running' and attempts >= max_attempts:
+            Task.objects.filter(pk=pk, status=status, attempts=attempts).update(
+                status='failed', locked_until=None, finished_at=now,
+                last_error=f'Timed out on attempt {attempts} of {max_attempts}',
+            )
+            continue
+        timeout = _registry[name].timeout if name in _registry else 300
+        # Only one worker can win this UPDATE for a given (status, attempts)
+        won = Task.objects.filter(pk=pk, status=status, attempts=attempts).update(
+            status='running', attempts=attempts + 1,
+            locked_until=now + timedelta(seconds=timeout),
+        )
+        if won:
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return list(Task.objects.filter(pk__in=claimed))
+
+
+def run_task(task_row):
+    """Run a claimed task and record the outcome"""
+    task_function = _registry.get(task_row.name)
+    try:
+        if task_function is None:
+            raise LookupError(f'Unknown task {task_row.name!r}')
+        with transaction.atomic() if task_function.atomic else nullcontext():
+            task_function.func(*task_row.args, **task_row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Task %s #%s failed (attempt %s)', task_row.name, task_row.pk, task_row.attempts)
+        if task_function is not None and task_row.attempts < task_row.max_attempts:
+            backoff = task_function.retry_delay * 2 ** (task_row.attempts - 1)
+            outcome = {
+                'status': 'queued', 'locked_until': None, 'last_error': error,
+                'run_at': timezone.now() + timedelta(seconds=backoff),
+            }
+        else:
+            outcome = {'status': 'failed', 'last_error': error, 'finished_at': timezone.now()}
+    else:
+        outcome = {'status': 'done', 'finished_at': timezone.now()}
+    # A worker that overran its visibility timeout may have lost the task
+    # to another worker; its result is then dropped.
+    Task.objects.filter(pk=task_row.pk, status='running', attempts=task_row.attempts).update(**outcome)
+    return outcome['status']
+
+
+def purge_tasks(days=None):
+    """Delete tasks that finished, done or failed, over ``days`` ago"""
+    days = getattr(settings, 'BLOG_TASKS_RETENTION_DAYS', 7) if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Task.objects.filter(status__in=['done', 'failed'], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def autodiscover():
+    """Import blog.tasks so the worker knows every registered task"""
+    from . import tasks  # noqa: F401
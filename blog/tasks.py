@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMultiAlternatives
+from django.template import loader
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import Task
+from .notifications import send_comment_digests as _send_comment_digests
+from .taskqueue import task
+
+
+@task(max_attempts=5, retry_delay=60)
+def send_email(subject, body, from_email, recipient_list, html_message=None):
+    """Send one email from a worker instead of the request"""
+    message = EmailMultiAlternatives(subject, body, from_email, recipient_list)
+    if html_message:
+        message.attach_alternative(html_message, 'text/html')
+    message.send()
+
+
+# Context entries of a reset email that make up the reset link
+RESET_SECRET_KEYS = {'email', 'user', 'uid', 'token'}
+
+
+@task(max_attempts=5, retry_delay=60)
+def send_password_reset(user_id, context, subject_template_name, email_template_name, from_email,
+                        html_email_template_name=None):
+    """Make the reset token for ``user_id`` and send the reset email"""
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None:
+        return
+    email = getattr(user, User.get_email_field_name())
+    context = dict(
+        context, email=email, user=user,
+        uid=urlsafe_base64_encode(force_bytes(user.pk)), token=default_token_generator.make_token(user),
+    )
+    # Email subject *must not* contain newlines
+    subject = ''.join(loader.render_to_string(subject_template_name, context).splitlines())
+    body = loader.render_to_string(email_template_name, context)
+    html_message = None
+    if html_email_template_name is not None:
+        html_message = loader.render_to_string(html_email_template_name, context)
+    send_email(subject, body, from_email, [email], html_message=html_message)
+
+
+# Commits each batch of digests itself, so a retry does not resend them
+@task(max_attempts=3, retry_delay=120, atomic=False)
+def send_comment_digests():
+    _send_comment_digests()
+
+
+def schedule_comment_digest():
+    """Queue a digest run one interval from now unless one is already waiting"""
+    waiting = Task.objects.filter(name=send_comment_digests.name, status='queued').exists()
+    if not waiting:
+        send_comment_digests.enqueue(delay=getattr(settings, 'BLOG_COMMENT_DIGEST_INTERVAL', 900))
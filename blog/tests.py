@@ -0,0 +1,970 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.admin.sites import site
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from blog import analytics
+from blog import cache as blog_cache
+from blog import metrics, post_index, profiling
+from blog.detail import DETAIL_QUERY_BUDGET
+from blog.admin import PostAdmin
+from blog.forms import QueuedPasswordResetForm
+from blog.media import serve_media
+from blog.paginators import EstimatedCountPaginator
+from blog.management.commands.rerender_posts import Command as RerenderCommand
+from blog.models import (
+    AuthorStats, Category, Comment, CommentNotification, MediaBlob, Post, PostDailyStats, PostEvent, PostRevision,
+    RequestProfile, Tag, Task, TrendingScore,
+)
+from blog.revisions import get_revision_content
+from blog.threads import comment_threads, reply_target
+from blog.taskqueue import autodiscover, claim_tasks, purge_tasks, run_task
+from blog.transfer import import_lines
+from blog.tasks import send_comment_digests, send_password_reset
+from blog.views import PostDetailView, tag_autocomplete_view
+
+
+# Keep the files written by the metrics, profiling and slow-query stores out
+# of the checkout, and the analytics buffer for the tests to flush themselves
+_runtime_dir = None
+_runtime_settings = None
+
+
+def setUpModule():
+    global _runtime_dir, _runtime_settings
+    _runtime_dir = tempfile.TemporaryDirectory()
+    root = Path(_runtime_dir.name)
+    _runtime_settings = override_settings(
+        BLOG_METRICS_DIR=root / 'metrics',
+        BLOG_PROFILE_DIR=root / 'profiles',
+        BLOG_SLOW_QUERY_LOG=root / 'slow_queries.jsonl',
+        BLOG_ANALYTICS_FLUSH_INTERVAL=3600,
+    )
+    _runtime_settings.enable()
+
+
+def tearDownModule():
+    _runtime_settings.disable()
+    _runtime_dir.cleanup()
+
+
+class PostDetailQueryTests(TestCase):
+    """The detail page stays within DETAIL_QUERY_BUDGET however much it shows
+
+    Requests go through RequestFactory, so the session and user lookups of
+    the middleware, which the budget leaves out, are not counted.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='unused-password')
+        cls.reader = User.objects.create_user('reader', password='unused-password')
+        category = Category.objects.create(name='News', slug='news')
+        cls.post = Post.objects.create(
+            title='Detail', slug='detail', author=cls.author, category=category,
+            content='Body', status='published',
+        )
+        for number in range(3):
+            Post.objects.create(
+                title=f'Related {number}', slug=f'related-{number}', author=cls.author,
+                category=category, content='Body', status='published',
+            )
+        for number in range(12):
+            root = Comment.objects.create(post=cls.post, author=cls.reader, content=f'Thread {number}')
+            reply = Comment.objects.create(post=cls.post, author=cls.author, parent=root, content='Reply')
+            Comment.objects.create(post=cls.post, author=cls.reader, parent=reply, content='Reply to reply')
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        # Related posts come from the cache when warm; count the cold page
+        cache.clear()
+        blog_cache.local.clear()
+
+    def tearDown(self):
+        # Write buffered views inside the test transaction, not from the
+        # background thread
+        analytics.flush()
+
+    def test_get_within_budget(self):
+        request = self.factory.get(f'/post/{self.post.slug}/')
+        request.user = AnonymousUser()
+        with self.assertNumQueries(DETAIL_QUERY_BUDGET):
+            response = PostDetailView.as_view()(request, slug=self.post.slug)
+            response.render()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context_data['comment_count'], 36)
+        self.assertEqual(len(response.context_data['related_posts']), 3)
+
+    def test_invalid_comment_within_budget(self):
+        request = self.factory.post(f'/post/{self.post.slug}/', {'content': ''})
+        request.user = self.reader
+        with self.assertNumQueries(DETAIL_QUERY_BUDGET):
+            response = PostDetailView.as_view()(request, slug=self.post.slug)
+            response.render()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context_data['comment_form'].errors)
+        self.assertFalse(Comment.objects.filter(content='').exists())
+
+    def test_views_are_counted_on_flush(self):
+        analytics.flush()
+        request = self.factory.get(f'/post/{self.post.slug}/')
+        request.user = AnonymousUser()
+        PostDetailView.as_view()(request, slug=self.post.slug).render()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 0)
+        self.assertEqual(analytics.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 1)
+        self.assertEqual(PostEvent.objects.filter(post=self.post, kind=PostEvent.VIEW).count(), 1)
+
+
+class FlakyEmailBackend(EmailBackend):
+    """locmem backend whose ``fail_on``-th send_messages() call raises"""
+
+    fail_on = None
+    calls = 0
+
+    def send_messages(self, messages):
+        FlakyEmailBackend.calls += 1
+        if FlakyEmailBackend.calls == FlakyEmailBackend.fail_on:
+            raise OSError('Connection reset')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND=f'{__name__}.FlakyEmailBackend', BLOG_COMMENT_DIGEST_BATCH=1)
+class CommentDigestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        commenter = User.objects.create_user('commenter', password='unused-password')
+        for number in range(3):
+            author = User.objects.create_user(f'author{number}', f'author{number}@example.com', 'unused-password')
+            post = Post.objects.create(
+                title=f'Post {number}', slug=f'post-{number}', author=author, content='Body', status='published',
+            )
+            Comment.objects.create(post=post, author=commenter, content='Nice')
+
+    def setUp(self):
+        FlakyEmailBackend.calls = 0
+
+    def run_digest_task(self):
+        task_row = Task.objects.create(name=send_comment_digests.name, status='running', attempts=1)
+        return run_task(task_row)
+
+    def test_failed_run_keeps_sent_batches(self):
+        FlakyEmailBackend.fail_on = 2
+        self.assertEqual(self.run_digest_task(), 'queued')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(CommentNotification.objects.filter(sent_at__isnull=True).count(), 2)
+
+        FlakyEmailBackend.fail_on = None
+        self.assertEqual(self.run_digest_task(), 'done')
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [
+            'author0@example.com', 'author1@example.com', 'author2@example.com',
+        ])
+        self.assertFalse(CommentNotification.objects.filter(sent_at__isnull=True).exists())
+
+    def test_totals_are_exported(self):
+        def counter(name):
+            return metrics.registry.counters.get((name, ()), 0)
+
+        sent, runs = counter('blog_comment_digests_sent_total'), counter('blog_comment_digest_runs_total')
+        self.assertEqual(self.run_digest_task(), 'done')
+        self.assertEqual(counter('blog_comment_digests_sent_total') - sent, 3)
+        self.assertEqual(counter('blog_comment_digest_runs_total') - runs, 1)
+
+
+class TaskQueueTests(TestCase):
+    def test_password_reset_queues_no_token(self):
+        user = User.objects.create_user('reset', 'reset@example.com', 'unused-password')
+        form = QueuedPasswordResetForm({'email': 'reset@example.com'})
+        self.assertTrue(form.is_valid())
+        form.save(domain_override='blog.example.com')
+        task_row = Task.objects.get(name=send_password_reset.name)
+        self.assertEqual(task_row.args[0], user.pk)
+        self.assertNotIn('token', task_row.args[1])
+        self.assertEqual(len(mail.outbox), 0)
+
+        task_row.status, task_row.attempts = 'running', 1
+        self.assertEqual(run_task(task_row), 'done')
+        self.assertEqual(mail.outbox[0].to, ['reset@example.com'])
+        token = re.search(r'/password-reset-confirm/[^/]+/([^/]+)/', mail.outbox[0].body).group(1)
+        self.assertTrue(default_token_generator.check_token(user, token))
+        self.assertNotIn(token, str(Task.objects.values_list('args', flat=True).get(pk=task_row.pk)))
+
+    def test_timed_out_last_attempt_fails(self):
+        autodiscover()
+        past = timezone.now() - timedelta(minutes=1)
+        exhausted = Task.objects.create(
+            name=send_comment_digests.name, status='running', attempts=3, max_attempts=3, locked_until=past,
+        )
+        retried = Task.objects.create(
+            name=send_comment_digests.name, status='running', attempts=1, max_attempts=3, locked_until=past,
+        )
+        self.assertEqual([task_row.pk for task_row in claim_tasks(5)], [retried.pk])
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, 'failed')
+        self.assertIsNotNone(exhausted.finished_at)
+
+    def test_purge_keeps_recent_and_unfinished_tasks(self):
+        old = timezone.now() - timedelta(days=30)
+        Task.objects.create(name='old.done', status='done', finished_at=old)
+        Task.objects.create(name='old.failed', status='failed', finished_at=old)
+        Task.objects.create(name='recent.done', status='done', finished_at=timezone.now())
+        Task.objects.create(name='queued', status='queued')
+        self.assertEqual(purge_tasks(days=7), 2)
+        self.assertEqual(sorted(Task.objects.values_list('name', flat=True)), ['queued', 'recent.done'])
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(BLOG_PROFILE_SAMPLE_RATE=1, BLOG_PROFILE_DIR=directory.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_sampled_request_is_profiled(self):
+        self.assertEqual(self.client.get('/').status_code, 200)
+        self.assertEqual(RequestProfile.objects.count(), 1)
+
+    def test_concurrent_request_is_served_unprofiled(self):
+        # As if another thread were profiling its request
+        with profiling._profiling:
+            self.assertEqual(self.client.get('/').status_code, 200)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_failing_profiler_is_skipped(self):
+        error = ValueError('Another profiling tool is already active')
+        with mock.patch('cProfile.Profile.enable', side_effect=error), self.assertLogs(profiling.logger, 'WARNING'):
+            self.assertEqual(self.client.get('/').status_code, 200)
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class ArchiveViewTests(TestCase):
+    def test_out_of_range_dates_are_not_found(self):
+        for url in ['/archive/0/', '/archive/9999/', '/archive/9999/12/', '/archive/2024/13/']:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_last_valid_month(self):
+        self.assertEqual(self.client.get('/archive/9999/11/').status_code, 200)
+
+
+class ImportLinesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('writer', password='unused-password')
+
+    def record(self, **fields):
+        record = {'title': 'Imported', 'slug': 'imported', 'content': 'Body', 'status': 'published',
+                  'author': 'writer', 'category': {'name': 'News', 'slug': 'news'},
+                  'tags': [{'name': 'Django', 'slug': 'django'}]}
+        record.update(fields)
+        return json.dumps(record)
+
+    def test_bad_lines_are_reported_not_fatal(self):
+        lines = [
+            self.record(slug='no-tag-slug', tags=[{'name': 'Orphan'}]),
+            self.record(slug='string-category', category='News'),
+            self.record(slug='long-tag-slug', tags=[{'name': 'Long', 'slug': 'x' * 51}]),
+            self.record(slug='long-category-name', category={'name': 'n' * 101, 'slug': 'long'}),
+            self.record(slug='bad slug'),
+            self.record(slug='negative-views', views=-1),
+            self.record(slug='t' * 201),
+            '["not", "an", "object"]',
+            self.record(),
+        ]
+        stats, errors = import_lines(lines, batch_size=3)
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual([error.split(':')[0] for error in errors], [f'line {number}' for number in range(1, 9)])
+        post = Post.objects.get(slug='imported')
+        self.assertEqual(post.category.slug, 'news')
+        self.assertEqual(list(post.tags.values_list('slug', flat=True)), ['django'])
+        self.assertFalse(Tag.objects.exclude(slug='django').exists())
+
+
+class PostIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('indexed', password='unused-password')
+        cls.post = Post.objects.create(
+            title='Indexed', slug='indexed', author=cls.author, content='Body', status='published',
+        )
+
+    def setUp(self):
+        cache.clear()
+        blog_cache.local.clear()
+
+    def test_filter_result_is_not_the_live_bitmap(self):
+        index = post_index.PostIndex.build()
+        ids = index.filter()
+        index.post_deleted(self.post.pk)
+        self.assertIn(self.post.pk, ids)
+        self.assertNotIn(self.post.pk, index.filter())
+
+    def test_admin_actions_update_the_index(self):
+        staff = User.objects.create_superuser('editor', password='unused-password')
+        request = RequestFactory().post('/admin/blog/post/')
+        request.user = staff
+        post_admin = site._registry[Post]
+        index = post_index.PostIndex.build()
+        with mock.patch.object(post_index, '_index', index), mock.patch.object(post_admin, 'message_user'):
+            with self.captureOnCommitCallbacks(execute=True):
+                post_admin.unpublish_posts(request, Post.objects.filter(pk=self.post.pk))
+            self.assertNotIn(self.post.pk, index.filter())
+            self.assertIn(self.post.pk, index.filter(status='draft'))
+            with self.captureOnCommitCallbacks(execute=True):
+                post_admin.publish_posts(request, Post.objects.filter(pk=self.post.pk))
+            self.assertIn(self.post.pk, index.filter())
+            self.assertFalse(index.is_stale())
+
+    def test_own_writes_update_the_index_in_place(self):
+        index = post_index.PostIndex.build()
+        with mock.patch.object(post_index, '_index', index):
+            with self.captureOnCommitCallbacks(execute=True):
+                tag = Tag.objects.create(name='Fresh', slug='fresh')
+                post = Post.objects.create(
+                    title='Fresh', slug='fresh', author=self.author, content='Body', status='published',
+                )
+                post.tags.add(tag)
+            self.assertIs(post_index.get_post_index(), index)
+            self.assertIn(post.pk, index.filter(tags=['fresh']))
+            # A bump this worker did not apply itself
+            blog_cache.bump('post')
+            self.assertIsNot(post_index.get_post_index(), index)
+
+    def test_bump_from_another_process_makes_index_stale(self):
+        index = post_index.PostIndex.build()
+        self.assertFalse(index.is_stale())
+        blog_cache.bump('post')
+        self.assertTrue(index.is_stale())
+
+
+class FacetScanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('tagger', password='unused-password')
+        cls.posts = [
+            Post.objects.create(title=f'Post {number}', slug=f'post-{number}', author=author,
+                                content='Body', status='published')
+            for number in range(3)
+        ]
+        cls.big = Tag.objects.create(name='Big', slug='big')
+        cls.small = Tag.objects.create(name='Small', slug='small')
+        for post in cls.posts:
+            post.tags.add(cls.big)
+        cls.posts[0].tags.add(cls.small)
+
+    def test_scan_limit_counts_largest_and_included_keys(self):
+        index = post_index.PostIndex.build()
+        ids = index.filter()
+        self.assertEqual(index.counts(ids)['tags'], {self.big.pk: 3, self.small.pk: 1})
+        self.assertEqual(index.counts(ids, scan_limit=1)['tags'], {self.big.pk: 3})
+        counts = index.counts(ids, scan_limit=1, include={'tags': [self.small.pk]})
+        self.assertEqual(counts['tags'], {self.big.pk: 3, self.small.pk: 1})
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        overrides = override_settings(BLOG_METRICS_DIR=self.directory)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_access(self):
+        cases = [
+            ({}, {}, 403),
+            ({'BLOG_METRICS_ALLOWED_IPS': ['127.0.0.1']}, {}, 200),
+            ({'BLOG_METRICS_ALLOWED_IPS': ['127.0.0.1']}, {'HTTP_X_FORWARDED_FOR': '203.0.113.9'}, 403),
+            ({'BLOG_METRICS_ALLOWED_IPS': ['127.0.0.1'], 'BLOG_RATELIMIT_IP_HEADER': 'HTTP_X_FORWARDED_FOR'},
+             {'HTTP_X_FORWARDED_FOR': '203.0.113.9'}, 403),
+            ({'BLOG_METRICS_ALLOWED_IPS': ['203.0.113.9'], 'BLOG_RATELIMIT_IP_HEADER': 'HTTP_X_FORWARDED_FOR'},
+             {'HTTP_X_FORWARDED_FOR': '203.0.113.9'}, 200),
+            ({'BLOG_METRICS_TOKEN': 'secret'}, {}, 403),
+            ({'BLOG_METRICS_TOKEN': 'secret'}, {'HTTP_AUTHORIZATION': 'Bearer secret'}, 200),
+        ]
+        for overrides, headers, status in cases:
+            with self.subTest(overrides=overrides, headers=headers), override_settings(**overrides):
+                self.assertEqual(self.client.get('/metrics', **headers).status_code, status)
+
+    def registry_file(self, requests, identity='exited'):
+        return {
+            'counters': [['blog_http_requests_total', {'view': 'home'}, requests]],
+            'histograms': [],
+            'cache': {'lookups': 0, 'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'recomputes': 0,
+                      'stale_served': 0},
+            'identity': identity,
+        }
+
+    def requests_total(self):
+        counters, _histograms, _gauges = metrics.collect()
+        return counters.get(('blog_http_requests_total', (('view', 'home'),)), 0)
+
+    def test_reused_pid_does_not_lose_counts(self):
+        own_file = self.directory / f'{os.getpid()}.json'
+        metrics.flush(force=True)
+        before = self.requests_total()
+        own_file.write_text(json.dumps(self.registry_file(7)))
+        metrics.flush(force=True)
+        self.assertEqual(self.requests_total(), before + 7)
+        self.assertTrue((self.directory / metrics.ARCHIVE_NAME).exists())
+
+    def test_exited_process_is_archived(self):
+        (self.directory / '999999999.json').write_text(json.dumps(self.registry_file(5)))
+        before = self.requests_total()
+        self.assertFalse((self.directory / '999999999.json').exists())
+        self.assertEqual(self.requests_total(), before)
+        self.assertEqual(json.loads((self.directory / metrics.ARCHIVE_NAME).read_text())['counters'][0][2], 5)
+
+
+class RerenderPostsTests(TestCase):
+    def test_posts_edited_during_the_run_are_kept(self):
+        author = User.objects.create_user('renderer', password='unused-password')
+        kept = Post.objects.create(title='Kept', slug='kept', author=author, content='Old', status='published')
+        edited = Post.objects.create(title='Edited', slug='edited', author=author, content='Old', status='published')
+        hashes = {post.pk: (post.content_hash, 'new-hash') for post in (kept, edited)}
+        edited.content = 'Edited while rendering'
+        edited.save()
+
+        future = Future()
+        future.set_result([(kept.pk, '<p>rendered</p>'), (edited.pk, '<p>rendered</p>')])
+        command = RerenderCommand()
+        command.rendered = 0
+        command.save(future, hashes)
+
+        self.assertEqual(command.rendered, 1)
+        kept.refresh_from_db()
+        edited.refresh_from_db()
+        self.assertEqual(kept.content_html, '<p>rendered</p>')
+        self.assertIn('Edited while rendering', edited.content_html)
+
+
+@override_settings(BLOG_REVISION_SNAPSHOT_EVERY=10)
+class RevisionTests(TestCase):
+    def setUp(self):
+        author = User.objects.create_user('reviser', password='unused-password')
+        self.post = Post.objects.create(title='Revised', slug='revised', author=author, content='Version 1')
+        for number in range(2, 6):
+            self.edit(f'Version {number}')
+
+    def edit(self, content):
+        self.post.content = content
+        self.post.save()
+
+    def test_lowering_the_snapshot_interval_keeps_history_readable(self):
+        with override_settings(BLOG_REVISION_SNAPSHOT_EVERY=3):
+            self.edit('Version 6')
+            for number in range(1, 7):
+                self.assertEqual(get_revision_content(self.post, number), f'Version {number}')
+
+    def test_snapshot_written_when_the_base_is_gone(self):
+        PostRevision.objects.filter(post=self.post, number=1).delete()
+        self.edit('Version 6')
+        latest = PostRevision.objects.filter(post=self.post).latest('number')
+        self.assertEqual(latest.number, 6)
+        self.assertTrue(latest.is_snapshot)
+        self.assertEqual(get_revision_content(self.post, 6), 'Version 6')
+
+
+class CommentThreadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('threader', password='unused-password')
+        cls.post = Post.objects.create(
+            title='Threads', slug='threads', author=cls.author, content='Body', status='published',
+        )
+
+    def comment(self, parent=None):
+        return Comment.objects.create(post=self.post, author=self.author, parent=parent, content='Text')
+
+    def test_threads_newest_first_with_replies_in_order(self):
+        first = self.comment()
+        second = self.comment()
+        reply = self.comment(first)
+        nested = self.comment(reply)
+        later_reply = self.comment(first)
+        _page, threads = comment_threads(self.post)
+        self.assertEqual(threads, [second, first])
+        self.assertEqual(threads[1].thread_replies, [reply, later_reply])
+        self.assertEqual(threads[1].thread_replies[0].thread_replies, [nested])
+        self.assertEqual(threads[0].thread_replies, [])
+
+    def test_pages_cut_on_root_threads(self):
+        roots = [self.comment() for _number in range(3)]
+        replies = [self.comment(root) for root in roots]
+        page, threads = comment_threads(self.post, page_number=1, per_page=2)
+        self.assertEqual(page.paginator.num_pages, 2)
+        self.assertEqual(threads, [roots[2], roots[1]])
+        self.assertEqual([thread.thread_replies for thread in threads], [[replies[2]], [replies[1]]])
+        _page, threads = comment_threads(self.post, page_number=2, per_page=2)
+        self.assertEqual(threads, [roots[0]])
+        self.assertEqual(threads[0].thread_replies, [replies[0]])
+
+    @override_settings(BLOG_COMMENT_MAX_DEPTH=3)
+    def test_replies_past_max_depth_go_to_the_deepest_allowed_ancestor(self):
+        root = self.comment()
+        child = self.comment(root)
+        grandchild = self.comment(child)
+        self.assertEqual(grandchild.depth, 2)
+        self.assertEqual(reply_target(root), root)
+        self.assertEqual(reply_target(child), child)
+        self.assertEqual(reply_target(grandchild), child)
+        self.assertIsNone(reply_target(None))
+
+    def test_parent_is_read_only_in_the_admin(self):
+        comment = self.comment(self.comment())
+        request = RequestFactory().get('/admin/blog/comment/')
+        request.user = User.objects.create_superuser('moderator', password='unused-password')
+        form_class = site._registry[Comment].get_form(request, comment)
+        self.assertNotIn('parent', form_class.base_fields)
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        blog_cache.local.clear()
+        self.calls = 0
+
+    def compute(self, value='fresh'):
+        def compute():
+            self.calls += 1
+            return value
+        return compute
+
+    def test_bump_invalidates_both_tiers(self):
+        self.assertEqual(blog_cache.get_or_compute('facets', self.compute('old'), namespaces=['post']), 'old')
+        blog_cache.local.clear()
+        self.assertEqual(blog_cache.get_or_compute('facets', self.compute('old'), namespaces=['post']), 'old')
+        self.assertEqual(self.calls, 1)
+        blog_cache.bump('post')
+        self.assertEqual(blog_cache.get_or_compute('facets', self.compute('new'), namespaces=['post']), 'new')
+        blog_cache.local.clear()
+        self.assertEqual(blog_cache.get_or_compute('facets', self.compute('new'), namespaces=['post']), 'new')
+        self.assertEqual(self.calls, 2)
+
+    def test_one_caller_recomputes_the_others_wait(self):
+        def slow():
+            self.calls += 1
+            time.sleep(0.2)
+            return 'fresh'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(blog_cache.get_or_compute('slow', slow)))
+            for _number in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['fresh'] * 4)
+
+    @override_settings(BLOG_CACHE_STALE_GRACE=60)
+    def test_stale_value_served_while_locked(self):
+        full_key = blog_cache.make_key('trending')
+        cache.set(full_key, ('stale', time.time() - 1, 0.01), 60)
+        cache.add(f'{full_key}:lock', 'other-worker', 10)
+        self.assertEqual(blog_cache.get_or_compute('trending', self.compute()), 'stale')
+        self.assertEqual(self.calls, 0)
+
+    def test_lock_taken_over_after_timeout_is_kept(self):
+        full_key = blog_cache.make_key('slow')
+
+        def overrun():
+            # Our lock expired and another worker took it
+            cache.set(f'{full_key}:lock', 'other-worker', 10)
+            return 'fresh'
+
+        self.assertEqual(blog_cache.get_or_compute('slow', overrun), 'fresh')
+        self.assertEqual(cache.get(f'{full_key}:lock'), 'other-worker')
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name, BLOG_MEDIA_ACCEL=None)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.root = Path(media_root.name)
+        (self.root / 'posts').mkdir()
+        self.content = bytes(range(100))
+        (self.root / 'posts' / 'photo.jpg').write_bytes(self.content)
+        self.factory = RequestFactory()
+
+    def get(self, path, user=None, **headers):
+        request = self.factory.get(f'/media/{path}', **headers)
+        request.user = user or AnonymousUser()
+        response = serve_media(request, path)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_etag_revalidation(self):
+        response = self.get('posts/photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        response = self.get('posts/photo.jpg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.get('posts/photo.jpg', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(self.body(response), self.content[10:20])
+        response = self.get('posts/photo.jpg', HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.body(response), self.content[-5:])
+        response = self.get('posts/photo.jpg', HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_suffix_range_of_empty_file_is_unsatisfiable(self):
+        (self.root / 'posts' / 'empty.jpg').write_bytes(b'')
+        response = self.get('posts/empty.jpg', HTTP_RANGE='bytes=-5')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_if_range(self):
+        etag = self.get('posts/photo.jpg')['ETag']
+        response = self.get('posts/photo.jpg', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.get('posts/photo.jpg', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"another-version"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_draft_post_image_is_hidden_from_others(self):
+        author = User.objects.create_user('photographer', password='unused-password')
+        Post.objects.create(
+            title='Draft', slug='draft', author=author, content='Body', status='draft', image='posts/photo.jpg',
+        )
+        with self.assertRaises(Http404):
+            self.get('posts/photo.jpg')
+        response = self.get('posts/photo.jpg', user=author)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+
+class MediaBlobTests(TestCase):
+    PHOTO = 'blobs/aa/aa/photo.jpg'
+    OTHER = 'blobs/bb/bb/other.jpg'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('uploader', password='unused-password')
+
+    def post(self, slug, image):
+        return Post.objects.create(title=slug, slug=slug, author=self.author, content='Body', image=image)
+
+    def refcounts(self):
+        return dict(MediaBlob.objects.values_list('name', 'refcount'))
+
+    def test_references_follow_image_changes_and_deletes(self):
+        first = self.post('first', self.PHOTO)
+        second = self.post('second', self.PHOTO)
+        self.assertEqual(self.refcounts(), {self.PHOTO: 2})
+        first.image = self.OTHER
+        first.save()
+        self.assertEqual(self.refcounts(), {self.PHOTO: 1, self.OTHER: 1})
+        second.delete()
+        self.assertEqual(self.refcounts(), {self.PHOTO: 0, self.OTHER: 1})
+
+    def test_recount_corrects_drift(self):
+        self.post('first', self.PHOTO)
+        long_ago = timezone.now() - timedelta(days=2)
+        MediaBlob.objects.update(refcount=5, updated_at=long_ago)
+        MediaBlob.objects.create(name=self.OTHER, refcount=3, updated_at=long_ago)
+        self.assertEqual(MediaBlob.recount(), 1)
+        self.assertEqual(self.refcounts(), {self.PHOTO: 1, self.OTHER: 0})
+        self.assertFalse(MediaBlob.objects.filter(updated_at=long_ago).exists())
+
+    def test_prune_spares_recent_blobs(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        with override_settings(MEDIA_ROOT=media_root.name):
+            old = default_storage.save('posts/old.jpg', ContentFile(b'old'))
+            recent = default_storage.save('posts/recent.jpg', ContentFile(b'recent'))
+            long_ago = time.time() - 2 * 86400
+            os.utime(default_storage.path(old), (long_ago, long_ago))
+            MediaBlob.objects.create(name=old, refcount=0, updated_at=timezone.now() - timedelta(days=2))
+            MediaBlob.objects.create(name=recent, refcount=0)
+            call_command('dedupe_media', '--prune', stdout=StringIO())
+            self.assertFalse(default_storage.exists(old))
+            self.assertTrue(default_storage.exists(recent))
+        self.assertEqual(list(MediaBlob.objects.values_list('name', flat=True)), [recent])
+
+
+class AuthorStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('counted', password='unused-password')
+        cls.reader = User.objects.create_user('counter', password='unused-password')
+        cls.post = Post.objects.create(title='Counted', slug='counted', author=cls.author, content='Body')
+
+    def tearDown(self):
+        analytics.flush()
+
+    def assertStats(self, published_posts, total_views, total_comments):
+        stats = AuthorStats.objects.get(user=self.author)
+        expected = {
+            'published_posts': published_posts, 'total_views': total_views, 'total_comments': total_comments,
+        }
+        self.assertEqual({field: getattr(stats, field) for field in expected}, expected)
+        self.assertEqual(AuthorStats.compute_totals(self.author.pk), expected)
+
+    def admin_request(self):
+        request = RequestFactory().post('/admin/')
+        request.user = User.objects.create_superuser('admin', password='unused-password')
+        return request
+
+    def test_publish_and_unpublish(self):
+        self.post.status = 'published'
+        self.post.save()
+        self.assertStats(1, 0, 0)
+        self.post.status = 'draft'
+        self.post.save()
+        self.assertStats(0, 0, 0)
+
+    def test_views(self):
+        self.post.views = 3
+        self.post.save(update_fields=['views'])
+        self.assertStats(0, 3, 0)
+        analytics.record_event(self.post.pk, PostEvent.VIEW)
+        analytics.record_event(self.post.pk, PostEvent.VIEW)
+        analytics.flush()
+        self.assertStats(0, 5, 0)
+
+    def test_comment_hide_and_approve(self):
+        comment = Comment.objects.create(post=self.post, author=self.reader, content='Hello')
+        self.assertStats(0, 0, 1)
+        comment.active = False
+        comment.save()
+        self.assertStats(0, 0, 0)
+        comment.active = True
+        comment.save()
+        self.assertStats(0, 0, 1)
+        comment.delete()
+        self.assertStats(0, 0, 0)
+
+    def test_admin_queryset_actions(self):
+        Comment.objects.create(post=self.post, author=self.reader, content='Hello')
+        request = self.admin_request()
+        post_admin, comment_admin = site._registry[Post], site._registry[Comment]
+        with mock.patch.object(post_admin, 'message_user'), mock.patch.object(comment_admin, 'message_user'):
+            post_admin.publish_posts(request, Post.objects.all())
+            self.assertStats(1, 0, 1)
+            comment_admin.hide_comments(request, Comment.objects.all())
+            self.assertStats(1, 0, 0)
+            comment_admin.approve_comments(request, Comment.objects.all())
+            self.assertStats(1, 0, 1)
+            post_admin.unpublish_posts(request, Post.objects.all())
+            self.assertStats(0, 0, 1)
+
+
+@override_settings(
+    BLOG_TRENDING_HALF_LIFE_HOURS=1, BLOG_TRENDING_VIEW_WEIGHT=2.0, BLOG_TRENDING_COMMENT_WEIGHT=10.0,
+    BLOG_TRENDING_MIN_SCORE=0.01,
+)
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('trendy', password='unused-password')
+        cls.posts = [
+            Post.objects.create(title=f'Trend {number}', slug=f'trend-{number}', author=author,
+                                content='Body', status='published')
+            for number in range(2)
+        ]
+
+    def update_trending(self):
+        call_command('update_trending', stdout=StringIO())
+
+    def age(self, hours):
+        TrendingScore.objects.update(decayed_at=timezone.now() - timedelta(hours=hours))
+
+    def test_fold_weights_and_decays(self):
+        post = self.posts[0]
+        TrendingScore.record(post.pk, views=3, comments=1)
+        self.update_trending()
+        self.assertAlmostEqual(TrendingScore.objects.get(post=post).score, 3 * 2.0 + 10.0)
+        self.age(1)
+        TrendingScore.record(post.pk, views=1)
+        self.update_trending()
+        score = TrendingScore.objects.get(post=post)
+        self.assertAlmostEqual(score.score, 16.0 / 2 + 2.0, places=3)
+        self.assertEqual((score.pending_views, score.pending_comments), (0, 0))
+
+    def test_scores_below_the_minimum_are_dropped(self):
+        kept, dropped = self.posts
+        TrendingScore.objects.create(post=kept, score=5.0)
+        TrendingScore.objects.create(post=dropped, score=0.015)
+        self.age(1)
+        self.update_trending()
+        self.assertEqual(list(TrendingScore.objects.values_list('post_id', flat=True)), [kept.pk])
+
+
+@override_settings(BLOG_RATELIMIT_ENABLED=True, BLOG_RATE_LIMITS={'tag_create': '2/m'})
+class RateLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tagger-limited', password='unused-password')
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def create_tag(self, address='10.0.0.1', user=None, **headers):
+        request = self.factory.post('/tags/autocomplete/', {'name': 'Limited'}, REMOTE_ADDR=address, **headers)
+        request.user = user or self.user
+        return tag_autocomplete_view(request)
+
+    def test_over_limit_gets_429_with_retry_after(self):
+        self.assertEqual(self.create_tag().status_code, 201)
+        self.assertEqual(self.create_tag().status_code, 200)
+        response = self.create_tag()
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+        # Searching is not limited
+        request = self.factory.get('/tags/autocomplete/', {'q': 'Lim'}, REMOTE_ADDR='10.0.0.1')
+        request.user = self.user
+        self.assertEqual(tag_autocomplete_view(request).status_code, 200)
+
+    def test_limits_also_apply_per_user(self):
+        self.create_tag('10.0.0.1')
+        self.create_tag('10.0.0.2')
+        self.assertEqual(self.create_tag('10.0.0.3').status_code, 429)
+
+    @override_settings(BLOG_RATELIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_client_address_from_the_proxy_header(self):
+        users = [User.objects.create_user(f'proxied{number}', password='unused-password') for number in range(4)]
+        # Same proxy address; the last forwarded entry tells the clients apart
+        for user in users[:2]:
+            self.create_tag('10.0.0.9', user, HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.5')
+        forged = self.create_tag('10.0.0.9', users[2], HTTP_X_FORWARDED_FOR='198.51.100.7, 203.0.113.5')
+        self.assertEqual(forged.status_code, 429)
+        other = self.create_tag('10.0.0.9', users[3], HTTP_X_FORWARDED_FOR='203.0.113.6')
+        self.assertNotEqual(other.status_code, 429)
+
+    def test_forwarded_header_ignored_without_a_proxy(self):
+        users = [User.objects.create_user(f'direct{number}', password='unused-password') for number in range(3)]
+        for number, user in enumerate(users[:2]):
+            self.create_tag('10.0.0.1', user, HTTP_X_FORWARDED_FOR=f'203.0.113.{number}')
+        response = self.create_tag('10.0.0.1', users[2], HTTP_X_FORWARDED_FOR='203.0.113.9')
+        self.assertEqual(response.status_code, 429)
+
+
+class AnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('analysed', password='unused-password')
+        cls.posts = [
+            Post.objects.create(title=f'Stats {number}', slug=f'stats-{number}', author=cls.author,
+                                content='Body', status='published')
+            for number in range(2)
+        ]
+
+    def test_flush_writes_one_batch(self):
+        for post in self.posts:
+            for _number in range(3):
+                analytics.record_event(post.pk, PostEvent.VIEW)
+        analytics.record_event(self.posts[0].pk, PostEvent.COMMENT)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(analytics.flush(), 7)
+        statements = [query['sql'] for query in queries.captured_queries]
+        insert = f'INSERT INTO {connection.ops.quote_name(PostEvent._meta.db_table)}'
+        update = f'UPDATE {connection.ops.quote_name(Post._meta.db_table)} '
+        self.assertEqual(sum(sql.startswith(insert) for sql in statements), 1)
+        self.assertEqual(sum(sql.startswith(update) for sql in statements), 1)
+        self.assertEqual(PostEvent.objects.count(), 7)
+        self.assertEqual(sorted(Post.objects.values_list('views', flat=True)), [3, 3])
+        self.assertEqual(AuthorStats.objects.get(user=self.author).total_views, 6)
+        self.assertEqual(sorted(TrendingScore.objects.values_list('pending_views', flat=True)), [3, 3])
+
+    @override_settings(BLOG_ANALYTICS_RETENTION_DAYS=30)
+    def test_rollup_counts_days_and_deletes_expired_events(self):
+        post = self.posts[0]
+        now = timezone.now()
+        PostEvent.objects.bulk_create([
+            PostEvent(post=post, kind=PostEvent.VIEW, created_at=now),
+            PostEvent(post=post, kind=PostEvent.VIEW, created_at=now),
+            PostEvent(post=post, kind=PostEvent.COMMENT, created_at=now),
+            PostEvent(post=post, kind=PostEvent.VIEW, created_at=now - timedelta(days=1)),
+            PostEvent(post=post, kind=PostEvent.VIEW, created_at=now - timedelta(days=31)),
+        ])
+        call_command('rollup_analytics', stdout=StringIO())
+        today = timezone.localdate(now)
+        self.assertEqual(
+            sorted(PostDailyStats.objects.values_list('post_id', 'day', 'views', 'comments')),
+            [(post.pk, today - timedelta(days=1), 1, 0), (post.pk, today, 2, 1)],
+        )
+        self.assertEqual(PostEvent.objects.count(), 4)
+        self.assertFalse(PostEvent.objects.filter(created_at__lt=now - timedelta(days=30)).exists())
+
+
+@override_settings(BLOG_ADMIN_COUNT_CAP=3)
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('listing', password='unused-password')
+        cls.news = Category.objects.create(name='News', slug='news')
+        other = Category.objects.create(name='Other', slug='other')
+        for number in range(6):
+            Post.objects.create(
+                title=f'Listed {number}', slug=f'listed-{number}', author=cls.staff, content='Body',
+                status='published', category=cls.news if number % 2 else other,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_filtered_count_stops_a_page_past_the_cap(self):
+        published = Post.objects.filter(status='published').order_by('-id')
+        paginator = EstimatedCountPaginator(published, 2)
+        self.assertEqual(paginator.count, 5)
+        self.assertTrue(paginator.truncated)
+        self.assertEqual(paginator.num_pages, 3)
+        last = EstimatedCountPaginator(published, 2, page=3)
+        self.assertEqual(last.count, 6)
+        self.assertFalse(last.truncated)
+        self.assertEqual(len(last.page(3)), 2)
+
+    def test_changelist_links_past_the_cap(self):
+        with mock.patch.object(PostAdmin, 'list_per_page', 2):
+            response = self.client.get('/admin/blog/post/', {'status__exact': 'published'})
+            self.assertContains(response, 'More than 3 posts')
+            self.assertContains(response, 'p=3')
+            response = self.client.get('/admin/blog/post/', {'status__exact': 'published', 'p': 3})
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        self.assertContains(response, '6 posts')
+
+    def test_autocomplete_filter(self):
+        response = self.client.get('/admin/blog/post/', {'category__id__exact': self.news.pk})
+        self.assertContains(response, 'id="autocomplete_filter_category"')
+        self.assertContains(response, 'id="autocomplete_filter_tags"')
+        self.assertEqual({post.category_id for post in response.context['cl'].result_list}, {self.news.pk})
+        self.assertEqual(response.context['cl'].result_count, 3)
@@ -0,0 +1,82 @@
+"""
+Threaded comments.
+
+Comment.path orders a post's comments depth-first, so a page of threads is
+two queries besides the count: the page of top-level comments (newest
+thread first), then every comment between the first and last of their
+paths, one range scan of the (post, path) index. build_tree() links the rows into nested
+``thread_replies`` lists in a single pass.
+"""
+
+from django.conf import settings
+from django.core.paginator import Paginator
+
+from .models import Comment
+
+# Sorts after any digit, so path + PATH_END bounds a whole subtree
+PATH_END = '~'
+
+
+def build_tree(comments):
+    """Top-level comments of ``comments`` (in path order), each with its
+    replies in ``thread_replies``
+
+    A comment whose parent is missing (hidden, or outside the rows) is
+    dropped together with its replies.
+    """
+    nodes = {}
+    roots = []
+    for comment in comments:
+        comment.thread_replies = []
+        if comment.parent_id is None:
+            roots.append(comment)
+        elif comment.parent_id in nodes:
+            nodes[comment.parent_id].thread_replies.append(comment)
+        else:
+            continue
+        nodes[comment.pk] = comment
+    return roots
+
+
+def comment_threads(post, page_number=None, per_page=None, thread_count=None):
+    """One page of a post's active comment threads, newest thread first
+
+    Returns ``(page, threads)``: the Paginator page of top-level comments,
+    and the same comments with their replies attached. Pass
+    ``thread_count`` when the number of threads is already known to save
+    the paginator's COUNT query.
+    """
+    per_page = per_page or getattr(settings, 'BLOG_COMMENT_THREADS_PER_PAGE', 10)
+    roots = Comment.objects.filter(post=post, depth=0, active=True).order_by('-created_at', '-id')
+    paginator = Paginator(roots.only('id', 'path'), per_page)
+    if thread_count is not None:
+        paginator.count = thread_count
+    page = paginator.get_page(page_number)
+    paths = [comment.path for comment in page]
+    if not paths:
+        return page, []
+    comments = (
+        Comment.objects.filter(post=post, active=True, path__gte=min(paths), path__lt=max(paths) + PATH_END)
+        .select_related('author').order_by('path')
+    )
+    order = {path: position for position, path in enumerate(paths)}
+    # Roots from other pages can sit inside the range; keep this page's only
+    threads = [root for root in build_tree(comments) if root.path in order]
+    threads.sort(key=lambda root: order[root.path])
+    return page, threads
+
+
+def reply_target(parent):
+    """The comment a reply to ``parent`` is attached to
+
+    Replies deeper than BLOG_COMMENT_MAX_DEPTH go under the deepest allowed
+    ancestor instead, as its siblings.
+    """
+    max_depth = getattr(settings, 'BLOG_COMMENT_MAX_DEPTH', 5)
+    if parent is None or max_depth <= 1:
+        return None
+    if parent.depth < max_depth - 1:
+        return parent
+    step = Comment.PATH_STEP
+    ancestor_id = int(parent.path[(max_depth - 2) * step:(max_depth - 1) * step])
+    return Comment.objects.get(pk=ancestor_id)
@@ -0,0 +1,257 @@
+"""
+JSONL export and import of posts.
+
+Each line is one post: its fields, ``author`` as a username, ``category``
+and ``tags`` as ``{"name", "slug"}`` objects. export_lines() streams a
+queryset through iterator(), so memory stays flat however many posts there
+are; import_lines() reads a stream of lines and writes them in batches:
+categories and tags are upserted with one bulk INSERT each, posts and their
+tag links with bulk_create.
+
+bulk_create skips Post.save() and the model signals, so import_lines()
+renders the Markdown itself and afterwards rebuilds what the signals would
+have kept current (author stats, the archive rollup, cached pages). No
+revisions are recorded for imported posts and images are not carried over.
+"""
+
+import json
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_slug
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+
+from .cache import bump
+from .markup import render_hash, render_markdown
+from .models import AuthorStats, Category, MonthlyPostCount, Post, Tag
+
+EXPORT_FIELDS = ['title', 'slug', 'content', 'status', 'created_at', 'updated_at', 'published_at', 'views']
+# Written as they are on update; created_at etc. are applied separately
+UPDATE_FIELDS = ['title', 'content', 'content_html', 'content_hash', 'status', 'views', 'category', 'author']
+DATE_FIELDS = ['created_at', 'updated_at', 'published_at']
+STATUSES = {value for value, _label in Post.STATUS_CHOICES}
+
+
+def export_queryset(include_drafts=False):
+    posts = Post.objects.all() if include_drafts else Post.published.all()
+    return (
+        posts.select_related('author', 'category').prefetch_related('tags')
+        .defer('content_html', 'content_hash', 'image').order_by('id')
+    )
+
+
+def post_record(post):
+    record = {field: getattr(post, field) for field in EXPORT_FIELDS}
+    for field in DATE_FIELDS:
+        record[field] = record[field].isoformat() if record[field] else None
+    record['author'] = post.author.username
+    record['category'] = {'name': post.category.name, 'slug': post.category.slug} if post.category else None
+    record['tags'] = [{'name': tag.name, 'slug': tag.slug} for tag in post.tags.all()]
+    return record
+
+
+def export_lines(queryset, chunk_size=500):
+    """JSON lines for the posts of ``queryset``, fetched ``chunk_size`` at a time"""
+    for post in queryset.iterator(chunk_size=chunk_size):
+        yield json.dumps(post_record(post), ensure_ascii=False) + '\n'
+
+
+def _datetime(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'Invalid date: {value!r}')
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def _upsert_named(model, entries):
+    """Ids of ``entries`` ({slug: name}) after inserting the missing ones, by slug"""
+    if not entries:
+        return {}
+    model.objects.bulk_create(
+        [model(slug=slug, name=name) for slug, name in entries.items()], ignore_conflicts=True
+    )
+    ids = dict(model.objects.filter(slug__in=entries).values_list('slug', 'id'))
+    # A row with the same name under another slug blocked the insert: use it
+    missing = {name: slug for slug, name in entries.items() if slug not in ids}
+    if missing:
+        for name, pk in model.objects.filter(name__in=missing).values_list('name', 'id'):
+            ids[missing[name]] = pk
+    return ids
+
+
+def _text(model, field_name, value):
+    """``value`` if it is a non-empty string that fits ``model.field_name``"""
+    max_length = model._meta.get_field(field_name).max_length
+    if not isinstance(value, str) or not value or (max_length and len(value) > max_length):
+        raise ValueError(f'Invalid {model._meta.model_name} {field_name}: {value!r}')
+    return value
+
+
+def _named(model, entry):
+    """``(slug, name)`` of an exported category or tag"""
+    if not isinstance(entry, dict):
+        raise ValueError(f'Invalid {model._meta.model_name}: {entry!r}')
+    slug = _text(model, 'slug', entry.get('slug'))
+    validate_slug(slug)
+    return slug, _text(model, 'name', entry.get('name') or slug)
+
+
+def _parse(record):
+    """An unsaved Post, without author and category, from one exported record"""
+    title = _text(Post, 'title', record['title'])
+    slug = _text(Post, 'slug', record.get('slug') or slugify(title))
+    validate_slug(slug)
+    if not isinstance(record['content'], str):
+        raise ValueError('Invalid content')
+    status = record.get('status', 'draft')
+    if status not in STATUSES:
+        raise ValueError(f'Invalid status: {status!r}')
+    views = int(record.get('views') or 0)
+    # The range every backend accepts for a PositiveIntegerField
+    if not 0 <= views <= 2147483647:
+        raise ValueError(f'Invalid views: {views!r}')
+    author = record.get('author')
+    if author is not None:
+        _text(User, 'username', author)
+    now = timezone.now()
+    post = Post(
+        title=title,
+        slug=slug,
+        content=record['content'],
+        status=status,
+        views=views,
+        created_at=_datetime(record.get('created_at')) or now,
+        updated_at=_datetime(record.get('updated_at')) or now,
+        published_at=_datetime(record.get('published_at')),
+    )
+    if post.status == 'published' and not post.published_at:
+        post.published_at = post.created_at
+    post.author_username = author
+    post.category_entry = _named(Category, record['category']) if record.get('category') else None
+    post.tag_entries = [_named(Tag, tag) for tag in record.get('tags') or []]
+    return post
+
+
+def _import_batch(batch, update, default_author, stats, errors, touched):
+    posts, tag_slugs = {}, {}
+    categories, tags, usernames = {}, {}, set()
+    for line_number, record in batch:
+        try:
+            post = _parse(record)
+        except (AttributeError, KeyError, TypeError, ValueError, ValidationError) as exc:
+            errors.append(f'line {line_number}: {exc!r}')
+            continue
+        if post.slug in posts:
+            stats['skipped'] += 1
+            continue
+        post.category_slug = None
+        if post.category_entry:
+            post.category_slug, name = post.category_entry
+            categories[post.category_slug] = name
+        for tag_slug, name in post.tag_entries:
+            tags[tag_slug] = name
+        tag_slugs[post.slug] = [tag_slug for tag_slug, _name in post.tag_entries]
+        usernames.add(post.author_username)
+        posts[post.slug] = post
+
+    with transaction.atomic():
+        category_ids = _upsert_named(Category, categories)
+        tag_ids = _upsert_named(Tag, tags)
+        author_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        existing = {
+            slug: (pk, author_id, created_at)
+            for slug, pk, author_id, created_at in Post.objects.filter(slug__in=posts).values_list(
+                'slug', 'id', 'author_id', 'created_at'
+            )
+        }
+
+        new, changed = [], []
+        for slug, post in posts.items():
+            author_id = author_ids.get(post.author_username, default_author.pk if default_author else None)
+            if author_id is None:
+                errors.append(f'{slug}: unknown author {post.author_username!r}')
+                continue
+            if slug in existing and not update:
+                stats['skipped'] += 1
+                continue
+            post.author_id = author_id
+            post.category_id = category_ids.get(post.category_slug)
+            post.content_html = render_markdown(post.content)
+            post.content_hash = render_hash(post.content)
+            if slug in existing:
+                post.pk, old_author_id, old_created_at = existing[slug]
+                touched['authors'].add(old_author_id)
+                touched['months'].add(timezone.localtime(old_created_at).date().replace(day=1))
+                changed.append(post)
+            else:
+                new.append(post)
+
+        # created_at/updated_at are auto fields that bulk_create would
+        # overwrite; bulk_update writes them as given
+        dates = {post.slug: [getattr(post, field) for field in DATE_FIELDS] for post in new}
+        Post.objects.bulk_create(new)
+        for slug, pk in Post.objects.filter(slug__in=dates).values_list('slug', 'id'):
+            posts[slug].pk = pk
+        for post in new:
+            for field, value in zip(DATE_FIELDS, dates[post.slug]):
+                setattr(post, field, value)
+        Post.objects.bulk_update(new, DATE_FIELDS)
+        if changed:
+            Post.objects.bulk_update(changed, UPDATE_FIELDS + DATE_FIELDS)
+            Post.tags.through.objects.filter(post_id__in=[post.pk for post in changed]).delete()
+
+        links = [
+            Post.tags.through(post_id=post.pk, tag_id=tag_ids[tag_slug])
+            for post in new + changed
+            for tag_slug in tag_slugs[post.slug]
+            if tag_slug in tag_ids
+        ]
+        Post.tags.through.objects.bulk_create(links, ignore_conflicts=True)
+
+    stats['created'] += len(new)
+    stats['updated'] += len(changed)
+    stats['tag_links'] += len(links)
+    for post in new + changed:
+        touched['authors'].add(post.author_id)
+        touched['months'].add(timezone.localtime(post.created_at).date().replace(day=1))
+
+
+def import_lines(lines, batch_size=500, update=False, default_author=None):
+    """Import JSON lines; returns ``(stats, errors)``: a Counter of created,
+    updated and skipped posts and tag links, and a message per failed line
+
+    Every field of a line is checked, including the slug and name lengths
+    of its category and tags, before it joins a batch; a bad line is
+    reported and skipped without failing the batch. Posts whose slug exists
+    are skipped, or overwritten with ``update``.
+    Authors are matched by username; unknown ones fall back to
+    ``default_author`` or fail their post.
+    """
+    stats, errors = Counter(), []
+    touched = {'authors': set(), 'months': set()}
+    batch = []
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            batch.append((line_number, json.loads(line)))
+        except ValueError as exc:
+            errors.append(f'line {line_number}: {exc}')
+            continue
+        if len(batch) == batch_size:
+            _import_batch(batch, update, default_author, stats, errors, touched)
+            batch = []
+    if batch:
+        _import_batch(batch, update, default_author, stats, errors, touched)
+
+    if stats['created'] or stats['updated']:
+        AuthorStats.recompute_many(touched['authors'])
+        MonthlyPostCount.rebuild(touched['months'])
+        bump('post', 'tag', 'category')
+    return stats, errors
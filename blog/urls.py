@@ -7,14 +7,24 @@ urlpatterns = [
     # Home/Landing page
     path('', views.home_view, name='home'),
     path('posts/', views.PostListView.as_view(), name='post_list'),
+    path('posts/export.jsonl', views.export_posts_view, name='export_posts'),
     path('post/create/', views.post_create_view, name='post_create'),  # Must come before slug pattern
     path('post/<slug:slug>/update/', views.post_update_view, name='post_update'),
     path('post/<slug:slug>/delete/', views.post_delete_view, name='post_delete'),
+    path('post/<slug:slug>/revisions/', views.post_revisions_view, name='post_revisions'),
+    path('post/<slug:slug>/revisions/<int:number>/', views.post_revision_detail_view, name='post_revision_detail'),
+    path('post/<slug:slug>/stats/', views.post_stats_view, name='post_stats'),
     path('post/<slug:slug>/', views.PostDetailView.as_view(), name='post_detail'),
     path('my-posts/', views.my_posts_view, name='my_posts'),
+    path('my-posts/stats/', views.my_posts_stats_view, name='my_posts_stats'),
+
+    # Date archive
+    path('archive/<int:year>/', views.archive_year_view, name='archive_year'),
+    path('archive/<int:year>/<int:month>/', views.archive_month_view, name='archive_month'),
     
     # Category and Tag URLs
     path('category/<slug:slug>/', views.category_detail_view, name='category_detail'),
+    path('tags/autocomplete/', views.tag_autocomplete_view, name='tag_autocomplete'),
     path('tag/<slug:slug>/', views.tag_detail_view, name='tag_detail'),
     
     # Profile URLs
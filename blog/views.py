@@ -1,19 +1,42 @@
+from datetime import date
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import login, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.auth.views import LoginView, PasswordResetView, PasswordResetDoneView, PasswordResetConfirmView, PasswordResetCompleteView
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Case, When, IntegerField
+from django.db import transaction, IntegrityError
+from django.db.models import Q, Count
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
+from django.utils.text import slugify
+from django.views.decorators.http import require_http_methods
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from .models import Post, Comment, Category, Tag, UserProfile
-from .forms import UserRegistrationForm, PostForm, CommentForm, UserProfileForm
+from .models import (
+    Post, Comment, Category, Tag, UserProfile, AuthorStats, MonthlyPostCount, PostEvent, PostDailyStats, month_range,
+)
+from .forms import UserRegistrationForm, PostForm, CommentForm, UserProfileForm, QueuedPasswordResetForm
+from .bitmap import Bitmap
+from .paginators import KeysetPage
+from .post_index import get_post_index, IndexedPostList
+from .tag_index import get_tag_index
+from .revisions import get_revision_content
+from .cache import get_or_compute
+from .markup import render_markdown
+from .ratelimit import ratelimit
+from .facets import get_facets, parse_month
+from .analytics import record_event
+from .detail import detail_context, detail_queryset
+from .transfer import export_lines, export_queryset
 
 
 # Authentication Views
+@ratelimit('register')
 def register_view(request):
     if request.user.is_authenticated:
         return redirect('blog:post_list')
@@ -30,6 +53,7 @@ def register_view(request):
     return render(request, 'blog/register.html', {'form': form})
 
 
+@method_decorator(ratelimit('login'), name='post')
 class CustomLoginView(LoginView):
     template_name = 'blog/login.html'
     redirect_authenticated_user = True
@@ -45,8 +69,10 @@ def logout_view(request):
     return redirect('blog:post_list')
 
 
+@method_decorator(ratelimit('password_reset'), name='post')
 class CustomPasswordResetView(PasswordResetView):
     template_name = 'blog/password_reset.html'
+    form_class = QueuedPasswordResetForm
     email_template_name = 'blog/password_reset_email.html'
     subject_template_name = 'blog/password_reset_subject.txt'
     success_url = reverse_lazy('password_reset_done')
@@ -68,7 +94,11 @@ class CustomPasswordResetCompleteView(PasswordResetCompleteView):
 # Blog Views
 def home_view(request):
     """Landing page with hero section and features"""
-    latest_posts = Post.published.select_related('author', 'category').prefetch_related('tags')[:3]
+    latest_posts = get_or_compute(
+        'home:latest_posts',
+        lambda: list(Post.published.select_related('author', 'category').prefetch_related('tags')[:3]),
+        namespaces=('post', 'category', 'tag'),
+    )
     return render(request, 'blog/home.html', {'latest_posts': latest_posts})
 
 class PostListView(ListView):
@@ -78,65 +108,58 @@ class PostListView(ListView):
     paginate_by = 6
 
     def get_queryset(self):
-        queryset = Post.published.all()
-        
+        # Filters are resolved against the in-memory post index; only the
+        # current page of posts is loaded from the database.
+        category_slugs = self.request.GET.getlist('category')
+        tag_slugs = self.request.GET.getlist('tag')
+        match_all_tags = self.request.GET.get('tag_mode') == 'all'
+        usernames = self.request.GET.getlist('author')
+        author_ids = []
+        if usernames:
+            author_ids = list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+        months = [parse_month(value) for value in self.request.GET.getlist('month')]
+        post_ids = get_post_index().filter(
+            categories=category_slugs, tags=tag_slugs, match_all_tags=match_all_tags,
+            authors=author_ids, months=months,
+        )
+        if usernames and not author_ids:
+            post_ids = Bitmap()
+
         # Search functionality
         search_query = self.request.GET.get('search')
         if search_query:
-            queryset = queryset.filter(
+            matches = Post.published.filter(
                 Q(title__icontains=search_query) |
                 Q(content__icontains=search_query) |
                 Q(tags__name__icontains=search_query)
-            ).distinct()
-        
-        # Category filter
-        category_slug = self.request.GET.get('category')
-        if category_slug:
-            queryset = queryset.filter(category__slug=category_slug)
-        
-        # Tag filter
-        tag_slug = self.request.GET.get('tag')
-        if tag_slug:
-            queryset = queryset.filter(tags__slug=tag_slug)
-        
-        return queryset.select_related('author', 'category').prefetch_related('tags').annotate(
+            ).values_list('id', flat=True).distinct()
+            post_ids = post_ids & Bitmap(matches)
+        self.post_ids = post_ids
+
+        queryset = Post.published.select_related('author', 'category').prefetch_related('tags').annotate(
             comment_count=Count('comments')
         )
+        return IndexedPostList(post_ids, queryset)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Get all categories with published post count, exclude empty slugs
-        # Count only published posts
-        context['categories'] = Category.objects.exclude(
-            slug=''
-        ).exclude(
-            slug__isnull=True
-        ).annotate(
-            post_count=Count(
-                Case(
-                    When(posts__status='published', then=1),
-                    output_field=IntegerField()
-                ),
-                distinct=True
-            )
-        ).order_by('name')
-        # Get all tags with published post count, exclude empty slugs
-        context['tags'] = Tag.objects.exclude(
-            slug=''
-        ).exclude(
-            slug__isnull=True
-        ).annotate(
-            post_count=Count(
-                Case(
-                    When(posts__status='published', then=1),
-                    output_field=IntegerField()
-                ),
-                distinct=True
-            )
-        ).order_by('name')[:10]
-        context['popular_posts'] = Post.published.annotate(
-            comment_count=Count('comments')
-        ).order_by('-comment_count', '-created_at')[:5]
+        # Category, tag, author and month counts within the current results
+        context['facets'] = get_facets(self.request.GET, self.post_ids)
+        context['popular_posts'] = get_or_compute(
+            'popular_posts', lambda: list(Post.custom.published().popular()[:5]), timeout=60, namespaces=('post',)
+        )
+        context['archive_months'] = recent_archive_months()
+        context['selected_tags'] = self.request.GET.getlist('tag')
+        context['tag_mode'] = self.request.GET.get('tag_mode', 'any')
+        # Current filters, kept by the search form and pagination links
+        filters = self.request.GET.copy()
+        filters.pop('page', None)
+        context['filter_query'] = filters.urlencode()
+        context['filter_params'] = [
+            (name, value)
+            for name in ('category', 'tag', 'author', 'month')
+            for value in filters.getlist(name)
+        ]
         return context
 
 
@@ -148,29 +171,24 @@ class PostDetailView(DetailView):
     slug_url_kwarg = 'slug'
 
     def get_queryset(self):
-        return Post.objects.select_related('author', 'category').prefetch_related('tags', 'comments__author')
+        return detail_queryset()
 
-    def get_context_data(self, **kwargs):
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        # Buffered; the counter itself is written on the next analytics flush
+        record_event(self.object.pk, PostEvent.VIEW)
+        self.object.views += 1
+        return self.render_to_response(self.get_context_data())
+
+    def get_context_data(self, comment_form=None, **kwargs):
         context = super().get_context_data(**kwargs)
-        post = self.get_object()
-        
-        # Increment views
-        post.increment_views()
-        
-        # Get comments
-        context['comments'] = post.comments.filter(active=True)
-        context['comment_form'] = CommentForm()
-        
-        # Related posts
-        context['related_posts'] = Post.published.filter(
-            category=post.category
-        ).exclude(id=post.id)[:3]
-        
+        context.update(detail_context(self.object, self.request.GET.get('comments'), comment_form))
         return context
 
+    @method_decorator(ratelimit('comment'))
     def post(self, request, *args, **kwargs):
-        post = self.get_object()
-        comment_form = CommentForm(request.POST)
+        self.object = post = self.get_object()
+        comment_form = CommentForm(request.POST, post=post)
         
         if comment_form.is_valid():
             comment = comment_form.save(commit=False)
@@ -180,9 +198,7 @@ class PostDetailView(DetailView):
             messages.success(request, 'Your comment has been added successfully!')
             return redirect('blog:post_detail', slug=post.slug)
         
-        context = self.get_context_data()
-        context['comment_form'] = comment_form
-        return render(request, self.template_name, context)
+        return self.render_to_response(self.get_context_data(comment_form=comment_form))
 
 
 @login_required
@@ -238,13 +254,94 @@ def post_delete_view(request, slug):
     return render(request, 'blog/post_confirm_delete.html', {'post': post})
 
 
+@login_required
+def post_revisions_view(request, slug):
+    post = get_object_or_404(Post, slug=slug)
+
+    # Check if user is the author
+    if post.author != request.user:
+        messages.error(request, 'You do not have permission to view the history of this post.')
+        return redirect('blog:post_detail', slug=post.slug)
+
+    revisions = post.revisions.defer('data')
+    return render(request, 'blog/post_revisions.html', {'post': post, 'revisions': revisions})
+
+
+@login_required
+def post_revision_detail_view(request, slug, number):
+    post = get_object_or_404(Post, slug=slug)
+
+    # Check if user is the author
+    if post.author != request.user:
+        messages.error(request, 'You do not have permission to view the history of this post.')
+        return redirect('blog:post_detail', slug=post.slug)
+
+    content = get_revision_content(post, number)
+    if content is None:
+        raise Http404('No such revision.')
+
+    if request.method == 'POST':
+        post.content = content
+        post.save()
+        messages.success(request, f'Post restored to revision {number}.')
+        return redirect('blog:post_detail', slug=post.slug)
+
+    revision = get_object_or_404(post.revisions.defer('data'), number=number)
+    return render(request, 'blog/post_revision_detail.html', {
+        'post': post,
+        'revision': revision,
+        'content_html': render_markdown(content),
+    })
+
+
 @login_required
 def my_posts_view(request):
     posts = Post.objects.filter(author=request.user).order_by('-created_at')
     paginator = Paginator(posts, 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
-    return render(request, 'blog/my_posts.html', {'page_obj': page_obj})
+    stats = AuthorStats.for_user(request.user)
+    return render(request, 'blog/my_posts.html', {'page_obj': page_obj, 'stats': stats})
+
+
+def _chart_days(request):
+    try:
+        return min(max(int(request.GET.get('days', 30)), 1), 365)
+    except ValueError:
+        return 30
+
+
+def _chart_response(queryset, request):
+    series = PostDailyStats.series(queryset, days=_chart_days(request))
+    return JsonResponse({
+        'days': [day.isoformat() for day, _views, _comments in series],
+        'views': [views for _day, views, _comments in series],
+        'comments': [comments for _day, _views, comments in series],
+    })
+
+
+@login_required
+def post_stats_view(request, slug):
+    """Daily views and comments of one post (GET ?days=), for its author"""
+    post = get_object_or_404(Post, slug=slug)
+    if post.author != request.user and not request.user.is_staff:
+        return JsonResponse({'error': 'You do not have permission to view the stats of this post.'}, status=403)
+    return _chart_response(PostDailyStats.objects.filter(post=post), request)
+
+
+@login_required
+def my_posts_stats_view(request):
+    """Daily views and comments over all of the user's posts (GET ?days=)"""
+    return _chart_response(PostDailyStats.objects.filter(post__author=request.user), request)
+
+
+@staff_member_required
+def export_posts_view(request):
+    """Published posts (all with ?drafts=1) as a streamed JSONL download"""
+    queryset = export_queryset(include_drafts=request.GET.get('drafts') == '1')
+    response = StreamingHttpResponse(export_lines(queryset), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="posts.jsonl"'
+    return response
 
 
 def category_detail_view(request, slug):
@@ -265,15 +362,87 @@ def tag_detail_view(request, slug):
     return render(request, 'blog/tag_detail.html', {'tag': tag, 'page_obj': page_obj})
 
 
+def recent_archive_months():
+    return get_or_compute('archive_months', lambda: list(MonthlyPostCount.recent()), namespaces=('post',))
+
+
+def _archive_page(request, start, end):
+    posts = Post.published.filter(created_at__gte=start, created_at__lt=end).select_related(
+        'author', 'category'
+    ).prefetch_related('tags')
+    return KeysetPage(posts, request.GET.get('after'), per_page=6)
+
+
+def archive_year_view(request, year):
+    """Published posts of a year, with the per-month counts from the rollup"""
+    try:
+        start, end = month_range(date(year, 1, 1))[0], month_range(date(year, 12, 1))[1]
+    except (ValueError, OverflowError):
+        # The month after December 9999 does not exist either
+        raise Http404('Invalid year.')
+    months = MonthlyPostCount.objects.filter(month__year=year, count__gt=0).order_by('month')
+    page = _archive_page(request, start, end)
+    return render(request, 'blog/archive.html', {
+        'year': year,
+        'months': months,
+        'page': page,
+        'archive_months': recent_archive_months(),
+    })
+
+
+def archive_month_view(request, year, month):
+    """Published posts of one month, newest first"""
+    try:
+        start = date(year, month, 1)
+        bounds = month_range(start)
+    except (ValueError, OverflowError):
+        raise Http404('Invalid month.')
+    page = _archive_page(request, *bounds)
+    return render(request, 'blog/archive.html', {
+        'year': year,
+        'month': start,
+        'page': page,
+        'archive_months': recent_archive_months(),
+    })
+
+
+@require_http_methods(['GET', 'POST'])
+@ratelimit('tag_create')
+def tag_autocomplete_view(request):
+    """Tag name prefix search (GET ?q=) and on-the-fly tag creation (POST name=)"""
+    if request.method == 'POST':
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Login required.'}, status=403)
+        name = request.POST.get('name', '').strip()
+        slug = slugify(name)
+        if not slug or len(name) > Tag._meta.get_field('name').max_length:
+            return JsonResponse({'error': 'Enter a valid tag name.'}, status=400)
+        tag = Tag.objects.filter(Q(slug=slug) | Q(name__iexact=name)).first()
+        created = False
+        if tag is None:
+            try:
+                with transaction.atomic():
+                    tag = Tag.objects.create(name=name, slug=slug)
+                created = True
+            except IntegrityError:
+                tag = Tag.objects.filter(Q(slug=slug) | Q(name=name)).first()
+        return JsonResponse({'id': tag.pk, 'name': tag.name, 'slug': tag.slug}, status=201 if created else 200)
+
+    results = get_tag_index().search(request.GET.get('q', ''), limit=10)
+    return JsonResponse({'results': results})
+
+
 # Profile Views
 def profile_view(request, username):
     user = get_object_or_404(User, username=username)
     profile, created = UserProfile.objects.get_or_create(user=user)
     posts = Post.published.filter(author=user).order_by('-created_at')[:5]
+    stats = AuthorStats.for_user(user)
     return render(request, 'blog/profile.html', {
         'profile_user': user,
         'profile': profile,
-        'posts': posts
+        'posts': posts,
+        'stats': stats,
     })
 
 
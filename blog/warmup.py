@@ -0,0 +1,107 @@
+"""
+Worker warm-up.
+
+Blog_project/wsgi.py and asgi.py call warm_up() once the application is
+loaded, so a fresh worker pays its one-off costs before it takes traffic
+rather than on its first requests: compiling the URL resolver, loading and
+compiling every template of the blog app into the cached template loader,
+filling the ORM's model metadata caches, checking the database connection
+and building the in-memory post and tag indexes. The entry points close the
+connections afterwards; each worker opens its own on its first request.
+
+``manage.py measure_warmup`` compares first-request latency with and without
+it.
+"""
+
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.db import connections
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.urls import get_resolver
+
+from .post_index import get_post_index
+from .tag_index import get_tag_index
+
+logger = logging.getLogger(__name__)
+
+
+def warm_urls():
+    resolver = get_resolver()
+    # Both are built lazily on the first resolve()/reverse()
+    resolver.reverse_dict
+    resolver.namespace_dict
+    for _prefix, namespace_resolver in resolver.namespace_dict.values():
+        namespace_resolver.reverse_dict
+
+
+def warm_templates():
+    """Compile every template shipped by the blog app"""
+    root = Path(apps.get_app_config('blog').path) / 'templates'
+    names = sorted(
+        path.relative_to(root).as_posix()
+        for path in root.rglob('*')
+        if path.is_file() and path.suffix in ('.html', '.txt')
+    )
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        for name in names:
+            engine.get_template(name)
+
+
+def warm_models():
+    """Fill the model metadata caches and the SQL compiler imports"""
+    models = apps.get_models()
+    for model in models:
+        model._meta.get_fields()
+        model._meta.related_objects
+        str(model._default_manager.all().query)
+
+
+def warm_database():
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def warm_indexes():
+    get_post_index()
+    get_tag_index()
+
+
+STEPS = [
+    ('urls', warm_urls),
+    ('templates', warm_templates),
+    ('models', warm_models),
+    ('database', warm_database),
+    ('indexes', warm_indexes),
+]
+
+
+def warm_up(keep_connections=True):
+    """Run every warm-up step; returns ``{step: seconds}``
+
+    Steps that fail are logged and skipped, so a database that is still
+    coming up delays nothing. Pass ``keep_connections=False`` when requests
+    will be served from other threads than this one (ASGI), as the
+    connections opened here are per thread, or from other processes forked
+    after it (``gunicorn --preload``), which would share their sockets.
+    """
+    timings = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception('Warm-up step %s failed', name)
+            continue
+        timings[name] = time.perf_counter() - started
+    if not keep_connections:
+        connections.close_all()
+    logger.info('Worker warmed up in %.3fs (%s)', sum(timings.values()), ', '.join(
+        f'{name} {seconds * 1000:.0f}ms' for name, seconds in timings.items()
+    ))
+    return timings